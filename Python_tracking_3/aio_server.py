@@ -0,0 +1,454 @@
+# aio_server.py - Mode asyncio: lecture des sources, écriture DB et Socket.IO sur une seule boucle
+#
+#   python aio_server.py            (au lieu de python app.py; mêmes variables BALLOON_*)
+#
+# Même chaîne que le mode threading (app.py), dont on réutilise la config, les
+# vols / récepteurs, process_frame et toutes les routes Flask; seule l'orchestration change:
+#   - lecture: pyserial-asyncio pour un port série s'il est installé, sinon
+#     loop.add_reader sur le descripteur (TCP, UDP, pty), sinon readline()
+#     bloquant dans le pool de threads (rejeu, série sans pyserial-asyncio);
+#   - écriture: AsyncDBWriter (db_writer.py), COMMIT dans un thread dédié;
+#   - Socket.IO: socketio.AsyncServer (ASGI, uvicorn). Les routes Flask sont
+#     servies par le même serveur (asgiref WsgiToAsgi, dans un thread).
+# Diffusion: au lieu d'un envoi par client avec acquittement (broadcaster.py),
+# une trame par vol et par protocole est émise à une salle Socket.IO: le paquet
+# est encodé une fois quel que soit le nombre de clients, c'est ce qui permet
+# des milliers de tableaux de bord sur un cœur. Le débit reste limité à
+# CLIENT_MAX_RATE_HZ (trames intermédiaires fusionnées); un client trop lent
+# est déconnecté par engine.io (ping timeout) au lieu d'être attendu.
+
+import asyncio
+import contextlib
+import logging
+import time
+
+import socketio
+import uvicorn
+from asgiref.wsgi import WsgiToAsgi
+
+import app as balloon
+import logs
+from chase import parse_position
+from db_writer import AsyncDBWriter
+from metrics import STAGE_SECONDS, PROCESS_ERRORS
+from sources import SerialSource, SourceError, make_source
+from telemetry import RECORD_FIELDS
+from wire import encode_frame, layout as wire_layout
+
+try:
+    import serial_asyncio # pyserial-asyncio (optionnel)
+except ImportError:
+    serial_asyncio = None
+
+SERVER_HOST = '0.0.0.0'
+log = logging.getLogger('balloon')
+log_serial = logging.getLogger('balloon.serial')
+log_parser = logging.getLogger('balloon.parser')
+log_socket = logging.getLogger('balloon.socket')
+PROTOCOLS = balloon.PROTOCOLS
+
+
+class _RoomFrame:
+    """Dernière trame d'un vol et ce qui a été émis à ses salles."""
+    __slots__ = ('seq', 'values', 'sent_seq', 'sent_at', 'sent_values', 'since_key', 'key_at', 'force_key')
+
+    def __init__(self):
+        self.seq = 0
+        self.values = None
+        self.sent_seq = 0
+        self.sent_at = 0.0
+        self.sent_values = None # base des deltas de la salle delta
+        self.since_key = 0
+        self.key_at = 0.0
+        self.force_key = False
+
+
+class AsyncBroadcaster:
+    """Diffusion par salle (un encodage par vol et par protocole, pas par client).
+
+    Même interface côté ingestion que broadcaster.Broadcaster (publish, set_status,
+    publish_event, current_status): process_frame l'utilise sans changement.
+    """
+
+    def __init__(self, sio, event='update_data', max_rate_hz=4.0, keyframe_every=50, keyframe_interval_s=30.0):
+        self.sio = sio
+        self.event = event
+        self.min_interval = 1.0 / max_rate_hz if max_rate_hz > 0 else 0.0
+        self.keyframe_every = keyframe_every
+        self.keyframe_interval_s = keyframe_interval_s
+        self._frames = {}          # vol -> _RoomFrame
+        self._status = {}
+        self._pending_status = {}
+        self._pending_events = {}
+        self._clients = {}         # sid -> (vol, protocole)
+        self._wake = asyncio.Event()
+        self._task = None
+        self._stats = {'published': 0, 'frames_sent': 0, 'frames_dropped': 0, 'status_sent': 0,
+                       'events_sent': 0, 'bytes_delta': 0, 'keyframes': 0}
+
+    @staticmethod
+    def frame_room(flight_room, protocol):
+        return f"{flight_room}/{protocol}"
+
+    def _has_members(self, room):
+        return next(iter(self.sio.manager.get_participants('/', room)), None) is not None
+
+    # --- Côté ingestion (dans la boucle, non bloquant) ---
+    def publish(self, record, flight=None):
+        frame = self._frames.get(flight)
+        if frame is None: frame = self._frames[flight] = _RoomFrame()
+        frame.seq += 1
+        frame.values = tuple(record)
+        self._stats['published'] += 1
+        self._wake.set()
+
+    def set_status(self, status, key=None, room=None):
+        if status == self._status.get(key): return
+        self._status[key] = status
+        self._pending_status[key] = (room, status)
+        self._wake.set()
+
+    def publish_event(self, event, payload, room=None):
+        self._pending_events[event, room] = payload
+        self._wake.set()
+
+    def current_status(self, key=None):
+        return self._status.get(key)
+
+    # --- Clients ---
+    async def keyframe_for(self, sid, flight):
+        """Trame clé individuelle, cohérente avec les deltas que la salle recevra ensuite."""
+        frame = self._frames.get(flight)
+        if frame is None: return
+        if frame.sent_values is None: frame.force_key = True; self._wake.set(); return
+        await self.sio.emit('update_bin', encode_frame(frame.sent_values, None, frame.sent_seq), to=sid)
+
+    async def join_frames(self, sid, flight_room, flight, protocol):
+        """Entre dans la salle des trames du vol; en delta, la trame clé individuelle part AVANT.
+
+        Sinon un delta diffusé entre l'entrée et la trame clé arriverait sur un
+        état vide ou celui d'un autre vol. Si un delta part pendant l'envoi de
+        la trame clé, on renvoie une trame clé à jour; l'entrée dans la salle
+        ne rend pas la main à la boucle, aucun delta ne peut donc s'intercaler.
+        Un delta déjà encodé mais émis après l'entrée est sans effet: il ne
+        porte que des valeurs déjà présentes dans la trame clé.
+        """
+        frame = self._frames.get(flight) if protocol == 'delta' else None
+        while frame is not None and frame.sent_values is not None:
+            seq = frame.sent_seq
+            await self.sio.emit('update_bin', encode_frame(frame.sent_values, None, seq), to=sid)
+            if frame.sent_seq == seq: break
+        if frame is not None and frame.sent_values is None: # Rien d'envoyé: trame clé à toute la salle
+            frame.force_key = True
+            self._wake.set()
+        await self.sio.enter_room(sid, self.frame_room(flight_room, protocol))
+
+    def add_client(self, sid, protocol, flight):
+        self._clients[sid] = (flight, protocol)
+
+    def remove_client(self, sid):
+        self._clients.pop(sid, None)
+
+    def client_count(self):
+        return len(self._clients)
+
+    def stats(self):
+        current = dict(self._stats)
+        current['clients'] = len(self._clients)
+        current['lagging_clients'] = 0 # Pas d'acquittement par client dans ce mode
+        return current
+
+    # --- Cycle de vie ---
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task: self._task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_wake = None
+        while True:
+            timeout = 0.5 if next_wake is None else max(0.0, next_wake - loop.time())
+            try: await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError: pass
+            self._wake.clear()
+            next_wake = None
+            now = loop.time()
+            statuses, self._pending_status = self._pending_status, {}
+            events, self._pending_events = self._pending_events, {}
+            sends, delivered = [], []
+            for flight_id, frame in self._frames.items():
+                if frame.sent_seq >= frame.seq and not frame.force_key: continue
+                due = frame.sent_at + self.min_interval
+                if now < due:
+                    next_wake = due if next_wake is None else min(next_wake, due)
+                    continue
+                skipped = frame.seq - frame.sent_seq - 1
+                if skipped > 0: self._stats['frames_dropped'] += skipped
+                room = balloon.flights[flight_id].room
+                values = frame.values
+                sends.append((self.frame_room(room, 'json'), self.event, dict(zip(RECORD_FIELDS, values))))
+                delta_room = self.frame_room(room, 'delta')
+                if self._has_members(delta_room): # Pas d'encodage pour une salle vide
+                    keyframe = (frame.sent_values is None or frame.force_key
+                                or frame.since_key >= self.keyframe_every
+                                or now - frame.key_at >= self.keyframe_interval_s)
+                    try: data = encode_frame(values, None if keyframe else frame.sent_values, frame.seq)
+                    except Exception: # Une trame inencodable ne doit pas arrêter la diffusion
+                        log_socket.exception("Trame %d du vol %s non encodée", frame.seq, flight_id)
+                        frame.force_key = True # Base des deltas incertaine: trame clé à la suivante
+                    else:
+                        if keyframe:
+                            frame.since_key, frame.key_at, frame.force_key = 0, now, False
+                            self._stats['keyframes'] += 1
+                        else: frame.since_key += 1
+                        sends.append((delta_room, 'update_bin', data))
+                        self._stats['bytes_delta'] += len(data)
+                # Base des deltas à jour même sans encodage: join_frames en tire la trame clé d'un arrivant
+                frame.sent_seq, frame.sent_at, frame.sent_values = frame.seq, now, values
+                if values[0]: delivered.append(values[0])
+            self._stats['frames_sent'] += len(sends)
+            self._stats['status_sent'] += len(statuses)
+            self._stats['events_sent'] += len(events)
+            try:
+                for room, status in statuses.values():
+                    await self.sio.emit('serial_status', status, to=room)
+                for (event, room), payload in events.items():
+                    await self.sio.emit(event, payload, to=room)
+                for room, event, payload in sends:
+                    await self.sio.emit(event, payload, to=room)
+            except Exception as e:
+                log_socket.warning("Erreur émission asyncio: %s", e)
+                continue
+            sent_at = time.time() # Une mesure par trame de vol (émise une fois à la salle)
+            for received_at in delivered: STAGE_SECONDS.observe(max(0.0, sent_at - received_at), ('delivery',))
+
+
+# --- Serveur Socket.IO asyncio ---
+sio = socketio.AsyncServer(async_mode='asgi')
+broadcaster = AsyncBroadcaster(sio, max_rate_hz=balloon.CLIENT_MAX_RATE_HZ,
+                               keyframe_every=balloon.KEYFRAME_EVERY,
+                               keyframe_interval_s=balloon.KEYFRAME_INTERVAL_S)
+balloon.broadcaster = broadcaster # process_frame, /api/flights et flight_state_events l'utilisent
+asgi_app = socketio.ASGIApp(sio, other_asgi_app=WsgiToAsgi(balloon.app))
+stop_event = None # asyncio.Event créé dans la boucle
+readers = []       # Tâches de lecture (une par source)
+
+
+async def _enter_flight(sid, flight, protocol):
+    """Salles du vol (statuts puis trames); en delta le layout doit déjà avoir été envoyé."""
+    for room in sio.rooms(sid):
+        if room.startswith('flight:'): await sio.leave_room(sid, room)
+    await sio.enter_room(sid, flight.room) # statuts, prédictions
+    await broadcaster.join_frames(sid, flight.room, flight.flight_id, protocol) # trame clé puis deltas
+
+
+async def _send_flight_state(sid, flight, since):
+    # Reprise depuis la base possible (since): requête SQLite hors de la boucle
+    events, count = await asyncio.to_thread(balloon.flight_state_events, flight, since)
+    for event, payload in events: await sio.emit(event, payload, to=sid)
+    return count
+
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    auth = auth if isinstance(auth, dict) else {}
+    protocol = auth.get('proto', 'json')
+    if protocol not in PROTOCOLS: protocol = 'json'
+    flight = balloon.flights.get(auth.get('flight')) or balloon.flights[balloon.DEFAULT_FLIGHT]
+    await sio.save_session(sid, {'flight': flight.flight_id, 'protocol': protocol})
+    if protocol == 'delta': await sio.emit('protocol', {'mode': 'delta', 'layout': wire_layout()}, to=sid)
+    await _enter_flight(sid, flight, protocol)
+    count = await _send_flight_state(sid, flight, auth.get('since'))
+    broadcaster.add_client(sid, protocol, flight.flight_id)
+    log_socket.info("Client connecté: %s (%d points, vol %s)", sid, count, flight.flight_id)
+
+
+@sio.event
+async def subscribe(sid, data):
+    data = data or {}
+    flight = balloon.flights.get(data.get('flight'))
+    if flight is None: return {'ok': False, 'error': f"Vol inconnu: {data.get('flight')}"}
+    async with sio.session(sid) as session:
+        session['flight'] = flight.flight_id
+        protocol = session['protocol']
+    await _enter_flight(sid, flight, protocol)
+    await _send_flight_state(sid, flight, data.get('since'))
+    broadcaster.add_client(sid, protocol, flight.flight_id)
+    balloon.chasers.set_flight(sid, flight.flight_id)
+    return {'ok': True, 'flight': flight.flight_id}
+
+
+@sio.event
+async def set_protocol(sid, data):
+    mode = (data or {}).get('mode', 'json')
+    if mode not in PROTOCOLS: return {'ok': False, 'error': f"Protocole inconnu: {mode}"}
+    async with sio.session(sid) as session:
+        session['protocol'] = mode
+        flight = balloon.flights[session['flight']]
+    if mode == 'delta': await sio.emit('protocol', {'mode': 'delta', 'layout': wire_layout()}, to=sid)
+    await _enter_flight(sid, flight, mode)
+    broadcaster.add_client(sid, mode, flight.flight_id)
+    return {'ok': True, 'mode': mode}
+
+
+@sio.event
+async def resync(sid):
+    session = await sio.get_session(sid)
+    await broadcaster.keyframe_for(sid, session['flight'])
+
+
+@sio.event
+async def register_chaser(sid, data):
+    try: position = parse_position(data)
+    except ValueError as e: return {'ok': False, 'error': str(e)}
+    session = await sio.get_session(sid)
+    flight = balloon.flights[session['flight']]
+    balloon.chasers.register(sid, flight.flight_id, *position)
+    for _sid, payload in balloon.chase_snapshot(sid, flight): await sio.emit('chase_update', payload, to=sid)
+    return {'ok': True, 'flight': flight.flight_id}
+
+
+@sio.event
+async def unregister_chaser(sid, *_args):
+    return {'ok': balloon.chasers.unregister(sid)}
+
+
+@sio.event
+async def disconnect(sid, *_reason):
+    broadcaster.remove_client(sid)
+    balloon.chasers.unregister(sid)
+    log_socket.info("Client déconnecté: %s", sid)
+
+
+# --- Lecture asynchrone des sources ---
+async def _lines_serial_asyncio(source):
+    reader, writer = await serial_asyncio.open_serial_connection(url=source.port, baudrate=source.baud)
+    try:
+        while True:
+            try: yield await asyncio.wait_for(reader.readline(), balloon.SOURCE_READ_TIMEOUT_S)
+            except asyncio.TimeoutError: yield b''
+    finally:
+        writer.close()
+
+
+async def _lines_fd(source):
+    loop = asyncio.get_running_loop()
+    readable = asyncio.Event()
+    fd = source.fileno()
+    loop.add_reader(fd, readable.set)
+    try:
+        while True:
+            try: await asyncio.wait_for(readable.wait(), balloon.SOURCE_READ_TIMEOUT_S)
+            except asyncio.TimeoutError: yield b''; continue
+            readable.clear()
+            for line in source.read_ready(): yield line
+    finally:
+        loop.remove_reader(fd)
+
+
+async def _lines_blocking(source):
+    while True: # readline() bloque au plus SOURCE_READ_TIMEOUT_S, dans le pool de threads
+        yield await asyncio.to_thread(source.readline)
+
+
+def _line_reader(source):
+    if isinstance(source, SerialSource) and serial_asyncio is not None: return _lines_serial_asyncio(source)
+    if source.fileno() is not None: return _lines_fd(source)
+    return _lines_blocking(source)
+
+
+async def reader_task(pipeline):
+    """Équivalent asyncio de app.serial_reader_task (une tâche par source)."""
+    flight, tag = pipeline.flight, f"[{pipeline.receiver_id}]"
+    writer = balloon.db_writer
+
+    def publish_error(message):
+        with flight.lock: flight.latest.error = message
+        broadcaster.publish(flight.latest, flight.flight_id)
+
+    def handle(frame):
+        try: balloon.process_frame(pipeline, frame)
+        except Exception as e_proc:
+            log_parser.exception("%s Erreur traitement trame: %s pour [%s]", tag, e_proc, frame.data)
+            PROCESS_ERRORS.inc(('process',))
+            publish_error(f"Erreur proc: {e_proc}")
+
+    while not stop_event.is_set():
+        source = pipeline.source = pipeline.source or make_source(
+            pipeline.url, default_baud=balloon.BAUD_RATE, timeout=balloon.SOURCE_READ_TIMEOUT_S)
+        try:
+            native_serial = isinstance(source, SerialSource) and serial_asyncio is not None
+            if not native_serial: await asyncio.to_thread(source.open)
+            log_serial.info("%s Connecté (asyncio) à %s", tag, source.describe())
+            with flight.lock: flight.latest.error = None
+            broadcaster.set_status(pipeline.status('connected'), pipeline.receiver_id, flight.room)
+            async with contextlib.aclosing(_line_reader(source)) as lines:
+                async for line in lines:
+                    if stop_event.is_set(): break
+                    if not line:
+                        frames = pipeline.framer.poll()
+                    else:
+                        line_started = time.perf_counter()
+                        pipeline.lines += 1
+                        received_at = balloon.journal_line(pipeline, line)
+                        raw_line = line.decode('utf-8', errors='ignore').strip()
+                        if raw_line: log_serial.debug("%s Ligne [%s]", tag, raw_line)
+                        frames = pipeline.framer.feed(raw_line, received_at=received_at)
+                        STAGE_SECONDS.observe(time.perf_counter() - line_started, ('read',))
+                    for frame in frames:
+                        await writer.drain() # Contre-pression: file DB pleine = on attend
+                        handle(frame)
+        except (SourceError, OSError) as e:
+            log_serial.error("%s ERREUR: %s", tag, e)
+            PROCESS_ERRORS.inc(('source',))
+            broadcaster.set_status(pipeline.status('error', str(e)), pipeline.receiver_id, flight.room)
+            publish_error(str(e))
+        finally:
+            for frame in pipeline.framer.flush(): handle(frame) # Une erreur ici ne doit pas sauter close()
+            source.close()
+        if not stop_event.is_set():
+            try: await asyncio.wait_for(stop_event.wait(), 5)
+            except asyncio.TimeoutError: pass
+    log_serial.info("%s Tâche de lecture terminée.", tag)
+
+
+async def main():
+    global stop_event, readers
+    stop_event = asyncio.Event()
+    logs.configure()
+    balloon.ensure_data_dir()
+    balloon.start_journal()
+    balloon.init_db()
+    balloon.load_flights()
+    balloon.start_db_writer(AsyncDBWriter)
+    balloon.start_archiver()
+    broadcaster.start()
+    readers = [asyncio.create_task(reader_task(p), name=f"reader-{p.receiver_id}") for p in balloon.pipelines]
+    log.info("Serveur asyncio prêt sur http://%s:%d (%d source(s), pyserial-asyncio: %s)",
+             SERVER_HOST, balloon.SERVER_PORT, len(readers), 'oui' if serial_asyncio else 'non')
+    config = uvicorn.Config(asgi_app, host=SERVER_HOST, port=balloon.SERVER_PORT,
+                            log_level='info' if balloon.DEBUG_MODE else 'warning')
+    await uvicorn.Server(config).serve()
+
+
+async def shutdown():
+    log.info("Arrêt des tâches de lecture...")
+    stop_event.set()
+    balloon.stop_thread.set() # Thread d'archivage
+    await asyncio.wait(readers, timeout=balloon.SOURCE_READ_TIMEOUT_S + 2)
+    await broadcaster.stop()
+    await balloon.db_writer.stop()
+    if balloon.binlog_writer: balloon.binlog_writer.close()
+    if balloon.journal: balloon.journal.close()
+    log.info("Serveur arrêté.")
+
+
+if __name__ == '__main__':
+    # uvicorn relance le SIGINT reçu une fois arrêté, ce qui annule main(): l'arrêt
+    # (lecteurs, écrivain DB, journal) tourne donc à part, sur la même boucle
+    with asyncio.Runner() as runner:
+        try: runner.run(main())
+        except (KeyboardInterrupt, asyncio.CancelledError): pass
+        finally: runner.run(shutdown())
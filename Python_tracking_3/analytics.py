@@ -0,0 +1,207 @@
+# analytics.py - Analyse vectorisée d'un vol (NumPy) depuis la table telemetry
+#
+# Charge le vol en tableaux colonne par colonne puis calcule, sans boucle Python
+# par ligne:
+#   - vitesse sol (haversine entre fixes GPS consécutifs, mêmes règles que le
+#     calcul en direct de pipeline.SpeedTracker);
+#   - vitesse verticale (m/s) depuis altitude_gps et altitude_bme, par différence
+#     centrée sur une fenêtre glissante (lisse le bruit du baromètre);
+#   - éclatement (burst) et atterrissage;
+#   - phase de vol de chaque point.
+# Les colonnes dérivées sont stockées dans telemetry_derived (clé = telemetry.id)
+# et les événements dans flight_events; un recalcul complet prend quelques ms.
+
+import numpy as np
+
+from queries import fetch_columns
+
+EARTH_RADIUS_M = 6371000
+SPEED_MIN_DT_S = 0.5          # Comme le calcul en direct: en dessous, on garde la vitesse précédente
+VRATE_WINDOW_S = 10.0         # Largeur de la fenêtre de dérivation de l'altitude
+BURST_MIN_GAIN_M = 500.0      # Montée minimale depuis le départ pour parler d'éclatement...
+BURST_MIN_DROP_M = 200.0      # ...et descente minimale après le maximum
+LANDING_MAX_RATE_MPS = 1.0    # |vitesse verticale| sous ce seuil = immobile
+LANDING_HOLD_S = 60.0         # ...pendant au moins cette durée après l'éclatement
+
+_LOAD_COLUMNS = ('id', 'latitude', 'longitude', 'altitude_gps', 'altitude_bme')
+
+CREATE_DERIVED_SQL = """
+CREATE TABLE IF NOT EXISTS telemetry_derived (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    ground_speed_kmh REAL,
+    vrate_gps REAL,
+    vrate_bme REAL,
+    phase TEXT
+)"""
+CREATE_EVENTS_SQL = """
+CREATE TABLE IF NOT EXISTS flight_events (
+    flight_id TEXT NOT NULL DEFAULT '',
+    event TEXT NOT NULL,
+    telemetry_id INTEGER,
+    timestamp REAL NOT NULL,
+    latitude REAL,
+    longitude REAL,
+    altitude REAL,
+    PRIMARY KEY (flight_id, event)
+)"""
+
+
+def init_analytics(conn):
+    conn.execute(CREATE_DERIVED_SQL)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(flight_events)")}
+    if columns and 'flight_id' not in columns:
+        conn.execute("DROP TABLE flight_events") # Ancien format (un seul vol), recalculable
+    conn.execute(CREATE_EVENTS_SQL)
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distance (m) élément par élément entre tableaux de coordonnées en degrés."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi, dlambda = phi2 - phi1, np.radians(lon2 - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _forward_fill(values):
+    """Remplace chaque NaN par la dernière valeur non NaN qui le précède."""
+    valid = ~np.isnan(values)
+    if not valid.any(): return values
+    idx = np.maximum.accumulate(np.where(valid, np.arange(len(values)), 0))
+    filled = values[idx]
+    filled[:np.argmax(valid)] = np.nan
+    return filled
+
+
+def ground_speed_kmh(ts, lat, lon, min_dt=SPEED_MIN_DT_S):
+    """Vitesse sol (km/h) de chaque point ayant un fix; NaN ailleurs. 0 au premier fix."""
+    speed = np.full(len(ts), np.nan)
+    fix = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+    if len(fix) == 0: return speed
+    t, la, lo = ts[fix], lat[fix], lon[fix]
+    dt = np.diff(t)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = np.where(dt >= min_dt, haversine_m(la[:-1], lo[:-1], la[1:], lo[1:]) / dt * 3.6, np.nan)
+    speed[fix] = _forward_fill(np.concatenate(([0.0], np.round(step, 2))))
+    return speed
+
+
+def vertical_rate(ts, alt, window_s=VRATE_WINDOW_S):
+    """Vitesse verticale (m/s) par différence centrée sur `window_s` (interpolation linéaire)."""
+    rate = np.full(len(ts), np.nan)
+    valid = np.flatnonzero(~np.isnan(alt))
+    if len(valid) < 2: return rate
+    t, a = ts[valid], alt[valid]
+    keep = np.concatenate(([True], np.diff(t) > 0)) # np.interp exige des temps croissants
+    t, a, valid = t[keep], a[keep], valid[keep]
+    if len(t) < 2: return rate
+    lo = np.maximum(t - window_s / 2, t[0])
+    hi = np.minimum(t + window_s / 2, t[-1])
+    span = hi - lo
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate[valid] = np.where(span > 0, (np.interp(hi, t, a) - np.interp(lo, t, a)) / span, np.nan)
+    return rate
+
+
+def _best_altitude(alt_gps, alt_bme, rate_gps, rate_bme):
+    """Altitude de référence: le GPS s'il est disponible sur la majorité des points, sinon le baromètre."""
+    n_gps, n_bme = np.count_nonzero(~np.isnan(alt_gps)), np.count_nonzero(~np.isnan(alt_bme))
+    if n_gps and n_gps * 2 >= n_bme: return 'altitude_gps', alt_gps, rate_gps
+    return 'altitude_bme', alt_bme, rate_bme
+
+
+def detect_events(ts, alt, rate):
+    """Indices (burst, landing) dans les tableaux, ou None s'ils ne sont pas détectés."""
+    valid = ~np.isnan(alt)
+    if not valid.any(): return None, None
+    burst = int(np.nanargmax(alt))
+    start_alt = alt[np.argmax(valid)]
+    after = alt[burst:]
+    if alt[burst] - start_alt < BURST_MIN_GAIN_M or alt[burst] - np.nanmin(after) < BURST_MIN_DROP_M:
+        return None, None
+    # Atterrissage: première plage immobile d'au moins LANDING_HOLD_S après l'éclatement
+    # (seuls les points où la vitesse est connue comptent: un fix manquant ne coupe pas la plage)
+    known = burst + np.flatnonzero(~np.isnan(rate[burst:]))
+    still = (np.abs(rate[known]) < LANDING_MAX_RATE_MPS).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], still, [0])))
+    starts, ends = known[edges[:-1] == 1], known[np.flatnonzero(edges == -1) - 1]
+    held = np.flatnonzero(ts[ends] - ts[starts] >= LANDING_HOLD_S)
+    landing = int(starts[held[0]]) if len(held) else None
+    return burst, landing
+
+
+def analyze(conn, start=None, end=None, flight=None):
+    """Analyse complète de la fenêtre (d'un vol). Retourne un dict de tableaux + événements."""
+    ts, cols = fetch_columns(conn, _LOAD_COLUMNS, start, end, flight)
+    lat, lon = cols['latitude'], cols['longitude']
+    rate_gps = vertical_rate(ts, cols['altitude_gps'])
+    rate_bme = vertical_rate(ts, cols['altitude_bme'])
+    alt_source, alt, rate = _best_altitude(cols['altitude_gps'], cols['altitude_bme'], rate_gps, rate_bme)
+    burst, landing = detect_events(ts, alt, rate)
+
+    phase = np.full(len(ts), None, dtype=object)
+    if burst is not None:
+        phase[:burst + 1] = 'ascent'
+        phase[burst + 1:landing if landing is not None else len(ts)] = 'descent'
+        if landing is not None: phase[landing:] = 'landed'
+
+    events = {}
+    for name, idx in (('burst', burst), ('landing', landing)):
+        if idx is None: continue
+        events[name] = {'telemetry_id': int(cols['id'][idx]), 'timestamp': float(ts[idx]),
+                        'latitude': _scalar(lat[idx]), 'longitude': _scalar(lon[idx]),
+                        'altitude': _scalar(alt[idx])}
+    return {'id': cols['id'].astype(np.int64), 'timestamp': ts,
+            'ground_speed_kmh': ground_speed_kmh(ts, lat, lon),
+            'vrate_gps': rate_gps, 'vrate_bme': rate_bme, 'phase': phase,
+            'altitude_source': alt_source, 'altitude': alt, 'events': events, 'flight_id': flight}
+
+
+def _scalar(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _nullable(values):
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def summarize(result):
+    """Résumé JSON d'une analyse (sans les tableaux)."""
+    def stat(fn, values):
+        return None if np.isnan(values).all() else round(float(fn(values)), 2)
+    rate = result['vrate_gps'] if result['altitude_source'] == 'altitude_gps' else result['vrate_bme']
+    burst = result['events'].get('burst')
+    ascent = rate[:np.searchsorted(result['timestamp'], burst['timestamp']) + 1] if burst else rate
+    return {'points': len(result['timestamp']),
+            'altitude_source': result['altitude_source'],
+            'max_altitude': stat(np.nanmax, result['altitude']),
+            'max_ground_speed_kmh': stat(np.nanmax, result['ground_speed_kmh']),
+            'max_ascent_rate': stat(np.nanmax, rate),
+            'mean_ascent_rate': stat(np.nanmean, ascent[ascent > 0]) if np.any(ascent > 0) else None,
+            'max_descent_rate': stat(np.nanmin, rate),
+            'events': result['events']}
+
+
+def store_derived(conn, result):
+    """Remplace les colonnes dérivées et les événements de la fenêtre analysée."""
+    ids = result['id']
+    if len(ids):
+        window = (float(result['timestamp'][0]), float(result['timestamp'][-1]))
+        if result['flight_id'] is None:
+            conn.execute("DELETE FROM telemetry_derived WHERE timestamp BETWEEN ? AND ?", window)
+        else: # Seulement les points de ce vol (les vols simultanés partagent la fenêtre)
+            conn.execute("DELETE FROM telemetry_derived WHERE timestamp BETWEEN ? AND ? "
+                         "AND id IN (SELECT id FROM telemetry WHERE flight_id = ?)", window + (result['flight_id'],))
+        conn.execute("DELETE FROM flight_events WHERE flight_id = ? AND timestamp BETWEEN ? AND ?",
+                     (result['flight_id'] or '',) + window)
+    rows = zip(ids.tolist(), result['timestamp'].tolist(), _nullable(result['ground_speed_kmh']),
+               _nullable(result['vrate_gps']), _nullable(result['vrate_bme']), result['phase'].tolist())
+    conn.executemany("INSERT OR REPLACE INTO telemetry_derived "
+                     "(id, timestamp, ground_speed_kmh, vrate_gps, vrate_bme, phase) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    conn.executemany("INSERT OR REPLACE INTO flight_events "
+                     "(flight_id, event, telemetry_id, timestamp, latitude, longitude, altitude) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     [(result['flight_id'] or '', name, e['telemetry_id'], e['timestamp'], e['latitude'], e['longitude'], e['altitude'])
+                      for name, e in result['events'].items()])
+    return len(ids)
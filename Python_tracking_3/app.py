@@ -1,168 +1,178 @@
 # app.py (Version avec SQLite3)
 
-import serial
 import threading
 import time
 import json
-import csv
+import logging
 import os
 import sqlite3 # <<< Ajouté
-from datetime import datetime
-from flask import Flask, render_template, send_file, request, jsonify
-from flask_socketio import SocketIO, emit
-import pandas as pd
-import io
-import math
+from flask import Flask, render_template, send_file, request, jsonify, Response, stream_with_context
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
+from db_writer import DBWriter
+from sources import make_source, SourceError
+from decoder import decode
+from telemetry import COLUMNS, CREATE_TABLE_SQL, INSERT_SQL, upgrade_table
+from export import MIMETYPES, iter_rows, csv_chunks, ndjson_chunks, write_xlsx, write_parquet
+from queries import QueryError, parse_columns, parse_float, parse_bbox, decode_cursor, fetch_page, fetch_series
+from rollups import ROLLUP_COLUMNS, init_rollups, apply_batch as rollup_batch, fetch_summary
+from broadcaster import Broadcaster, PROTOCOLS
+from wire import layout as wire_layout
+from analytics import init_analytics, analyze, summarize, store_derived
+from pipeline import FlightState, SourcePipeline, parse_source_specs
+from dedup import INSERT_RECEPTION_SQL, init_dedup, receiver_coverage
+from journal import JournalWriter
+from track import TrackCache, tile_bbox
+from spatial import init_spatial, fixes_in_bbox, fixes_in_radius, nearest_fixes
+from chase import ChaseService, parse_position
+import archive
+import binlog
+import queries
+import logs
+import metrics
+from metrics import STAGE_SECONDS, PACKET_RATE, PROCESS_ERRORS
 
 
 # --- Configuration ---
 SERIAL_PORT = 'COM5' # Adaptez si nécessaire
 BAUD_RATE = 115200   # Doit correspondre au Serial.begin() du RECEIVER ESP32
-DATA_FORMAT = 'xlsx' # Format pour le téléchargement ('excel' ou 'csv')
+# Source des lignes: série par défaut, ou tcp://hote:port, tcp-listen://0.0.0.0:port,
+# udp://0.0.0.0:port, replay://chemin/serial_log.txt?speed=10, pty:// (voir sources.py)
+SOURCE_URL = os.environ.get('BALLOON_SOURCE', f'serial://{SERIAL_PORT}?baud={BAUD_RATE}')
+# Plusieurs ballons / récepteurs: BALLOON_SOURCES="vol@recepteur=url;..." (voir pipeline.py),
+# un thread de lecture par source. Sans cette variable: SOURCE_URL seule.
+SOURCES = parse_source_specs(os.environ.get('BALLOON_SOURCES'), SOURCE_URL)
+SOURCE_READ_TIMEOUT_S = 1.0 # readline() bloque au plus ce délai (réactivité à l'arrêt)
+DATA_PREFIXES = ("Donnees brutes: ", "Données brutes: ") # Firmwares récents / anciens
+FRAME_TIMEOUT_S = 0.5       # Trame d'un paquet fermée si ni fin ni paquet suivant dans ce délai
+DATA_FORMAT = 'xlsx' # Format par défaut du téléchargement ('xlsx', 'csv', 'ndjson' ou 'parquet')
+EXPORT_CHUNK_ROWS = 1000 # Lignes lues par fetchmany() pendant l'export
+API_PAGE_ROWS = 1000     # Taille de page par défaut de /api/telemetry (mode brut)
+API_MAX_PAGE_ROWS = 10000
+API_MAX_POINTS = 5000    # Points max par série en mode réduit
+SUMMARY_DEFAULT_POINTS = 2000 # Budget de lignes par défaut de /api/telemetry/summary
+TRACK_MAX_POINTS = 5000       # Sommets max du tracé simplifié de /api/track
+TRACK_CACHE_FLIGHTS = 16      # Tracés de vols gardés en mémoire (les plus récemment demandés)
+SPATIAL_MAX_FIXES = 5000      # Fixes max renvoyés par /api/spatial/* (emprise: régulièrement espacés au-delà)
+SPATIAL_MAX_NEAREST = 100     # k max de /api/spatial/nearest
 DATA_DIR = 'data'
-DB_FILENAME = os.path.join(DATA_DIR, 'balloon_data.db') # <<< Fichier Base de Données
+DEFAULT_DB_FILENAME = os.path.join(DATA_DIR, 'balloon_data.db')
+DB_FILENAME = os.environ.get('BALLOON_DB', DEFAULT_DB_FILENAME) # <<< Fichier Base de Données
+SERVER_PORT = int(os.environ.get('BALLOON_PORT', 5000))
 DOWNLOAD_FILENAME_BASE = 'balloon_data' # Sera .xlsx ou .csv
 DEBUG_MODE = False # Mettre à True pour plus de logs Flask/SocketIO
+# Écrivain DB: une seule connexion, commits groupés (perte max sur crash = une fenêtre de flush)
+DB_QUEUE_MAXSIZE = 10000     # Lignes en attente max avant contre-pression
+DB_FLUSH_MAX_ROWS = 200      # Commit dès que ce nombre de lignes est en attente...
+DB_FLUSH_INTERVAL_S = 1.0    # ...ou au plus tard après ce délai (secondes)
+CLIENT_MAX_RATE_HZ = 4.0     # Trames update_data max par seconde et par client (fusion au-delà)
+CLIENT_ACK_TIMEOUT_S = 5.0   # Client considéré en retard s'il n'acquitte pas dans ce délai
+KEYFRAME_EVERY = 50          # Protocole compact: trame complète toutes les N trames...
+KEYFRAME_INTERVAL_S = 30.0   # ...ou au moins toutes les N secondes
+HISTORY_SIZE = 100           # Points de l'historique initial (tampon mémoire partagé)
+HISTORY_RESUME_MAX = 2000    # Points max renvoyés à un client qui reprend (since=...)
+DEDUP_WINDOW_S = 2.0         # Même paquet reçu par plusieurs récepteurs dans cette fenêtre = une seule ligne
+# Journal brut des lignes reçues (journal.py, rejouable); BALLOON_JOURNAL='' le désactive
+JOURNAL_DIR = os.environ.get('BALLOON_JOURNAL', os.path.join(DATA_DIR, 'journal'))
+JOURNAL_SEGMENT_BYTES = 64 * 1024 * 1024 # Nouveau segment au-delà (et à chaque jour UTC)
+JOURNAL_FSYNC_INTERVAL_S = 1.0           # Au plus cette fenêtre perdue en cas de coupure
+# Archive Parquet (archive.py, pyarrow): heures complètes sorties de SQLite; BALLOON_ARCHIVE='' la désactive
+ARCHIVE_DIR = os.environ.get('BALLOON_ARCHIVE', os.path.join(DATA_DIR, 'archive'))
+ARCHIVE_AFTER_S = 24 * 3600  # Âge minimal d'une heure archivée (un vol terminé, pas le vol en cours)
+ARCHIVE_INTERVAL_S = 600     # Période du rollover
+# Stockage: 'sqlite', ou 'sqlite+binlog' = en plus, journal binaire à largeur fixe lu par np.memmap
+# (binlog.py) qui sert les lectures en colonnes (analyses, séries des graphiques)
+STORAGE_BACKEND = os.environ.get('BALLOON_STORAGE', 'sqlite')
+STORAGE_BACKENDS = ('sqlite', 'sqlite+binlog')
+def binlog_dir_for(db_filename):
+    """Journal binaire propre à une base: data/binlog pour la base par défaut, sinon <base>.binlog/ à côté."""
+    if os.path.abspath(db_filename) == os.path.abspath(DEFAULT_DB_FILENAME): return os.path.join(DATA_DIR, 'binlog')
+    return os.path.splitext(db_filename)[0] + '.binlog'
+
+# BALLOON_BINLOG force le dossier; par défaut il suit la base (deux bases ne partagent jamais leurs ids)
+BINLOG_DIR = os.environ.get('BALLOON_BINLOG') or binlog_dir_for(DB_FILENAME)
+# Prédiction d'atterrissage (voir predictor.py)
+PREDICTION_BURST_ALTITUDE_M = 30000.0 # Altitude d'éclatement supposée tant que le ballon monte
+PREDICTION_GROUND_ALTITUDE_M = None   # None = altitude du premier point du vol
+PREDICTION_PRIME_ROWS = 3600          # Points relus au démarrage pour reconstituer les vents
 # MAX_HISTORY n'est plus nécessaire pour le stockage long terme
 
+# --- Journalisation (logs.py): un logger par composant, DEBUG du flux paquet désactivé par défaut ---
+log = logging.getLogger('balloon')
+log_serial = logging.getLogger('balloon.serial')
+log_parser = logging.getLogger('balloon.parser')
+log_db = logging.getLogger('balloon.db')
+log_socket = logging.getLogger('balloon.socket')
+API_MAX_LOG_ENTRIES = 5000 # Messages max par vidage /api/logs
+
 # --- Initialisation Flask et SocketIO ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'votre_super_secret_key_ici!' # CHANGEZ CECI
 socketio = SocketIO(app, async_mode='threading')
+# Diffusion découplée du thread série (débit limité par client, trames périmées abandonnées)
+broadcaster = Broadcaster(socketio, max_rate_hz=CLIENT_MAX_RATE_HZ, ack_timeout_s=CLIENT_ACK_TIMEOUT_S,
+                          keyframe_every=KEYFRAME_EVERY, keyframe_interval_s=KEYFRAME_INTERVAL_S)
 
 # --- Variables Globales ---
-ser = None
-serial_thread = None
 stop_thread = threading.Event()
-data_lock = threading.Lock() # Toujours utile pour latest_data
-
-# latest_data garde la dernière donnée reçue pour l'affichage immédiat
-latest_data = {
-    "timestamp": None, 'latitude': None, 'longitude': None, 'altitude_gps': None,
-    'satellites': None, 'temperature': None, 'pressure': None, 'humidity': None,
-    'altitude_bme': None, 'air_quality': None, 'tvoc': None, 'eco2': None,
-    'ozone': None, 'uv_index': None,
-    'pm1_std': None, 'pm25_std': None, 'pm10_std': None,
-    'rssi': None, 'speed_kmh': None,
-    'error': "Initialisation..."
-}
-# data_history est supprimée, remplacée par la DB
-
-previous_location_for_speed = None # Gardé pour le calcul de vitesse
+db_writer = None # Instance DBWriter (créée au démarrage)
+journal = None   # JournalWriter (None = pas de journal brut)
+binlog_writer = None # BinlogWriter (STORAGE_BACKEND 'sqlite+binlog')
+chasers = ChaseService() # Clients qui partagent leur position (register_chaser) -> 'chase_update'
+archive_stats = {'runs': 0, 'segments': 0, 'rows': 0, 'bytes': 0, 'errors': 0} # Thread d'archivage
+
+# Un FlightState par ballon (dédoublonnage, vitesse, filtre de fusion, dernier
+# point, historique, prédicteur: partagés par tous ses récepteurs) et une
+# SourcePipeline par récepteur (source, trames données + RSSI/SNR, compteurs)
+flights = {}
+pipelines = []
+for _flight_id, _receiver_id, _url in SOURCES:
+    if _flight_id not in flights:
+        flights[_flight_id] = FlightState(_flight_id, HISTORY_SIZE, DEDUP_WINDOW_S,
+                                          burst_altitude=PREDICTION_BURST_ALTITUDE_M,
+                                          ground_altitude=PREDICTION_GROUND_ALTITUDE_M)
+    pipelines.append(SourcePipeline(flights[_flight_id], _receiver_id, _url, DATA_PREFIXES, FRAME_TIMEOUT_S))
+DEFAULT_FLIGHT = SOURCES[0][0] # Vol suivi par un client qui n'en demande pas
+
+def load_track(flight_id):
+    """Fixes d'un vol pour le cache des tracés: base (archive et journal binaire compris) + tampon mémoire."""
+    with sqlite3.connect(DB_FILENAME) as conn:
+        ts, values = queries.fetch_columns(conn, ('latitude', 'longitude', 'altitude_gps'), flight=flight_id)
+    ts, lat, lon, alt = list(ts), list(values['latitude']), list(values['longitude']), list(values['altitude_gps'])
+    flight = flights.get(flight_id)
+    if flight is not None: # Points encore dans la file de l'écrivain DB
+        last = ts[-1] if ts else float('-inf')
+        recent = flight.history.since(last)
+        for point in flight.history.snapshot() if recent is None else recent:
+            if point['timestamp'] <= last or point['latitude'] is None or point['longitude'] is None: continue
+            ts.append(point['timestamp']); lat.append(point['latitude']); lon.append(point['longitude'])
+            alt.append(float('nan') if point['altitude_gps'] is None else point['altitude_gps'])
+    return ts, lat, lon, alt
+
+tracks = TrackCache(load_track, TRACK_CACHE_FLIGHTS) # Tracé complet simplifié par vol (/api/track)
 
 # --- Fonctions Utilitaires ---
 def ensure_data_dir():
     if not os.path.exists(DATA_DIR):
-        try: os.makedirs(DATA_DIR); print(f"Dossier '{DATA_DIR}' créé.")
-        except OSError as e: print(f"Erreur création dossier '{DATA_DIR}': {e}")
-
-# haversine et calculate_speed restent identiques
-def haversine_manual(lat1, lon1, lat2, lon2):
-    R = 6371000
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi, dlambda = math.radians(lat2 - lat1), math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-def calculate_speed_kmh(current_lat, current_lon, current_time):
-    global previous_location_for_speed
-    if not all(isinstance(x, (int, float)) for x in [current_lat, current_lon]): return None
-    try: current_dt = datetime.fromtimestamp(current_time)
-    except (TypeError, ValueError): return None
-    if not previous_location_for_speed:
-         previous_location_for_speed = {"lat": current_lat, "lon": current_lon, "dt": current_dt, "speed_kmh": 0.0}
-         return 0.0
-    try:
-        prev_lat, prev_lon, prev_dt = previous_location_for_speed["lat"], previous_location_for_speed["lon"], previous_location_for_speed["dt"]
-        if not all(isinstance(x, (int, float)) for x in [prev_lat, prev_lon]):
-             previous_location_for_speed = {"lat": current_lat, "lon": current_lon, "dt": current_dt, "speed_kmh": 0.0}
-             return 0.0
-        distance_m = haversine_manual(prev_lat, prev_lon, current_lat, current_lon)
-        time_diff_s = (current_dt - prev_dt).total_seconds()
-        if time_diff_s < 0.5: return previous_location_for_speed.get("speed_kmh", 0.0)
-        speed_mps = distance_m / time_diff_s
-        speed_kmh = round(speed_mps * 3.6, 2)
-        previous_location_for_speed = {"lat": current_lat, "lon": current_lon, "dt": current_dt, "speed_kmh": speed_kmh}
-        return speed_kmh
-    except Exception as e:
-        print(f"Erreur calcul vitesse: {e}")
-        previous_location_for_speed = {"lat": current_lat, "lon": current_lon, "dt": current_dt, "speed_kmh": 0.0}
-        return None
-
-# parse_serial_data reste identique - il parse la ligne et retourne un dict
-def parse_serial_data(compact_line):
-    data = {
-        "timestamp": time.time(), 'latitude': None, 'longitude': None, 'altitude_gps': None,
-        'satellites': None, 'temperature': None, 'pressure': None, 'humidity': None,
-        'altitude_bme': None, 'air_quality': None, 'tvoc': None, 'eco2': None,
-        'ozone': None, 'uv_index': None,
-        'pm1_std': None, 'pm25_std': None, 'pm10_std': None,
-        'rssi': None, 'speed_kmh': None, 'error': None
-    }
-    data_prefix = "Donnees brutes: "
-    if compact_line.startswith(data_prefix):
-        compact_line = compact_line[len(data_prefix):]
-
-    parts = compact_line.strip().split('|')
-    valid_data_found_in_line = False
-
-    for part in parts:
-        if not part: continue
-        elements = part.split(',')
-        if len(elements) < 1: continue
-        header = elements[0]; values = elements[1:]
-        try:
-            if header == "GPS" and len(values) >= 6:
-                if values[0] != "ERR":
-                    try:
-                        lat, lon = float(values[0]), float(values[1])
-                        if lat != 0.0 or lon != 0.0:
-                            data['latitude'] = lat; data['longitude'] = lon
-                            data['altitude_gps'] = float(values[2]) if values[2] != "ERR" else None
-                            data['satellites'] = int(values[3]) if values[3] != "ERR" else None
-                            valid_data_found_in_line = True
-                    except (ValueError, IndexError): pass
-            elif header == "ENV" and len(values) >= 4:
-                try:
-                    if values[0] != "ERR": data['temperature'] = float(values[0])
-                    if values[1] != "ERR": data['pressure'] = float(values[1]) # Pa
-                    if values[2] != "ERR": data['humidity'] = float(values[2])
-                    if values[3] != "ERR": data['altitude_bme'] = float(values[3])
-                    valid_data_found_in_line = True
-                except (ValueError, IndexError): pass
-            elif header == "AIR" and len(values) >= 3:
-                try:
-                    if values[0] != "ERR": data['air_quality'] = int(values[0])
-                    if values[1] != "ERR": data['tvoc'] = int(values[1])
-                    if values[2] != "ERR": data['eco2'] = int(values[2])
-                    valid_data_found_in_line = True
-                except (ValueError, IndexError): pass
-            elif header == "OZ" and len(values) >= 1:
-                try:
-                    if values[0] != "ERR": data['ozone'] = int(values[0])
-                    valid_data_found_in_line = True
-                except (ValueError, IndexError): pass
-            elif header == "UV" and len(values) >= 1:
-                try:
-                    if values[0] != "ERR":
-                        uv_val = float(values[0])
-                        if uv_val >= 0: data['uv_index'] = uv_val
-                    valid_data_found_in_line = True
-                except (ValueError, IndexError): pass
-            elif header == "PMS" and len(values) >= 3:
-                try:
-                    if values[0] != "ERR": data['pm1_std'] = int(values[0])
-                    if values[1] != "ERR": data['pm25_std'] = int(values[1])
-                    if values[2] != "ERR": data['pm10_std'] = int(values[2])
-                    valid_data_found_in_line = True
-                except (ValueError, IndexError): pass
-            # RSSI est géré séparément dans serial_reader_task
-        except Exception as section_e: print(f"Erreur parsing section {header}: {section_e}")
-
-    if data.get('latitude') is not None:
-        data['speed_kmh'] = calculate_speed_kmh(data['latitude'], data['longitude'], data['timestamp'])
-    return data
+        try: os.makedirs(DATA_DIR); log.info("Dossier '%s' créé.", DATA_DIR)
+        except OSError as e: log.error("Erreur création dossier '%s': %s", DATA_DIR, e)
+
+# parse_serial_data s'appuie sur le décodeur par table (decoder.py) et retourne un TelemetryRecord
+def parse_serial_data(compact_line, pipeline, timestamp=None):
+    for data_prefix in DATA_PREFIXES:
+        if compact_line.startswith(data_prefix):
+            compact_line = compact_line[len(data_prefix):]; break
+
+    flight = pipeline.flight
+    started = time.perf_counter()
+    record = decode(compact_line, time.time() if timestamp is None else timestamp)
+    decoded = time.perf_counter()
+    record.flight_id, record.receiver_id = pipeline.flight_id, pipeline.receiver_id
+    if record.latitude is not None:
+        record.speed_kmh = flight.speed.update(record.latitude, record.longitude, record.timestamp)
+    record = flight.fusion.update(record) # Remplit les colonnes *_fused (flux canonique du vol)
+    STAGE_SECONDS.observe(decoded - started, ('decode',))
+    STAGE_SECONDS.observe(time.perf_counter() - started, ('parse',))
+    return record
 
 # --- Fonctions Base de Données SQLite ---
 
@@ -173,192 +183,267 @@ def init_db():
         # Utilisation de 'with' pour gérer la connexion/commit/close
         with sqlite3.connect(DB_FILENAME) as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS telemetry (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp REAL NOT NULL,
-                    latitude REAL,
-                    longitude REAL,
-                    altitude_gps REAL,
-                    satellites INTEGER,
-                    temperature REAL,
-                    pressure REAL,
-                    humidity REAL,
-                    altitude_bme REAL,
-                    air_quality INTEGER,
-                    tvoc INTEGER,
-                    eco2 INTEGER,
-                    ozone INTEGER,
-                    uv_index REAL,
-                    pm1_std INTEGER,
-                    pm25_std INTEGER,
-                    pm10_std INTEGER,
-                    rssi INTEGER,
-                    speed_kmh REAL
-                )
-            """)
+            # Schéma généré depuis telemetry.TELEMETRY_SCHEMA (source unique de vérité)
+            cursor.execute(CREATE_TABLE_SQL)
+            added = upgrade_table(conn) # Base créée par une version précédente du schéma
+            if added: log_db.info("Migration DB: colonnes ajoutées %s", ', '.join(added))
+            if 'flight_id' in added: # Lignes d'avant le multi-sources: rattachées au vol par défaut
+                cursor.execute("UPDATE telemetry SET flight_id = ? WHERE flight_id IS NULL", (DEFAULT_FLIGHT,))
             # Ajouter un index sur le timestamp peut accélérer les requêtes ORDER BY / WHERE
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON telemetry (timestamp)")
-            print(f"Base de données '{DB_FILENAME}' initialisée/vérifiée.")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_flight_timestamp ON telemetry (flight_id, timestamp)")
+            # Tables d'agrégats 10 s / 1 min / 10 min (remplies depuis l'existant à la création)
+            init_rollups(conn)
+            # Colonnes dérivées (vitesse sol, vitesse verticale, phase) et événements du vol
+            init_analytics(conn)
+            # Réceptions de chaque paquet par récepteur (couverture, RSSI / SNR)
+            init_dedup(conn)
+            # Manifeste des segments Parquet archivés
+            archive.init_archive(conn)
+            # Index R*Tree des fixes GPS (requêtes par emprise / rayon / plus proches)
+            indexed = init_spatial(conn)
+            if indexed: log_db.info("Index spatial créé: %d fixes existants indexés.", indexed)
+            log_db.info("Base de données '%s' initialisée/vérifiée.", DB_FILENAME)
     except sqlite3.Error as e:
-        print(f"ERREUR DB (init): {e}")
+        log_db.error("ERREUR DB (init): %s", e)
         # Gérer l'erreur potentiellement critique (ex: arrêter l'appli?)
         raise # Renvoyer l'erreur pour arrêter si l'init échoue
 
-# <<< NOUVEAU: Insertion Données >>>
-def insert_data(data):
-    """Insère un dictionnaire de données dans la table telemetry."""
-    # Définir l'ordre des colonnes correspondant à la table et aux placeholders
-    # ATTENTION: L'ordre est crucial ici !
-    cols = ['timestamp', 'latitude', 'longitude', 'altitude_gps', 'satellites',
-            'temperature', 'pressure', 'humidity', 'altitude_bme', 'air_quality',
-            'tvoc', 'eco2', 'ozone', 'uv_index', 'pm1_std', 'pm25_std',
-            'pm10_std', 'rssi', 'speed_kmh']
-    # Créer la chaîne de placeholders (?, ?, ...)
-    placeholders = ', '.join(['?'] * len(cols))
-    sql = f"INSERT INTO telemetry ({', '.join(cols)}) VALUES ({placeholders})"
-
-    # Extraire les valeurs du dictionnaire dans le bon ordre, en utilisant None si la clé manque
-    values = tuple(data.get(col) for col in cols)
-
-    try:
-        with sqlite3.connect(DB_FILENAME, timeout=10) as conn: # timeout pour éviter lock db prolongé
-            cursor = conn.cursor()
-            cursor.execute(sql, values)
-            # Pas besoin de commit explicite avec 'with' pour les opérations simples
-            # conn.commit() # commit est automatique à la sortie du 'with' sans erreur
-            print(f"DB_INSERT OK: Timestamp {data.get('timestamp')}") # Log succès
-    except sqlite3.Error as e:
-        print(f"ERREUR DB (insert): {e} - Data: {data}")
-        # Décider quoi faire: loguer, ignorer, réessayer?
-
-# --- Tâche de Lecture Série (Modifiée pour insérer dans DB) ---
-def serial_reader_task():
-    global latest_data, ser
-    print("Démarrage du thread de lecture série (Mode Multi-Lignes + SQLite)...")
-    last_rssi_value = None
+def start_journal():
+    """Ouvre le journal brut (JOURNAL_DIR), sauf si désactivé."""
+    global journal
+    if not JOURNAL_DIR: return None
+    journal = JournalWriter(JOURNAL_DIR, JOURNAL_SEGMENT_BYTES, JOURNAL_FSYNC_INTERVAL_S)
+    journal.start()
+    log_db.info("Journal brut: %s", JOURNAL_DIR)
+    return journal
+
+def archive_task():
+    """Rollover périodique: heures complètes plus vieilles que ARCHIVE_AFTER_S -> Parquet, puis supprimées."""
+    while True:
+        conn = None
+        try:
+            t0 = time.perf_counter()
+            conn = sqlite3.connect(DB_FILENAME, timeout=30)
+            written = archive.rollover(conn, ARCHIVE_DIR, time.time() - ARCHIVE_AFTER_S)
+            archive_stats['runs'] += 1
+            if written:
+                archive_stats['segments'] += len(written)
+                archive_stats['rows'] += sum(s.rows for s in written)
+                archive_stats['bytes'] += sum(s.bytes for s in written)
+                log_db.info("Archive: %d segment(s), %d lignes sorties de SQLite en %.2f s", len(written),
+                            sum(s.rows for s in written), time.perf_counter() - t0)
+        except (sqlite3.Error, OSError) as e:
+            archive_stats['errors'] += 1
+            log_db.error("ERREUR archive (rollover): %s", e)
+        finally:
+            if conn: conn.close()
+        if stop_thread.wait(ARCHIVE_INTERVAL_S): return
+
+def start_archiver():
+    """Démarre le thread d'archivage, sauf si désactivé ou sans pyarrow."""
+    if not ARCHIVE_DIR: return None
+    if not archive.available():
+        log_db.warning("pyarrow absent: pas d'archive Parquet, toute la télémétrie reste dans SQLite")
+        return None
+    thread = threading.Thread(target=archive_task, name='archiver', daemon=True)
+    thread.start()
+    log_db.info("Archive Parquet: %s (heures de plus de %d s)", ARCHIVE_DIR, ARCHIVE_AFTER_S)
+    return thread
+
+def journal_line(pipeline, line):
+    """Ajoute une ligne brute au journal. Retourne son heure de réception (aussi celle de la trame)."""
+    received_at = time.time()
+    raw = line.rstrip(b'\r\n')
+    if journal is not None and raw: journal.append(raw, received_at, pipeline.flight_id, pipeline.receiver_id)
+    return received_at
+
+def start_binlog():
+    """Ouvre le journal binaire; au premier démarrage, il reprend l'historique de la base (archive comprise)."""
+    global binlog_writer
+    if STORAGE_BACKEND not in STORAGE_BACKENDS:
+        raise ValueError(f"STORAGE_BACKEND inconnu: {STORAGE_BACKEND} ({', '.join(STORAGE_BACKENDS)})")
+    binlog_writer = binlog.BinlogWriter(BINLOG_DIR)
+    if not binlog.segment_paths(BINLOG_DIR):
+        with sqlite3.connect(DB_FILENAME) as conn: copied = binlog.build(conn, binlog_writer)
+        if copied: log_db.info("Journal binaire: %d lignes reprises de la base", copied)
+    queries.binlog_reader = binlog.BinlogReader(BINLOG_DIR)
+    log_db.info("Journal binaire: %s (%d octets par ligne)", BINLOG_DIR, binlog.RECORD_DTYPE.itemsize)
+    return binlog_writer
+
+def start_db_writer(writer_class=DBWriter, **options):
+    """Démarre l'écrivain unique (connexion longue durée en WAL). AsyncDBWriter en mode asyncio."""
+    global db_writer
+    options = {'queue_maxsize': DB_QUEUE_MAXSIZE, 'flush_max_rows': DB_FLUSH_MAX_ROWS,
+               'flush_interval_s': DB_FLUSH_INTERVAL_S, **options}
+    hooks = [rollup_batch] # Agrégats dans la transaction du lot
+    after_commit = [start_binlog().committed] if STORAGE_BACKEND == 'sqlite+binlog' else [] # Jamais un lot annulé
+    db_writer = writer_class(DB_FILENAME, INSERT_SQL, hooks=hooks, after_commit=after_commit, **options)
+    db_writer.start()
+    return db_writer
+
+# <<< MODIFIÉ: Insertion Données via l'écrivain groupé >>>
+def insert_reception(packet_key, pipeline, timestamp, rssi, snr=None):
+    """Empile une réception (packet_receptions), dans le même lot que la télémétrie."""
+    if db_writer is None: return False
+    return db_writer.submit((packet_key, pipeline.flight_id, pipeline.receiver_id, timestamp, rssi, snr),
+                            INSERT_RECEPTION_SQL)
+
+def insert_data(record):
+    """Empile un TelemetryRecord pour insertion (commit groupé par DBWriter)."""
+    # as_row() donne directement le tuple dans l'ordre des colonnes de la table
+    values = record.as_row()
+    if db_writer is None:
+        log_db.error("ERREUR DB (insert): écrivain non démarré - paquet %s perdu", record.packet_key)
+        return False
+    # Ne bloque le thread série que si la file est pleine (contre-pression)
+    return db_writer.submit(values)
+
+def store_frame(pipeline, frame):
+    """Dédoublonne, décode et empile une trame pour la base (appelant: flight.ingest_lock).
+
+    Retourne (packet_key, TelemetryRecord), record None si un autre récepteur a déjà remonté le paquet.
+    Partagé par le serveur et le rejeu du journal (journal.py).
+    """
+    packet_key, first = pipeline.flight.dedup.observe(frame.data, pipeline.receiver_id, frame.received_at)
+    insert_reception(packet_key, pipeline, frame.received_at, frame.rssi, frame.snr)
+    if not first: return packet_key, None
+    parsed_data = parse_serial_data(frame.data, pipeline, frame.received_at)
+    parsed_data.rssi, parsed_data.snr, parsed_data.packet_key = frame.rssi, frame.snr, packet_key
+    started = time.perf_counter()
+    insert_data(parsed_data)
+    STAGE_SECONDS.observe(time.perf_counter() - started, ('insert',))
+    PACKET_RATE.mark()
+    return packet_key, parsed_data
+
+# <<< MODIFIÉ: un paquet = une trame (données + RSSI/SNR du même paquet), plus de report au suivant >>>
+def process_frame(pipeline, frame):
+    """Dédoublonne, décode, stocke et diffuse une trame complète d'un récepteur."""
+    flight = pipeline.flight
+    tag = f"[{pipeline.receiver_id}]"
+    started = time.perf_counter()
+    STAGE_SECONDS.observe(max(0.0, time.time() - frame.received_at), ('frame',))
+    log_parser.debug("%s Trame [%s] RSSI=%s SNR=%s (%s)", tag, frame.data, frame.rssi, frame.snr, frame.closed_by)
+    pipeline.packets += 1
+
+    # Un paquet à la fois par vol: les récepteurs redondants passent par le même index
+    with flight.ingest_lock:
+        # 1. Insérer dans la base de données
+        packet_key, parsed_data = store_frame(pipeline, frame)
+        if parsed_data is None:
+            log_parser.debug("%s Paquet %s déjà reçu par un autre récepteur", tag, packet_key)
+            broadcaster.set_status(pipeline.status('receiving'), pipeline.receiver_id, flight.room)
+            return
+        flight.history.append(parsed_data)
+        tracks.add(flight.flight_id, parsed_data) # Tracé simplifié de la carte (si en cache)
+        prediction = flight.predictor.update(parsed_data) # Incrémental, ~1 ms
+
+        # 2. Mettre à jour le dernier point du vol (pour l'UI temps réel)
+        with flight.lock:
+            if parsed_data.has_sensor_data() and flight.latest.error:
+                log_parser.info("%s Erreur effacée car données capteur reçues.", tag)
+                parsed_data.error = None # Efface l'erreur pour l'envoi
+            flight.latest = parsed_data # Nouvel objet par paquet: pas de copie
+
+    # 3. Déposer pour le diffuseur (non bloquant, fusion si rafale)
+    if log_socket.isEnabledFor(logging.DEBUG): log_socket.debug("%s Diffusion %s", tag, parsed_data.as_dict())
+    emitting = time.perf_counter()
+    broadcaster.publish(parsed_data, flight.flight_id)
+    if prediction: broadcaster.publish_event('prediction_update', prediction, flight.room)
+    broadcaster.set_status(pipeline.status('receiving'), pipeline.receiver_id, flight.room)
+    done = time.perf_counter()
+    STAGE_SECONDS.observe(done - emitting, ('emit',))
+    # 4. Distance / cap / élévation / ETA de tous les chasseurs du vol, en une passe
+    chase = chasers.update(flight.flight_id, parsed_data, flight.predictor.last)
+    for sid, payload in chase: broadcaster.publish_event('chase_update', payload, sid)
+    if chase:
+        STAGE_SECONDS.observe(time.perf_counter() - done, ('chase',))
+        done = time.perf_counter()
+    STAGE_SECONDS.observe(done - started, ('process',))
+
+# --- Tâche de Lecture Série (une par source, insère dans la DB) ---
+def serial_reader_task(pipeline):
+    flight = pipeline.flight
+    tag = f"[{pipeline.receiver_id}]"
+    log_serial.info("Démarrage du thread de lecture %s (vol %s, source %s)...", tag, flight.flight_id, pipeline.url)
+
+    def publish_error(message, stamp=False):
+        with flight.lock:
+            flight.latest.error = message
+            if stamp: flight.latest.timestamp = time.time()
+        broadcaster.publish(flight.latest, flight.flight_id)
 
     while not stop_thread.is_set():
         serial_error_message = None
+        source = pipeline.source
         try:
-            if ser is None or not ser.is_open:
-                # ... (logique de connexion/reconnexion identique) ...
-                if ser: 
-                    try: 
-                        ser.close() 
-                    except Exception: pass
-                print(f"Tentative de connexion à {SERIAL_PORT}@{BAUD_RATE}...")
+            if source is None or not source.is_open:
+                # Connexion/reconnexion (série, TCP, UDP, rejeu, pty)
+                if source is None:
+                    source = pipeline.source = make_source(pipeline.url, default_baud=BAUD_RATE,
+                                                           timeout=SOURCE_READ_TIMEOUT_S)
+                else: source.close()
+                log_serial.info("%s Tentative de connexion à %s...", tag, source.describe())
                 try:
-                    ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
-                    print(f"Connecté avec succès à {SERIAL_PORT}")
-                    with data_lock: latest_data['error'] = None
-                    socketio.emit('serial_status', {'status': 'connected', 'port': SERIAL_PORT, 'message': None})
-                    time.sleep(0.5); ser.reset_input_buffer()
-                except (serial.SerialException, PermissionError, FileNotFoundError) as e:
-                    serial_error_message = f"Échec connexion {SERIAL_PORT}: {e}"
-                    print(f"ERREUR: {serial_error_message}")
-                    ser = None
-                    with data_lock:
-                         if latest_data.get('error') != serial_error_message:
-                             latest_data['error'] = serial_error_message
-                             socketio.emit('update_data', latest_data)
-                    socketio.emit('serial_status', {'status': 'error', 'port': SERIAL_PORT, 'message': str(e)})
+                    source.open()
+                    log_serial.info("%s Connecté avec succès à %s", tag, source.describe())
+                    with flight.lock: flight.latest.error = None
+                    broadcaster.set_status(pipeline.status('connected'), pipeline.receiver_id, flight.room)
+                except SourceError as e:
+                    serial_error_message = str(e)
+                    log_serial.error("%s ERREUR: %s", tag, serial_error_message)
+                    if flight.latest.error != serial_error_message: publish_error(serial_error_message)
+                    broadcaster.set_status(pipeline.status('error', str(e)), pipeline.receiver_id, flight.room)
                     stop_thread.wait(5)
                     continue
 
-            if ser and ser.is_open:
-                if ser.in_waiting > 0:
-                    line = ser.readline()
-                    try:
-                        raw_line = line.decode('utf-8', errors='ignore').strip()
-                        if raw_line: print(f"PY_READ_LINE: [{raw_line}]")
-
-                        if raw_line:
-                            data_prefix = "Donnees brutes: "
-                            if raw_line.startswith(data_prefix):
-                                compact_data_string = raw_line[len(data_prefix):]
-                                print(f"PY_FOUND_DATA: Extracted [{compact_data_string}]")
-
-                                parsed_data = parse_serial_data(compact_data_string)
-
-                                # Appliquer le dernier RSSI connu avant l'insertion/émission
-                                if last_rssi_value is not None:
-                                    parsed_data['rssi'] = last_rssi_value
-                                    print(f"PY_APPLY_RSSI: Ajout RSSI={last_rssi_value}")
-                                    last_rssi_value = None # Consommer RSSI
-
-                                # ---- MODIFICATION PRINCIPALE ----
-                                # 1. Insérer dans la base de données
-                                insert_data(parsed_data)
-
-                                # 2. Mettre à jour latest_data (pour l'UI temps réel)
-                                with data_lock:
-                                    has_valid_sensor_data = any(
-                                        v is not None for k, v in parsed_data.items()
-                                        if k not in ['timestamp', 'rssi', 'speed_kmh', 'error', 'latitude', 'longitude', 'altitude_gps', 'satellites']
-                                    )
-                                    if has_valid_sensor_data and latest_data.get('error'):
-                                        print("PY_CLEAR_ERROR: Erreur effacée car données capteur reçues.")
-                                        parsed_data['error'] = None # Efface l'erreur pour l'envoi
-
-                                    latest_data = parsed_data.copy() # Garder une copie pour l'UI
-
-                                # 3. Émettre vers les clients WebSocket
-                                print(f"PY_EMIT_UPDATE: {latest_data}")
-                                socketio.emit('update_data', latest_data)
-                                socketio.emit('serial_status', {'status': 'receiving', 'port': SERIAL_PORT, 'message': None})
-                                # data_history.append() est SUPPRIMÉ
-
-                            elif raw_line.startswith("RSSI:"):
-                                try:
-                                    rssi_part = raw_line.split('|')[0]
-                                    rssi_value_str = rssi_part.split(':')[1].strip()
-                                    last_rssi_value = int(rssi_value_str)
-                                    print(f"PY_FOUND_RSSI: Stored {last_rssi_value} for next packet")
-                                except (IndexError, ValueError) as e_rssi:
-                                    print(f"PY_WARN: Impossible parser RSSI: {raw_line} - {e_rssi}")
-                        # else: ligne vide ignorée
-                    except UnicodeDecodeError as ude: print(f"ERREUR DECODAGE: {ude} pour bytes: {line}")
-                    except serial.SerialException as e:
-                        # ... (gestion erreur lecture identique) ...
-                        serial_error_message = f"Erreur série pendant lecture: {e}"
-                        print(f"ERREUR LECTURE: {serial_error_message}")
-                        if ser: 
-                            try: 
-                                ser.close() 
-                            except Exception: pass
-                        ser = None
-                        with data_lock: latest_data['error'] = serial_error_message
-                        socketio.emit('serial_status', {'status': 'error', 'port': SERIAL_PORT, 'message': str(e)})
-                        socketio.emit('update_data', latest_data)
-                        stop_thread.wait(2)
-                    except Exception as e_proc:
-                         print(f"Erreur traitement ligne: {e_proc} pour ligne: {raw_line}")
-                         with data_lock: latest_data['error'] = f"Erreur proc: {e_proc}"; latest_data['timestamp'] = time.time()
-                         socketio.emit('update_data', latest_data)
-                else: stop_thread.wait(0.05)
-            else: stop_thread.wait(1)
+            # Lecture bloquante (au plus SOURCE_READ_TIMEOUT_S): pas de sondage in_waiting + sleep
+            raw_line = None
+            try:
+                line = source.readline()
+                if not line: # Timeout sans donnée: trame en attente expirée? puis on revérifie stop_thread
+                    for frame in pipeline.framer.poll(): process_frame(pipeline, frame)
+                    continue
+                line_started = time.perf_counter()
+                pipeline.lines += 1
+                received_at = journal_line(pipeline, line) # Avant décodage: rejouable si la suite échoue
+                raw_line = line.decode('utf-8', errors='ignore').strip()
+                if raw_line: log_serial.debug("%s Ligne [%s]", tag, raw_line)
+                # Ligne de données, RSSI / SNR et bloc décodé regroupés par paquet (framing.py)
+                frames = pipeline.framer.feed(raw_line, received_at=received_at)
+                STAGE_SECONDS.observe(time.perf_counter() - line_started, ('read',))
+                for frame in frames: process_frame(pipeline, frame)
+            except SourceError as e:
+                serial_error_message = str(e)
+                log_serial.error("%s ERREUR LECTURE: %s", tag, serial_error_message)
+                PROCESS_ERRORS.inc(('source',))
+                source.close()
+                for frame in pipeline.framer.flush(): process_frame(pipeline, frame)
+                broadcaster.set_status(pipeline.status('error', str(e)), pipeline.receiver_id, flight.room)
+                publish_error(serial_error_message)
+                stop_thread.wait(2)
+            except Exception as e_proc:
+                 log_parser.exception("%s Erreur traitement ligne: %s pour ligne: %s", tag, e_proc, raw_line)
+                 PROCESS_ERRORS.inc(('process',))
+                 publish_error(f"Erreur proc: {e_proc}", stamp=True)
         except Exception as e_main:
-            # ... (gestion erreur majeure identique) ...
             serial_error_message = f"Erreur majeure thread série: {e_main}"
-            print(f"ERREUR MAJEURE: {serial_error_message}")
-            if ser: 
-                try: 
-                    ser.close() 
-                except Exception: pass; ser = None
-            with data_lock: latest_data['error'] = serial_error_message
-            socketio.emit('serial_status', {'status': 'error', 'port': SERIAL_PORT, 'message': str(e_main)})
-            socketio.emit('update_data', latest_data)
+            log_serial.exception("%s ERREUR MAJEURE: %s", tag, serial_error_message)
+            PROCESS_ERRORS.inc(('reader',))
+            if source: source.close()
+            broadcaster.set_status(pipeline.status('error', str(e_main)), pipeline.receiver_id, flight.room)
+            publish_error(serial_error_message)
             stop_thread.wait(5)
 
-    print("Arrêt thread série demandé.")
-    if ser and ser.is_open: 
-        try: 
-            ser.close(); 
-            print(f"Port {SERIAL_PORT} fermé.") 
-        except Exception as e: 
-            print(f"Erreur fermeture port: {e}")
-    ser = None; print("Thread série terminé.")
+    log_serial.info("%s Arrêt thread série demandé.", tag)
+    for frame in pipeline.framer.flush(): process_frame(pipeline, frame) # Dernier paquet en attente
+    if pipeline.source and pipeline.source.is_open:
+        try:
+            pipeline.source.close()
+            log_serial.info("%s Source %s fermée.", tag, pipeline.source.describe())
+        except Exception as e:
+            log_serial.warning("%s Erreur fermeture source: %s", tag, e)
+    log_serial.info("%s Thread série terminé.", tag)
 
 # --- Routes Flask ---
 
@@ -366,139 +451,531 @@ def serial_reader_task():
 def index():
     return render_template('index.html')
 
-# <<< MODIFIÉ: Route /download lit depuis SQLite >>>
+# <<< MODIFIÉ: Route /download exporte en flux depuis SQLite (mémoire constante) >>>
 @app.route('/download')
 def download_data():
-    db_data = []
-    conn = None # Initialiser hors du try pour le finally
+    """Export de tout l'historique, archive comprise. ?format=csv|ndjson|xlsx|parquet (défaut: DATA_FORMAT), ?flight=."""
+    export_format = request.args.get('format', DATA_FORMAT).lower()
+    if export_format not in MIMETYPES:
+        return "Format de téléchargement non supporté.", 400
+    flight = request.args.get('flight') or None
+    download_name = f"{DOWNLOAD_FILENAME_BASE}{'_' + flight if flight else ''}.{export_format}"
+
+    conn = None
     try:
-        # Se connecter et lire TOUTES les données de la base
         conn = sqlite3.connect(DB_FILENAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM telemetry ORDER BY timestamp ASC") # Récupérer dans l'ordre chronologique
-        rows = cursor.fetchall()
-
-        # Obtenir les noms de colonnes
-        colnames = [description[0] for description in cursor.description]
-
-        if not rows:
+        if conn.execute("SELECT 1 FROM telemetry LIMIT 1").fetchone() is None and not archive.segments(conn):
+            conn.close()
             return "Aucune donnée enregistrée dans la base.", 404
 
-        # Convertir les lignes (tuples) en liste de dictionnaires (plus facile pour Pandas)
-        # for row in rows:
-        #    db_data.append(dict(zip(colnames, row)))
-        # Ou directement dans le DataFrame
-        df = pd.DataFrame(rows, columns=colnames)
-        print(f"DB_READ: {len(df)} lignes lues depuis la base pour le téléchargement.")
-
-        # Traitement du DataFrame (conversion timestamp, etc.)
-        if 'timestamp' in df.columns:
-             try: df['timestamp_iso'] = pd.to_datetime(df['timestamp'], unit='s').dt.strftime('%Y-%m-%d %H:%M:%S')
-             except Exception as date_e: print(f"Erreur conversion date: {date_e}")
-        if 'id' in df.columns:
-            df = df.drop(columns=['id']) # On n'a pas besoin de l'ID interne dans le fichier téléchargé
-
-        # Génération du fichier Excel ou CSV
-        ensure_data_dir()
-        output_filename = f"{DOWNLOAD_FILENAME_BASE}.{DATA_FORMAT}"
-        local_filepath = os.path.join(DATA_DIR, output_filename) # Pour sauvegarde locale optionnelle
-
-        if DATA_FORMAT == 'xlsx':
-            output = io.BytesIO()
-            # Utilisation explicite de 'openpyxl' comme moteur (bonne pratique)
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='TelemetryData')
-            output.seek(0)
-            # --- MODIFIÉ: Le mimetype pour .xlsx ---
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            download_name = output_filename # Le nom inclut déjà .xlsx
+        if export_format in ('xlsx', 'parquet'):
+            # Classeur write-only / fichier Parquet écrit dans un fichier temporaire, puis envoyé
+            write = write_xlsx if export_format == 'xlsx' else write_parquet
+            try: output = write(iter_rows(conn, EXPORT_CHUNK_ROWS, flight))
+            finally: conn.close()
+            log.info("Préparation téléchargement (%s) terminée.", export_format)
+            return send_file(output, mimetype=MIMETYPES[export_format], download_name=download_name,
+                             as_attachment=True)
+
+        def generate(conn=conn):
+            # Le curseur est consommé au fil de l'envoi; la connexion est fermée à la fin
             try:
-                # Sauvegarde locale en .xlsx
-                df.to_excel(local_filepath, index=False, engine='openpyxl')
-                print(f"Fichier sauvegardé localement : {local_filepath}")
-            except Exception as save_e:
-                print(f"Erreur sauvegarde locale Excel (.xlsx): {save_e}")
-        elif DATA_FORMAT == 'csv':
-            output = io.StringIO(); df.to_csv(output, index=False, quoting=csv.QUOTE_NONNUMERIC)
-            output_bytes = io.BytesIO(output.getvalue().encode('utf-8')); output_bytes.seek(0); output = output_bytes
-            mimetype='text/csv'; download_name=output_filename
-            try: df.to_csv(local_filepath, index=False, encoding='utf-8') # Sauvegarde locale
-            except Exception as save_e: print(f"Erreur sauvegarde locale CSV: {save_e}")
-        else: return "Format de téléchargement non supporté.", 500
-
-        print(f"Préparation téléchargement ({DATA_FORMAT}) {len(df)} lignes.")
-        return send_file(output, mimetype=mimetype, download_name=download_name, as_attachment=True)
+                chunks = iter_rows(conn, EXPORT_CHUNK_ROWS, flight)
+                yield from (csv_chunks(chunks) if export_format == 'csv' else ndjson_chunks(chunks))
+            finally:
+                conn.close()
+        log.info("Téléchargement en flux (%s) démarré.", export_format)
+        return Response(stream_with_context(generate()), mimetype=MIMETYPES[export_format],
+                        headers={'Content-Disposition': f'attachment; filename="{download_name}"'})
 
     except sqlite3.Error as e:
-        print(f"ERREUR DB (download): {e}")
+        log_db.error("ERREUR DB (download): %s", e)
+        if conn: conn.close()
         return f"Erreur base de données lors de la récupération des données: {e}", 500
     except Exception as e:
-        print(f"Erreur génération/envoi fichier ({DATA_FORMAT}): {e}")
-        import traceback; traceback.print_exc()
+        log.exception("Erreur génération/envoi fichier (%s): %s", export_format, e)
+        if conn: conn.close()
         return f"Erreur serveur lors de la génération du fichier: {e}", 500
+
+# <<< NOUVEAU: API de requête (fenêtre temporelle, colonnes, réduction) >>>
+@app.route('/api/telemetry')
+def api_telemetry():
+    """Lecture de la télémétrie.
+
+    ?start=&end=        bornes (timestamp Unix, optionnelles)
+    ?flight=            un seul vol (défaut: tous)
+    ?columns=a,b        colonnes voulues (défaut: toutes les colonnes numériques)
+    ?points=N           mode réduit: N points par colonne (&method=lttb|minmax)
+    ?limit=&cursor=     mode brut: pagination par clé (next_cursor dans la réponse)
+    """
+    conn = None
+    try:
+        start = parse_float(request.args.get('start'), 'start')
+        end = parse_float(request.args.get('end'), 'end')
+        columns = parse_columns(request.args.get('columns'))
+        flight = request.args.get('flight') or None
+        points = request.args.get('points', type=int)
+        conn = sqlite3.connect(DB_FILENAME)
+        if points:
+            method = request.args.get('method', 'lttb')
+            n_raw, series = fetch_series(conn, columns, start, end, min(points, API_MAX_POINTS), method, flight)
+            return jsonify({'start': start, 'end': end, 'method': method,
+                            'raw_count': n_raw, 'series': series})
+        limit = min(request.args.get('limit', API_PAGE_ROWS, type=int), API_MAX_PAGE_ROWS)
+        rows, next_cursor = fetch_page(conn, columns, start, end, limit,
+                                       decode_cursor(request.args.get('cursor')), flight)
+        return jsonify({'start': start, 'end': end, 'rows': rows, 'next_cursor': next_cursor})
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        log_db.error("ERREUR DB (api telemetry): %s", e)
+        return jsonify({'error': f"Erreur base de données: {e}"}), 500
     finally:
-        if conn:
-            conn.close() # Toujours fermer la connexion DB
+        if conn: conn.close()
 
-# --- Gestion SocketIO ---
+@app.route('/api/telemetry/summary')
+def api_telemetry_summary():
+    """Séries min/moy/max depuis le palier d'agrégats le moins coûteux pour la fenêtre.
 
-# <<< MODIFIÉ: handle_connect lit l'historique depuis SQLite >>>
-@socketio.on('connect')
-def handle_connect():
-    sid = request.sid; print(f"Client connecté: {sid}")
-    history_to_send = []
+    ?start=&end=&flight=&columns=a,b&points=N -> {'tier': 'raw'|'10s'|'1min'|'10min',
+                                        'series': {col: [[t, min, avg, max], ...]}}
+    """
     conn = None
     try:
-        # Récupérer les 100 derniers points de la DB pour l'historique initial
+        start = parse_float(request.args.get('start'), 'start')
+        end = parse_float(request.args.get('end'), 'end')
+        columns = parse_columns(request.args.get('columns'), default=ROLLUP_COLUMNS)
+        points = min(request.args.get('points', SUMMARY_DEFAULT_POINTS, type=int), API_MAX_POINTS)
         conn = sqlite3.connect(DB_FILENAME)
-        conn.row_factory = sqlite3.Row # Pour obtenir des résultats comme des dictionnaires
-        cursor = conn.cursor()
-        # Sélectionner les 100 plus récents
-        cursor.execute("SELECT * FROM telemetry ORDER BY timestamp DESC LIMIT 100")
-        rows = cursor.fetchall()
-        # Convertir les sqlite3.Row en dictionnaires standard et inverser l'ordre pour l'affichage chronologique
-        history_to_send = [dict(row) for row in reversed(rows)]
-        print(f"DB_READ: {len(history_to_send)} lignes lues pour l'historique initial.")
-
+        tier, series = fetch_summary(conn, columns, start, end, points, request.args.get('flight') or None)
+        return jsonify({'start': start, 'end': end, 'tier': tier, 'series': series})
+    except (QueryError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
     except sqlite3.Error as e:
-        print(f"ERREUR DB (initial history): {e}")
-        # Envoyer un historique vide en cas d'erreur DB
-        history_to_send = []
+        log_db.error("ERREUR DB (api summary): %s", e)
+        return jsonify({'error': f"Erreur base de données: {e}"}), 500
     finally:
-        if conn:
-            conn.close()
+        if conn: conn.close()
 
-    # Envoyer l'état actuel et l'historique lu
-    with data_lock: current_state = latest_data.copy()
-    emit('update_data', current_state, room=sid) # Dernier point connu
-    emit('initial_history', history_to_send, room=sid) # Historique de la DB
+@app.route('/api/analytics', methods=['GET', 'POST'])
+def api_analytics():
+    """Analyse vectorisée du vol (vitesse sol, vitesse verticale, éclatement, atterrissage).
+
+    GET  ?start=&end=&flight= -> résumé + événements, calculés à la volée (défaut: vol principal)
+    POST ?start=&end=&flight= -> idem, et réécrit telemetry_derived / flight_events pour la fenêtre
+    """
+    conn = None
+    try:
+        start = parse_float(request.args.get('start'), 'start')
+        end = parse_float(request.args.get('end'), 'end')
+        t0 = time.perf_counter()
+        conn = sqlite3.connect(DB_FILENAME)
+        result = analyze(conn, start, end, request.args.get('flight') or DEFAULT_FLIGHT)
+        summary = summarize(result)
+        if request.method == 'POST':
+            with conn: summary['stored'] = store_derived(conn, result)
+        summary['elapsed_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+        return jsonify(summary)
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        log_db.error("ERREUR DB (api analytics): %s", e)
+        return jsonify({'error': f"Erreur base de données: {e}"}), 500
+    finally:
+        if conn: conn.close()
+
+@app.route('/api/track')
+def api_track():
+    """Tracé complet du vol simplifié pour la carte (Feature GeoJSON, coordonnées [lon, lat, alt]).
+
+    ?flight=            vol (défaut: vol principal)
+    ?zoom=Z             zoom de la carte: tolérance d'environ un pixel à ce zoom (défaut 12)
+    ?max_points=N       plafond de sommets, zoom plus grossier au-delà
+    ?bbox=w,s,e,n       découpe à une emprise (MultiLineString)
+    ?tile=z/x/y         découpe à une tuile XYZ, au zoom de la tuile
+    """
+    try:
+        flight_id = request.args.get('flight') or DEFAULT_FLIGHT
+        zoom = request.args.get('zoom', 12, type=int)
+        max_points = min(request.args.get('max_points', TRACK_MAX_POINTS, type=int), TRACK_MAX_POINTS)
+        bbox = None
+        if request.args.get('tile'):
+            try: z, x, y = (int(v) for v in request.args['tile'].split('/'))
+            except ValueError: raise QueryError("tile invalide (attendu z/x/y)")
+            bbox, zoom = tile_bbox(z, x, y), z
+        else:
+            bbox = parse_bbox(request.args.get('bbox'))
+        if max_points < 2: raise QueryError("max_points doit être >= 2")
+        track = tracks.get(flight_id)
+        response = jsonify(track.geojson(zoom, max_points, bbox))
+        # Même tracé tant qu'aucun fix n'arrive: le navigateur revalide (304)
+        response.set_etag(f"{flight_id}-{track.n}-{request.query_string.decode()}")
+        return response.make_conditional(request)
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        log_db.error("ERREUR DB (api track): %s", e)
+        return jsonify({'error': f"Erreur base de données: {e}"}), 500
+
+# <<< NOUVEAU: requêtes spatiales sur les fixes GPS (index R*Tree) >>>
+def _parse_position():
+    lat, lon = parse_float(request.args.get('lat'), 'lat'), parse_float(request.args.get('lon'), 'lon')
+    if lat is None or lon is None: raise QueryError("Paramètres 'lat' et 'lon' requis")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180): raise QueryError(f"Position hors limites: {lat}, {lon}")
+    return lat, lon
+
+@app.route('/api/spatial/<kind>')
+def api_spatial(kind):
+    """Fixes GPS par position (télémétrie chaude et archivée).
+
+    /api/spatial/bbox?bbox=w,s,e,n          fixes dans l'emprise, par temps croissant
+    /api/spatial/radius?lat=&lon=&radius_m= fixes à moins de radius_m, du plus proche au plus loin
+    /api/spatial/nearest?lat=&lon=&k=       k fixes les plus proches (&max_radius_m= optionnel)
+    Communs: ?flight= (défaut: tous les vols), ?start=&end=, ?limit=
+    """
+    conn = None
+    try:
+        start = parse_float(request.args.get('start'), 'start')
+        end = parse_float(request.args.get('end'), 'end')
+        flight = request.args.get('flight') or None
+        limit = min(request.args.get('limit', SPATIAL_MAX_FIXES, type=int), SPATIAL_MAX_FIXES)
+        if limit < 1: raise QueryError("limit doit être >= 1")
+        t0 = time.perf_counter()
+        if kind == 'bbox':
+            bbox = parse_bbox(request.args.get('bbox'))
+            if bbox is None: raise QueryError("Paramètre 'bbox' requis (ouest,sud,est,nord)")
+            west, south, east, north = bbox
+            conn = sqlite3.connect(DB_FILENAME)
+            total, fixes = fixes_in_bbox(conn, south, north, west, east, start, end, flight, limit)
+        elif kind == 'radius':
+            lat, lon = _parse_position()
+            radius = parse_float(request.args.get('radius_m'), 'radius_m')
+            if radius is None or radius <= 0: raise QueryError("Paramètre 'radius_m' requis (> 0)")
+            conn = sqlite3.connect(DB_FILENAME)
+            total, fixes = fixes_in_radius(conn, lat, lon, radius, start, end, flight, limit)
+        elif kind == 'nearest':
+            lat, lon = _parse_position()
+            k = min(request.args.get('k', 1, type=int), SPATIAL_MAX_NEAREST, limit)
+            if k < 1: raise QueryError("k doit être >= 1")
+            max_radius = parse_float(request.args.get('max_radius_m'), 'max_radius_m')
+            conn = sqlite3.connect(DB_FILENAME)
+            fixes = (nearest_fixes(conn, lat, lon, k, start, end, flight) if max_radius is None
+                     else nearest_fixes(conn, lat, lon, k, start, end, flight, max_radius))
+            total = len(fixes)
+        else:
+            return jsonify({'error': f"Requête spatiale inconnue: {kind} (bbox, radius, nearest)"}), 404
+        return jsonify({'count': total, 'truncated': total > len(fixes), 'fixes': fixes,
+                        'elapsed_ms': round((time.perf_counter() - t0) * 1000, 1)})
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        log_db.error("ERREUR DB (api spatial): %s", e)
+        return jsonify({'error': f"Erreur base de données: {e}"}), 500
+    finally:
+        if conn: conn.close()
+
+@app.route('/api/flights')
+def api_flights():
+    """Vols configurés et leurs récepteurs (statut, paquets reçus, dernier point)."""
+    result = []
+    for flight in flights.values():
+        with flight.lock: last = flight.latest.timestamp
+        result.append({'flight_id': flight.flight_id, 'default': flight.flight_id == DEFAULT_FLIGHT,
+                       'last_timestamp': last,
+                       'receivers': [{'receiver_id': p.receiver_id, 'source': p.describe(), 'packets': p.packets,
+                                      'framing': dict(p.framer.stats),
+                                      'status': (broadcaster.current_status(p.receiver_id) or {}).get('status')}
+                                     for p in flight.receivers]})
+    return jsonify(result)
+
+@app.route('/api/receivers')
+def api_receivers():
+    """Couverture par récepteur (?flight=&start=&end=): part des paquets entendus, RSSI / SNR, doublons."""
+    conn = None
+    try:
+        start, end = parse_float(request.args.get('start'), 'start'), parse_float(request.args.get('end'), 'end')
+        flight = request.args.get('flight') or None
+        conn = sqlite3.connect(DB_FILENAME)
+        coverage = receiver_coverage(conn, start, end, flight)
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        log_db.error("ERREUR DB (api receivers): %s", e)
+        return jsonify({'error': 'Erreur base de données'}), 500
+    finally:
+        if conn: conn.close()
+    live = {f.flight_id: f.dedup.stats() for f in flights.values() if flight is None or f.flight_id == flight}
+    return jsonify({'receivers': coverage, 'live': live})
+
+@app.route('/api/db_stats')
+def db_stats():
+    """Métriques de l'écrivain DB (profondeur de file, pertes, taille des lots...)."""
+    if db_writer is None: return jsonify({'error': 'écrivain DB non démarré'}), 503
+    return jsonify(db_writer.stats())
+
+@app.route('/api/broadcast_stats')
+def broadcast_stats():
+    """Métriques du diffuseur (clients, trames envoyées/abandonnées, retards d'acquittement)."""
+    return jsonify(broadcaster.stats())
+
+def collect_metrics():
+    """Collecteur metrics.py: compteurs déjà tenus par les sources, l'écrivain DB, le diffuseur, le journal."""
+    now = time.time()
+    by_receiver = lambda value: {(p.flight_id, p.receiver_id): value(p) for p in pipelines}
+    yield ('balloon_lines_total', 'counter', "Lignes lues", ('flight', 'receiver'), by_receiver(lambda p: p.lines))
+    yield ('balloon_packets_total', 'counter', "Trames de paquet reçues (doublons compris)", ('flight', 'receiver'),
+           by_receiver(lambda p: p.packets))
+    yield ('balloon_frame_timeouts_total', 'counter', "Trames fermées par délai (fin de trame manquante)",
+           ('flight', 'receiver'), by_receiver(lambda p: p.framer.stats['timeouts']))
+    yield ('balloon_frames_missing_link_total', 'counter', "Trames sans RSSI / SNR", ('flight', 'receiver'),
+           by_receiver(lambda p: p.framer.stats['missing_link']))
+    dedup = {f.flight_id: f.dedup.stats() for f in flights.values()}
+    yield ('balloon_duplicates_total', 'counter', "Paquets déjà reçus par un autre récepteur", ('flight',),
+           {(f,): s['duplicates'] for f, s in dedup.items()})
+    ages = {}
+    for flight in flights.values():
+        with flight.lock: last = flight.latest.timestamp
+        ages[(flight.flight_id,)] = round(now - last, 3) if last else None
+    yield ('balloon_last_packet_age_seconds', 'gauge', "Secondes depuis le dernier paquet du vol", ('flight',), ages)
+    yield ('balloon_packets_per_second', 'gauge', "Paquets stockés par seconde (10 s glissantes)", (),
+           {(): round(PACKET_RATE.rate(10), 3)})
+    if db_writer is not None:
+        db = db_writer.stats()
+        yield ('balloon_db_queue_depth', 'gauge', "Lignes en attente d'écriture", (), {(): db['queue_depth']})
+        yield ('balloon_db_queue_high_water', 'gauge', "Profondeur max observée de la file DB", (),
+               {(): db['queue_high_water']})
+        yield ('balloon_db_rows_total', 'counter', "Lignes de l'écrivain DB par issue", ('outcome',),
+               {('written',): db['written'], ('dropped',): db['dropped'], ('blocked',): db['blocked']})
+        yield ('balloon_db_errors_total', 'counter', "Erreurs SQLite de l'écrivain", (), {(): db['errors']})
+        yield ('balloon_db_retries_total', 'counter', "Lots retentés (base verrouillée)", (), {(): db['retries']})
+    sent = broadcaster.stats()
+    yield ('balloon_socket_clients', 'gauge', "Clients Socket.IO connectés", (), {(): sent['clients']})
+    yield ('balloon_chasers', 'gauge', "Chasseurs enregistrés (register_chaser)", ('flight',),
+           {(f,): chasers.count(f) for f in flights})
+    yield ('balloon_socket_frames_total', 'counter', "Trames de télémétrie diffusées", ('outcome',),
+           {('sent',): sent['frames_sent'], ('dropped',): sent['frames_dropped']})
+    if ARCHIVE_DIR and archive.available():
+        yield ('balloon_archive_rows_total', 'counter', "Lignes déplacées de SQLite vers l'archive Parquet", (),
+               {(): archive_stats['rows']})
+        yield ('balloon_archive_segments_total', 'counter', "Segments Parquet écrits", (),
+               {(): archive_stats['segments']})
+        yield ('balloon_archive_errors_total', 'counter', "Rollovers en erreur", (), {(): archive_stats['errors']})
+    if binlog_writer is not None:
+        written = binlog_writer.stats()
+        yield ('balloon_binlog_records_total', 'counter', "Lignes ajoutées au journal binaire", (),
+               {(): written['records']})
+        yield ('balloon_binlog_errors_total', 'counter', "Erreurs d'écriture du journal binaire", (),
+               {(): written['errors']})
+    if journal is not None:
+        written = journal.stats()
+        yield ('balloon_journal_records_total', 'counter', "Lignes ajoutées au journal brut", (),
+               {(): written['records']})
+        yield ('balloon_journal_errors_total', 'counter', "Erreurs d'écriture du journal brut", (),
+               {(): written['errors']})
+
+metrics.register_collector(collect_metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Métriques au format texte Prometheus (latences par étape, débits, erreurs, file DB, clients)."""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/status')
+def api_status():
+    """Mêmes métriques en JSON: débit, latences p50/p95/p99 par étape, erreurs de décodage, file DB, clients."""
+    return jsonify(metrics.snapshot())
+
+@app.route('/api/logs')
+def api_logs():
+    """Vidage du tampon circulaire de logs.
+
+    ?level=debug|info|...   niveau minimal      ?component=serial|parser|db|socket
+    ?since=                 timestamp Unix      ?limit=N (derniers N messages)
+    ?format=text            texte brut au lieu de JSON
+    """
+    if logs.ring is None: return jsonify({'error': 'journalisation non configurée'}), 503
+    try:
+        since = parse_float(request.args.get('since'), 'since')
+        limit = min(request.args.get('limit', API_MAX_LOG_ENTRIES, type=int), API_MAX_LOG_ENTRIES)
+        entries = logs.ring.dump(request.args.get('level'), request.args.get('component'), since, limit)
+    except (QueryError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if request.args.get('format') == 'text':
+        return Response(logs.format_entries(entries), mimetype='text/plain; charset=utf-8')
+    return jsonify({'levels': logs.levels(), 'capacity': logs.ring.entries.maxlen,
+                    'overwritten': logs.ring.overwritten, 'entries': entries})
+
+@app.route('/api/logs/level', methods=['POST'])
+def api_logs_level():
+    """Change le niveau d'un composant à chaud: {"component": "serial", "level": "debug"}."""
+    data = request.get_json(silent=True) or request.form
+    try:
+        logs.set_level(data.get('component', ''), data.get('level', ''))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    log.info("Niveau de log %s -> %s", data.get('component') or 'balloon', str(data.get('level')).upper())
+    return jsonify(logs.levels())
 
-    # Envoyer le statut série actuel
-    status = 'disconnected'; message = current_state.get('error', 'État inconnu')
-    port_status = SERIAL_PORT
-    if ser and ser.is_open: status = 'connected'; message = None
-    elif latest_data.get('error'): status = 'error' # Utiliser l'erreur de latest_data si présente
-    emit('serial_status', {'status': status, 'port': port_status, 'message': message}, room=sid)
+# --- Gestion SocketIO ---
 
-    print(f"État initial et historique DB ({len(history_to_send)} points) envoyés à {sid}")
+def read_history_since(flight, timestamp):
+    """Points manqués par un client qui se reconnecte (tampon mémoire du vol, sinon base)."""
+    points = flight.history.since(timestamp)
+    if points is not None: return points[-HISTORY_RESUME_MAX:]
+    conn = None
+    try:
+        conn = sqlite3.connect(DB_FILENAME)
+        cursor = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM telemetry WHERE flight_id = ? AND timestamp > ? "
+                              f"ORDER BY timestamp DESC LIMIT ?", (flight.flight_id, timestamp, HISTORY_RESUME_MAX))
+        return [dict(zip(COLUMNS, row)) for row in reversed(cursor.fetchall())]
+    except sqlite3.Error as e:
+        log_db.error("ERREUR DB (history since): %s", e)
+        return []
+    finally:
+        if conn: conn.close()
+
+def flight_state_events(flight, since=None):
+    """Dernier point, historique (complet ou depuis `since`), statuts et prédiction d'un vol.
+
+    Retourne ([(événement, payload), ...], nombre de points d'historique); partagé
+    par le serveur threading (send_flight_state) et le serveur asyncio (aio_server.py).
+    """
+    with flight.lock: current_state = flight.latest.as_dict()
+    events = [('update_data', current_state)] # Dernier point connu
+    if isinstance(since, (int, float)):
+        history_to_send = read_history_since(flight, since)
+        events.append(('history_since', {'since': since, 'points': history_to_send}))
+    else:
+        history_to_send = flight.history.snapshot() # Liste partagée, pas de requête DB
+        events.append(('initial_history', history_to_send))
+    # Statut de chaque récepteur du vol (dernier diffusé, sinon en attente de connexion)
+    for pipeline in flight.receivers:
+        status = broadcaster.current_status(pipeline.receiver_id)
+        events.append(('serial_status', status or pipeline.status('disconnected', current_state.get('error'))))
+    if flight.predictor.last: events.append(('prediction_update', flight.predictor.last))
+    return events, len(history_to_send)
+
+def send_flight_state(sid, flight, since=None):
+    events, count = flight_state_events(flight, since)
+    for event, payload in events: emit(event, payload, room=sid)
+    return count
+
+def join_flight(sid, flight):
+    """Place le client dans la salle du vol (et le retire de celle du vol précédent)."""
+    for room in rooms(sid):
+        if room.startswith('flight:') and room != flight.room: leave_room(room, sid)
+    join_room(flight.room, sid)
+
+# <<< MODIFIÉ: handle_connect sert l'historique du vol suivi depuis son tampon mémoire >>>
+@socketio.on('connect')
+def handle_connect(auth=None):
+    sid = request.sid; log_socket.info("Client connecté: %s", sid)
+    auth = auth if isinstance(auth, dict) else {}
+    # Protocole compact optionnel: io({auth: {proto: 'delta'}}); sinon JSON (défaut, inchangé)
+    protocol = auth.get('proto', 'json')
+    # Vol suivi: io({auth: {flight: 'b2'}}), sinon le vol principal
+    flight = flights.get(auth.get('flight')) or flights[DEFAULT_FLIGHT]
+    join_flight(sid, flight)
+    # Reprise: io({auth: {since: <dernier timestamp reçu>}}) -> seulement les points manqués
+    count = send_flight_state(sid, flight, auth.get('since'))
+    if protocol == 'delta': emit('protocol', {'mode': 'delta', 'layout': wire_layout()}, room=sid)
+    broadcaster.add_client(sid, protocol, flight.flight_id) # Trames suivantes via le diffuseur (débit limité)
+
+    log_socket.debug("État initial et historique (%d points, vol %s) envoyés à %s", count, flight.flight_id, sid)
+
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Change de vol suivi: {'flight': id[, 'since': ts]} -> état et historique du nouveau vol."""
+    data = data or {}
+    flight = flights.get(data.get('flight'))
+    if flight is None: return {'ok': False, 'error': f"Vol inconnu: {data.get('flight')}"}
+    sid = request.sid
+    join_flight(sid, flight)
+    send_flight_state(sid, flight, data.get('since'))
+    broadcaster.set_flight(sid, flight.flight_id)
+    chasers.set_flight(sid, flight.flight_id)
+    return {'ok': True, 'flight': flight.flight_id}
+
+def chase_snapshot(sid, flight):
+    """'chase_update' d'un chasseur qui vient de s'enregistrer, calculé sur le dernier point du vol."""
+    with flight.lock: latest = flight.latest
+    return chasers.update(flight.flight_id, latest, flight.predictor.last, sid)
+
+@socketio.on('register_chaser')
+def handle_register_chaser(data):
+    """Le client partage sa position {'lat', 'lon'[, 'alt', 'speed_kmh']}: 'chase_update' à chaque fix du ballon."""
+    try: position = parse_position(data)
+    except ValueError as e: return {'ok': False, 'error': str(e)}
+    sid = request.sid
+    flight = next((f for f in flights.values() if f.room in rooms(sid)), flights[DEFAULT_FLIGHT])
+    chasers.register(sid, flight.flight_id, *position)
+    for _sid, payload in chase_snapshot(sid, flight): emit('chase_update', payload, room=sid)
+    return {'ok': True, 'flight': flight.flight_id}
+
+@socketio.on('unregister_chaser')
+def handle_unregister_chaser():
+    return {'ok': chasers.unregister(request.sid)}
+
+
+@socketio.on('set_protocol')
+def handle_set_protocol(data):
+    """Bascule JSON <-> deltas binaires ('update_bin') en cours de session."""
+    mode = (data or {}).get('mode', 'json')
+    if mode not in PROTOCOLS or not broadcaster.set_protocol(request.sid, mode):
+        return {'ok': False, 'error': f"Protocole inconnu: {mode}"}
+    if mode == 'delta': emit('protocol', {'mode': 'delta', 'layout': wire_layout()}, room=request.sid)
+    return {'ok': True, 'mode': mode}
+
+
+@socketio.on('resync')
+def handle_resync():
+    """Le client a perdu son état delta: la prochaine trame sera une trame clé."""
+    broadcaster.request_keyframe(request.sid)
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print(f"Client déconnecté: {request.sid}")
+    broadcaster.remove_client(request.sid)
+    chasers.unregister(request.sid)
+    log_socket.info("Client déconnecté: %s", request.sid)
+
+def load_flights():
+    """Recharge l'historique mémoire et le prédicteur de chaque vol (redémarrage en vol)."""
+    with sqlite3.connect(DB_FILENAME) as conn:
+        for flight in flights.values():
+            loaded = flight.history.load(DB_FILENAME, flight.flight_id)
+            # Vents et sol du vol en cours
+            primed = flight.predictor.prime(conn, PREDICTION_PRIME_ROWS, flight.flight_id)
+            log.info("Vol %s: %d points d'historique, %d points relus par le prédicteur.", flight.flight_id, loaded, primed)
 
 # --- Démarrage ---
 if __name__ == '__main__':
+    logs.configure()  # Console + tampon circulaire (BALLOON_LOG_LEVEL, BALLOON_LOG)
     ensure_data_dir() # Crée le dossier data/ si besoin
+    start_journal()   # Journal brut des lignes reçues (avant tout décodage)
     init_db()         # Crée/Vérifie la base de données et la table
-    print("Démarrage serveur + thread série (Mode Multi-Lignes + SQLite)...")
-    serial_thread = threading.Thread(target=serial_reader_task, daemon=True)
-    serial_thread.start()
-    print(f"Serveur prêt sur http://0.0.0.0:5000 (Debug Flask/SocketIO: {DEBUG_MODE})")
+    start_db_writer() # Thread unique d'écriture SQLite (WAL + commits groupés)
+    broadcaster.start() # Thread de diffusion Socket.IO
+    load_flights()    # Historique mémoire + prédicteur de chaque vol
+    start_archiver()  # Heures anciennes -> archive Parquet (si pyarrow)
+    log.info("Démarrage serveur + %d thread(s) de lecture (Mode Multi-Lignes + SQLite)...", len(pipelines))
+    for pipeline in pipelines:
+        pipeline.thread = threading.Thread(target=serial_reader_task, args=(pipeline,),
+                                           name=f"reader-{pipeline.receiver_id}", daemon=True)
+        pipeline.thread.start()
+    log.info("Serveur prêt sur http://0.0.0.0:%d (Debug Flask/SocketIO: %s)", SERVER_PORT, DEBUG_MODE)
     try:
-        socketio.run(app, host='0.0.0.0', port=5000, debug=DEBUG_MODE, use_reloader=False, allow_unsafe_werkzeug=True)
-    except KeyboardInterrupt: print("Arrêt demandé...")
+        socketio.run(app, host='0.0.0.0', port=SERVER_PORT, debug=DEBUG_MODE, use_reloader=False, allow_unsafe_werkzeug=True)
+    except KeyboardInterrupt: log.info("Arrêt demandé...")
     finally:
-        print("Signalisation arrêt thread..."); stop_thread.set()
-        if serial_thread: serial_thread.join(timeout=2); print(f"Thread série encore vivant: {serial_thread.is_alive()}")
-        print("Serveur arrêté.")
\ No newline at end of file
+        log.info("Signalisation arrêt thread..."); stop_thread.set()
+        for pipeline in pipelines:
+            if pipeline.thread:
+                pipeline.thread.join(timeout=2)
+                if pipeline.thread.is_alive(): log_serial.warning("Thread série %s encore vivant", pipeline.receiver_id)
+        if db_writer: db_writer.stop(); log_db.info("Écrivain DB vidé et arrêté.")
+        if binlog_writer: binlog_writer.close()
+        if journal: journal.close(); log_db.info("Journal brut synchronisé et fermé.")
+        broadcaster.stop()
+        log.info("Serveur arrêté.")
\ No newline at end of file
@@ -0,0 +1,358 @@
+# archive.py - Archive froide de la table telemetry en Parquet (colonnes compressées)
+#
+# telemetry ne garde que la partie chaude. Le rollover écrit chaque heure
+# complète plus ancienne que ARCHIVE_AFTER_S, vol par vol, dans un fichier
+# Parquet (zstd, statistiques min/max par groupe de lignes):
+#   data/archive/<vol>/<AAAA-MM-JJ>/<HH>.parquet
+# puis, dans UNE transaction, l'inscrit au manifeste archive_segments (bornes
+# de temps, ids, nombre de lignes, min/max par colonne) et supprime ces lignes
+# de SQLite. Le manifeste fait foi: un fichier qu'il ne cite pas (arrêt entre
+# l'écriture et le COMMIT) est ignoré et l'heure sera réarchivée.
+#
+# Lecture: le manifeste écarte les fichiers hors fenêtre sans les ouvrir, puis
+# les statistiques Parquet écartent les groupes de lignes (filtres pyarrow).
+# Les lignes gardent leur id: la clé (timestamp, id) de la pagination,
+# telemetry_derived et flight_events restent valables après archivage.
+# queries.py, export.py et rollups.py fusionnent archive et partie chaude.
+# Les agrégats (rollups), les réceptions et les dérivées restent dans SQLite.
+#
+# pyarrow est optionnel: sans lui, pas de rollover (tout reste dans SQLite);
+# une base qui a déjà des segments lève ArchiveError à la lecture.
+#
+# CLI:  python archive.py rollover --db data/balloon_data.db [--before TS] [--vacuum]
+#       python archive.py list --db data/balloon_data.db [--flight VOL]
+
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError: # Archive désactivée
+    pa = pc = pq = None
+
+from telemetry import TELEMETRY_SCHEMA, COLUMNS, NUMERIC_COLUMNS
+
+log = logging.getLogger('balloon.db')
+
+SEGMENT_SECONDS = 3600       # Un fichier par vol et par heure
+COMPRESSION = 'zstd'
+ROW_GROUP_ROWS = 64 * 1024   # Lignes par groupe (unité des statistiques min/max)
+
+CREATE_SEGMENTS_SQL = """
+CREATE TABLE IF NOT EXISTS archive_segments (
+    path TEXT PRIMARY KEY,
+    flight_id TEXT,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    first_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    stats TEXT,
+    created_at REAL NOT NULL
+)"""
+
+Segment = namedtuple('Segment', 'path flight_id start_ts end_ts first_id last_id rows bytes stats')
+
+
+class ArchiveError(sqlite3.Error):
+    """Segment illisible (pyarrow absent, fichier manquant): erreur de stockage comme une erreur SQLite."""
+
+
+def available():
+    return pq is not None
+
+
+def init_archive(conn):
+    conn.execute(CREATE_SEGMENTS_SQL)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_archive_time ON archive_segments (start_ts, end_ts)")
+
+
+def _arrow_type(sql_type):
+    if sql_type.startswith('INTEGER'): return pa.int64()
+    if sql_type.startswith('TEXT'): return pa.string()
+    return pa.float64()
+
+
+def arrow_types():
+    """Colonne -> type Arrow, id compris (même ordre que la table)."""
+    types = {'id': pa.int64()}
+    types.update((name, _arrow_type(sql_type)) for name, sql_type in TELEMETRY_SCHEMA)
+    return types
+
+
+def _array(values, arrow_type):
+    try: return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Typage dynamique de SQLite: un REAL dans une colonne INTEGER reste un REAL
+        return pa.array(values, type=pa.float64())
+
+
+def rows_to_table(rows, columns, types=None):
+    """Lignes (tuples, ordre `columns`) -> pa.Table typée."""
+    types = types or arrow_types()
+    data = list(zip(*rows)) if rows else [()] * len(columns)
+    return pa.table([_array(list(values), types.get(c, pa.string())) for c, values in zip(columns, data)],
+                    names=list(columns))
+
+
+# --- Manifeste ---
+def base_dir(conn):
+    """Dossier de la base: les chemins du manifeste y sont relatifs (base déplaçable avec son archive)."""
+    for _seq, name, filename in conn.execute("PRAGMA database_list"):
+        if name == 'main' and filename: return os.path.dirname(filename)
+    return os.getcwd()
+
+
+def segments(conn, start=None, end=None, flight=None):
+    """Segments qui recoupent la fenêtre, par début croissant (chemins absolus)."""
+    clauses, params = [], []
+    if flight is not None: clauses.append("flight_id = ?"); params.append(flight)
+    if start is not None: clauses.append("end_ts >= ?"); params.append(start)
+    if end is not None: clauses.append("start_ts <= ?"); params.append(end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    try:
+        rows = conn.execute(f"SELECT path, flight_id, start_ts, end_ts, first_id, last_id, rows, bytes, stats "
+                            f"FROM archive_segments {where} ORDER BY start_ts, first_id", params).fetchall()
+    except sqlite3.OperationalError: # Base jamais initialisée par init_db
+        return []
+    base = base_dir(conn)
+    return [Segment(os.path.join(base, row[0]), *row[1:8], json.loads(row[8]) if row[8] else {}) for row in rows]
+
+
+def extent(conn, flight=None):
+    """(premier, dernier) timestamp archivés, (None, None) sans archive."""
+    where, params = ("WHERE flight_id = ?", (flight,)) if flight is not None else ("", ())
+    try: return conn.execute(f"SELECT MIN(start_ts), MAX(end_ts) FROM archive_segments {where}", params).fetchone()
+    except sqlite3.OperationalError: return (None, None)
+
+
+def count(conn, start=None, end=None, flight=None):
+    """Estimation des lignes archivées de la fenêtre: au prorata du temps couvert pour un segment entamé."""
+    total = 0.0
+    for s in segments(conn, start, end, flight):
+        lo = s.start_ts if start is None else max(s.start_ts, start)
+        hi = s.end_ts if end is None else min(s.end_ts, end)
+        span = s.end_ts - s.start_ts
+        total += s.rows if span <= 0 or hi - lo >= span else s.rows * max(0.0, hi - lo) / span
+    return round(total)
+
+
+# --- Lecture ---
+def _require():
+    if pq is None: raise ArchiveError("Segments archivés présents mais pyarrow n'est pas installé")
+
+
+def _after(table, cursor):
+    """Lignes strictement après le curseur (timestamp, id) de la pagination."""
+    ts = table.column('timestamp')
+    return table.filter(pc.or_(pc.greater(ts, cursor[0]),
+                               pc.and_(pc.equal(ts, cursor[0]), pc.greater(table.column('id'), cursor[1]))))
+
+
+def _read_segment(segment, columns, start=None, end=None, filters=()):
+    """Colonnes d'un segment; celles absentes du fichier (schéma plus récent) sont nulles."""
+    types = arrow_types()
+    try:
+        present = set(pq.read_schema(segment.path).names)
+        filters = [f for f in (('timestamp', '>=', start) if start is not None else None,
+                               ('timestamp', '<=', end) if end is not None else None) if f] + list(filters)
+        table = pq.read_table(segment.path, columns=[c for c in columns if c in present], filters=filters or None)
+    except (OSError, pa.ArrowException) as e:
+        raise ArchiveError(f"Segment illisible {segment.path}: {e}")
+    for c in columns:
+        if c not in present: table = table.append_column(c, pa.nulls(table.num_rows, types.get(c, pa.string())))
+    return table.select(list(columns))
+
+
+def _read_group(group, columns, start, end, after):
+    """Segments qui se chevauchent -> une table triée par (timestamp, id)."""
+    tables = [_read_segment(s, columns, start, end) for s in group]
+    table = tables[0] if len(tables) == 1 else pa.concat_tables(tables, promote_options='permissive')
+    if after is not None: table = _after(table, after)
+    return table.sort_by([('timestamp', 'ascending'), ('id', 'ascending')])
+
+
+def _groups(selected):
+    """Regroupe les segments dont les intervalles de temps se recoupent (vols simultanés, réarchivage)."""
+    group, group_end = [], None
+    for segment in selected:
+        if group and segment.start_ts > group_end:
+            yield group
+            group = []
+        group_end = segment.end_ts if not group else max(group_end, segment.end_ts)
+        group.append(segment)
+    if group: yield group
+
+
+def _with_keys(columns):
+    return tuple(columns) + tuple(k for k in ('timestamp', 'id') if k not in columns)
+
+
+def read_table(conn, columns, start=None, end=None, flight=None):
+    """Lignes archivées de la fenêtre (pa.Table triée par (timestamp, id)), None sans segment."""
+    selected = segments(conn, start, end, flight)
+    if not selected: return None
+    _require()
+    needed = _with_keys(columns)
+    tables = [_read_group(group, needed, start, end, None) for group in _groups(selected)]
+    return pa.concat_tables(tables, promote_options='permissive').select(list(columns))
+
+
+def iter_rows(conn, columns, start=None, end=None, flight=None, after=None):
+    """Génère les tuples archivés (ordre `columns`) triés par (timestamp, id), après le curseur `after`.
+
+    Paresseux: un groupe de segments est lu seulement quand le précédent est épuisé.
+    """
+    if after is not None: start = after[0] if start is None else max(start, after[0])
+    selected = segments(conn, start, end, flight)
+    if not selected: return
+    _require()
+    needed = _with_keys(columns)
+    for group in _groups(selected):
+        table = _read_group(group, needed, start, end, after).select(list(columns))
+        yield from zip(*(column.to_pylist() for column in table.columns))
+
+
+def read_bbox(conn, columns, south, north, west, east, start=None, end=None, flight=None):
+    """Lignes archivées dont le fix GPS tombe dans l'emprise (pa.Table non triée), None si aucune.
+
+    Les min/max latitude/longitude du manifeste écartent les segments sans les
+    ouvrir; les statistiques Parquet écartent ensuite les groupes de lignes.
+    """
+    def overlaps(stats):
+        lat, lon = stats.get('latitude'), stats.get('longitude')
+        return lat and lon and lat[1] >= south and lat[0] <= north and lon[1] >= west and lon[0] <= east
+    selected = [s for s in segments(conn, start, end, flight) if overlaps(s.stats)]
+    if not selected: return None
+    _require()
+    box = [('latitude', '>=', south), ('latitude', '<=', north), ('longitude', '>=', west), ('longitude', '<=', east)]
+    tables = [_read_segment(s, columns, start, end, box) for s in selected]
+    table = tables[0] if len(tables) == 1 else pa.concat_tables(tables, promote_options='permissive')
+    return table if table.num_rows else None
+
+
+def to_numpy(table, column):
+    """Colonne Arrow -> tableau float64 (null -> NaN), comme queries.fetch_columns."""
+    return pc.fill_null(pc.cast(table.column(column), pa.float64()), float('nan')).to_numpy()
+
+
+# --- Rollover ---
+def _safe_name(value):
+    return re.sub(r'[^\w.-]', '_', value) if value else '_'
+
+
+def _segment_path(directory, flight, hour_start):
+    stamp = datetime.fromtimestamp(hour_start, timezone.utc)
+    folder = os.path.join(directory, _safe_name(flight), stamp.strftime('%Y-%m-%d'))
+    os.makedirs(folder, exist_ok=True)
+    path, n = os.path.join(folder, stamp.strftime('%H.parquet')), 0
+    while os.path.exists(path): # Heure déjà archivée (lignes arrivées en retard): nouveau segment
+        n += 1
+        path = os.path.join(folder, stamp.strftime(f'%H-{n}.parquet'))
+    return path
+
+
+def _stats(table):
+    """{colonne: [min, max]} des colonnes numériques non vides (élagage sans ouvrir le fichier)."""
+    result = {}
+    for c in NUMERIC_COLUMNS + ('id',):
+        mm = pc.min_max(table.column(c))
+        if mm['min'].is_valid: result[c] = [mm['min'].as_py(), mm['max'].as_py()]
+    return result
+
+
+def archive_hour(conn, directory, flight, hour_start):
+    """Archive une heure d'un vol. Retourne le Segment écrit, None si rien à archiver."""
+    hour_end = hour_start + SEGMENT_SECONDS
+    names = ('id',) + COLUMNS
+    rows = conn.execute(f"SELECT {', '.join(names)} FROM telemetry WHERE flight_id IS ? "
+                        f"AND timestamp >= ? AND timestamp < ? ORDER BY timestamp, id",
+                        (flight, hour_start, hour_end)).fetchall()
+    if not rows: return None
+    table = rows_to_table(rows, names)
+    path = _segment_path(directory, flight, hour_start)
+    tmp = path + '.tmp'
+    pq.write_table(table, tmp, compression=COMPRESSION, row_group_size=ROW_GROUP_ROWS, write_statistics=True)
+    os.replace(tmp, path)
+    ids = table.column('id')
+    segment = Segment(path, flight, rows[0][1], rows[-1][1], pc.min(ids).as_py(), pc.max(ids).as_py(),
+                      len(rows), os.path.getsize(path), _stats(table))
+    try:
+        with conn:
+            conn.execute("INSERT INTO archive_segments (path, flight_id, start_ts, end_ts, first_id, last_id, "
+                         "rows, bytes, stats, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (os.path.relpath(path, base_dir(conn)), flight, segment.start_ts, segment.end_ts,
+                          segment.first_id, segment.last_id, segment.rows, segment.bytes,
+                          json.dumps(segment.stats), time.time()))
+            # Les lignes insérées depuis la lecture ont un id plus grand (AUTOINCREMENT): elles restent
+            conn.execute("DELETE FROM telemetry WHERE flight_id IS ? AND timestamp >= ? AND timestamp < ? "
+                         "AND id <= ?", (flight, hour_start, hour_end, segment.last_id))
+    except sqlite3.Error:
+        os.remove(path)
+        raise
+    return segment
+
+
+def rollover(conn, directory, before):
+    """Archive toutes les heures complètes avant `before` (timestamp). Retourne les Segments écrits."""
+    if pq is None: return []
+    cutoff = (before // SEGMENT_SECONDS) * SEGMENT_SECONDS
+    hours = conn.execute(f"SELECT DISTINCT flight_id, CAST(timestamp / {SEGMENT_SECONDS} AS INTEGER) "
+                         f"FROM telemetry WHERE timestamp < ? ORDER BY 2", (cutoff,)).fetchall()
+    written = []
+    for flight, hour in hours:
+        segment = archive_hour(conn, directory, flight, hour * SEGMENT_SECONDS)
+        if segment:
+            written.append(segment)
+            log.debug("Archivé %s: %d lignes, %d octets", segment.path, segment.rows, segment.bytes)
+    return written
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive Parquet de la table telemetry")
+    sub = parser.add_subparsers(dest='command', required=True)
+    roll = sub.add_parser('rollover', help="Archive les heures complètes avant --before")
+    roll.add_argument('--db', required=True)
+    roll.add_argument('--dir', help="Dossier de l'archive (défaut: archive/ à côté de la base)")
+    roll.add_argument('--before', type=float, default=None, help="Timestamp Unix (défaut: maintenant)")
+    roll.add_argument('--vacuum', action='store_true', help="VACUUM ensuite (rend la place libérée au disque)")
+    listing = sub.add_parser('list', help="Segments du manifeste")
+    listing.add_argument('--db', required=True)
+    listing.add_argument('--flight', default=None)
+    args = parser.parse_args(argv)
+
+    with sqlite3.connect(args.db, timeout=30) as conn:
+        init_archive(conn)
+        if args.command == 'rollover':
+            if pq is None: parser.error("pyarrow n'est pas installé")
+            directory = args.dir or os.path.join(base_dir(conn), 'archive')
+            t0 = time.perf_counter()
+            written = rollover(conn, directory, time.time() if args.before is None else args.before)
+            print(f"{len(written)} segment(s), {sum(s.rows for s in written)} lignes, "
+                  f"{sum(s.bytes for s in written)} octets en {time.perf_counter() - t0:.2f} s")
+            if args.vacuum: conn.execute("VACUUM")
+        else:
+            total_rows = total_bytes = 0
+            for s in segments(conn, flight=args.flight):
+                print(f"{s.flight_id}\t{_iso(s.start_ts)} .. {_iso(s.end_ts)}\t{s.rows}\t{s.bytes}\t{s.path}")
+                total_rows += s.rows; total_bytes += s.bytes
+            print(f"total: {total_rows} lignes, {total_bytes} octets")
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+if __name__ == '__main__':
+    main()
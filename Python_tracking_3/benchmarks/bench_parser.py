@@ -0,0 +1,117 @@
+# bench_parser.py - Compare l'ancien parse_serial_data (chaîne if/elif) au décodeur par table
+#
+# Usage (depuis Python_tracking_3/):  python benchmarks/bench_parser.py [capture] [répétitions]
+# Les lignes "Donn(e)es brutes: ..." de la capture (défaut: ../Python_tracking_2/serial_log.txt)
+# sont décodées par les deux implémentations; on vérifie qu'elles donnent le même résultat
+# puis on mesure le débit (lignes/s). Le calcul de vitesse est exclu des deux côtés.
+
+import os
+import sys
+import time
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from decoder import RECORD_FIELDS, new_record, decode_into, decode_batch  # noqa: E402
+
+DEFAULT_CAPTURE = os.path.join(HERE, '..', '..', 'Python_tracking_2', 'serial_log.txt')
+
+
+def legacy_parse_serial_data(compact_line):
+    """Copie figée de l'ancien parse_serial_data (sans calcul de vitesse), pour référence."""
+    data = {
+        "timestamp": time.time(), 'latitude': None, 'longitude': None, 'altitude_gps': None,
+        'satellites': None, 'temperature': None, 'pressure': None, 'humidity': None,
+        'altitude_bme': None, 'air_quality': None, 'tvoc': None, 'eco2': None,
+        'ozone': None, 'uv_index': None,
+        'pm1_std': None, 'pm25_std': None, 'pm10_std': None,
+        'rssi': None, 'speed_kmh': None, 'error': None
+    }
+    parts = compact_line.strip().split('|')
+    for part in parts:
+        if not part: continue
+        elements = part.split(',')
+        if len(elements) < 1: continue
+        header = elements[0]; values = elements[1:]
+        try:
+            if header == "GPS" and len(values) >= 6:
+                if values[0] != "ERR":
+                    try:
+                        lat, lon = float(values[0]), float(values[1])
+                        if lat != 0.0 or lon != 0.0:
+                            data['latitude'] = lat; data['longitude'] = lon
+                            data['altitude_gps'] = float(values[2]) if values[2] != "ERR" else None
+                            data['satellites'] = int(values[3]) if values[3] != "ERR" else None
+                    except (ValueError, IndexError): pass
+            elif header == "ENV" and len(values) >= 4:
+                try:
+                    if values[0] != "ERR": data['temperature'] = float(values[0])
+                    if values[1] != "ERR": data['pressure'] = float(values[1])
+                    if values[2] != "ERR": data['humidity'] = float(values[2])
+                    if values[3] != "ERR": data['altitude_bme'] = float(values[3])
+                except (ValueError, IndexError): pass
+            elif header == "AIR" and len(values) >= 3:
+                try:
+                    if values[0] != "ERR": data['air_quality'] = int(values[0])
+                    if values[1] != "ERR": data['tvoc'] = int(values[1])
+                    if values[2] != "ERR": data['eco2'] = int(values[2])
+                except (ValueError, IndexError): pass
+            elif header == "OZ" and len(values) >= 1:
+                try:
+                    if values[0] != "ERR": data['ozone'] = int(values[0])
+                except (ValueError, IndexError): pass
+            elif header == "UV" and len(values) >= 1:
+                try:
+                    if values[0] != "ERR":
+                        uv_val = float(values[0])
+                        if uv_val >= 0: data['uv_index'] = uv_val
+                except (ValueError, IndexError): pass
+            elif header == "PMS" and len(values) >= 3:
+                try:
+                    if values[0] != "ERR": data['pm1_std'] = int(values[0])
+                    if values[1] != "ERR": data['pm25_std'] = int(values[1])
+                    if values[2] != "ERR": data['pm10_std'] = int(values[2])
+                except (ValueError, IndexError): pass
+        except Exception as section_e: print(f"Erreur parsing section {header}: {section_e}")
+    return data
+
+
+def load_lines(path):
+    lines = []
+    with open(path, 'rb') as f:
+        for raw in f:
+            text = raw.decode('utf-8', errors='replace')
+            idx = text.find(' brutes: ')
+            if idx >= 0: lines.append(text[idx + len(' brutes: '):].strip())
+    return lines
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CAPTURE
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    lines = load_lines(path)
+    if not lines:
+        print(f"Aucune ligne de données dans {path}"); return
+    # Vérification d'équivalence avant de mesurer
+    record = new_record()
+    for line in lines:
+        old = legacy_parse_serial_data(line)
+        decoded = dict(zip(RECORD_FIELDS, decode_into(record, line, old['timestamp'])))
+        new = {k: decoded[k] for k in old} # Champs ajoutés depuis (fusion, vol, récepteur...) hors comparaison
+        if old != new:
+            print(f"DIVERGENCE sur [{line}]:\n  ancien={old}\n  nouveau={new}"); return
+
+    n = len(lines) * repeat
+    t_old = min(timeit.repeat(lambda: [legacy_parse_serial_data(l) for l in lines], number=repeat, repeat=3))
+    t_new = min(timeit.repeat(lambda: [decode_into(record, l, 0.0) for l in lines], number=repeat, repeat=3))
+    t_batch = min(timeit.repeat(lambda: decode_batch(lines), number=repeat, repeat=3))
+    print(f"Capture: {path} ({len(lines)} lignes x {repeat})")
+    for label, t in (("ancien parse_serial_data", t_old),
+                     ("decode_into (préalloué)", t_new),
+                     ("decode_batch", t_batch)):
+        print(f"  {label:<26} {n / t:>12,.0f} lignes/s  {t / n * 1e6:6.2f} µs/ligne  x{t_old / t:.2f}")
+
+
+if __name__ == '__main__':
+    main()
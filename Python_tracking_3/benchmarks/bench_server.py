@@ -0,0 +1,157 @@
+# bench_server.py - Compare le serveur threading (app.py) et le serveur asyncio (aio_server.py)
+#
+# Usage (depuis Python_tracking_3/):
+#   python benchmarks/bench_server.py [--mode threading|asyncio|both] [--clients 1000]
+#                                     [--duration 20] [--rate 5] [--transport websocket|polling]
+# Le serveur est lancé dans un sous-processus (base, journal et archive temporaires), alimenté
+# par une source tcp-listen:// dans laquelle le benchmark écrit des paquets
+# synthétiques (ligne de données + RSSI/SNR + fin de trame) à `rate` Hz.
+# N clients Socket.IO asyncio (socketio.AsyncClient, nécessite aiohttp) se
+# connectent puis comptent les update_data reçus. Mesures: durée de connexion,
+# trames reçues par client, latence réception série -> client (p50 / p95),
+# CPU et mémoire du processus serveur (Linux, /proc).
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import socketio
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+SERVERS = {'threading': 'app.py', 'asyncio': 'aio_server.py'}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _proc_usage(pid):
+    """(secondes CPU utilisateur + système, RSS en Mo) du processus, via /proc."""
+    try:
+        with open(f'/proc/{pid}/stat') as f: fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        with open(f'/proc/{pid}/status') as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS')) / 1024
+        return cpu, rss
+    except (OSError, StopIteration, IndexError):
+        return float('nan'), float('nan')
+
+
+def _packet(n, t0):
+    lat, lon = 14.5 + n * 1e-5, -17.07 + n * 1e-5
+    return (f"--- DONNEES RECUES ---\nDonnees brutes: GPS,{lat:.6f},{lon:.6f},{100 + n * 0.5:.1f},9,12:00:00,01/01/25"
+            f"|ENV,25.0,{101325 - n},40.0,{100 + n * 0.5:.1f}|AIR,1,30,400|OZ,20|UV,1.5\n"
+            f"RSSI: -100 | SNR: 5.25\n------------------------\n").encode()
+
+
+async def _feed(port, rate, stop):
+    """Émetteur: connexion à la source tcp-listen:// du serveur, `rate` paquets par seconde."""
+    for _ in range(100):
+        try: reader, writer = await asyncio.open_connection('127.0.0.1', port); break
+        except OSError: await asyncio.sleep(0.1)
+    else: raise RuntimeError("Source tcp-listen du serveur injoignable")
+    n, t0 = 0, time.monotonic()
+    while not stop.is_set():
+        writer.write(_packet(n, t0)); await writer.drain()
+        n += 1
+        await asyncio.sleep(max(0.0, t0 + n / rate - time.monotonic()))
+    writer.close()
+    return n
+
+
+async def _client(url, transport, stats):
+    sio = socketio.AsyncClient(reconnection=False)
+    received, latencies = [0], stats['latencies']
+
+    @sio.on('update_data')
+    async def on_update(data, *_ack):
+        received[0] += 1
+        if data.get('timestamp'): latencies.append(time.time() - data['timestamp'])
+
+    started = time.perf_counter()
+    try:
+        await sio.connect(url, transports=[transport], wait_timeout=30)
+    except Exception as e:
+        stats['failed'] += 1
+        if stats['failed'] == 1: print(f"  connexion refusée: {e}")
+        return None
+    stats['connect_s'].append(time.perf_counter() - started)
+    return sio, received
+
+
+def _percentile(values, q):
+    if not values: return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_mode(mode, clients, duration, rate, transport):
+    http_port, source_port = _free_port(), _free_port()
+    tmp = tempfile.mkdtemp(prefix='bench_server_')
+    # Base, journaux (rejeu, binaire) et archive dans le dossier temporaire: rien sous data/
+    env = dict(os.environ, BALLOON_DB=os.path.join(tmp, 'bench.db'), BALLOON_PORT=str(http_port),
+               BALLOON_JOURNAL=os.path.join(tmp, 'journal'), BALLOON_ARCHIVE=os.path.join(tmp, 'archive'),
+               BALLOON_BINLOG=os.path.join(tmp, 'binlog'),
+               BALLOON_SOURCE=f"tcp-listen://127.0.0.1:{source_port}")
+    server = subprocess.Popen([sys.executable, SERVERS[mode]], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{http_port}"
+    try:
+        stop = asyncio.Event()
+        feeder = asyncio.create_task(_feed(source_port, rate, stop))
+        await asyncio.sleep(1.0) # Le serveur ouvre sa source et commence à recevoir
+        stats = {'latencies': [], 'connect_s': [], 'failed': 0}
+        t0 = time.perf_counter()
+        sessions = []
+        for start in range(0, clients, 100): # Par vagues pour ne pas saturer l'accept()
+            batch = await asyncio.gather(*(_client(url, transport, stats)
+                                           for _ in range(start, min(clients, start + 100))))
+            sessions.extend(s for s in batch if s)
+        connect_all = time.perf_counter() - t0
+        for _, received in sessions: received[0] = 0
+        stats['latencies'].clear()
+        cpu0, _ = _proc_usage(server.pid)
+        await asyncio.sleep(duration)
+        cpu1, rss = _proc_usage(server.pid)
+        counts = [received[0] for _, received in sessions]
+        stop.set()
+        packets = await feeder
+        await asyncio.gather(*(sio.disconnect() for sio, _ in sessions), return_exceptions=True)
+    finally:
+        server.terminate()
+        try: server.wait(timeout=10)
+        except subprocess.TimeoutExpired: server.kill()
+    expected = min(rate, 4.0) * duration # CLIENT_MAX_RATE_HZ = 4 par défaut
+    lat = stats['latencies']
+    print(f"[{mode}] {len(sessions)}/{clients} clients connectés en {connect_all:.1f} s "
+          f"(échecs: {stats['failed']}), {packets} paquets émis")
+    if counts:
+        print(f"  trames/client sur {duration:.0f} s: moy {sum(counts) / len(counts):.1f}, min {min(counts)} "
+              f"(attendu ~{expected:.0f}); latence p50 {_percentile(lat, 0.5) * 1000:.0f} ms, "
+              f"p95 {_percentile(lat, 0.95) * 1000:.0f} ms")
+    print(f"  serveur: CPU {(cpu1 - cpu0) / duration * 100:.0f} % d'un cœur, RSS {rss:.0f} Mo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mode', choices=('threading', 'asyncio', 'both'), default='both')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--rate', type=float, default=5.0, help="paquets LoRa simulés par seconde")
+    parser.add_argument('--transport', choices=('websocket', 'polling'), default='websocket')
+    args = parser.parse_args()
+    modes = ('threading', 'asyncio') if args.mode == 'both' else (args.mode,)
+    for mode in modes:
+        asyncio.run(run_mode(mode, args.clients, args.duration, args.rate, args.transport))
+
+
+if __name__ == '__main__':
+    main()
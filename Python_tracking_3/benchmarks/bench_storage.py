@@ -0,0 +1,141 @@
+# bench_storage.py - Compare SQLite et le journal binaire (binlog.py): débit d'écriture et lecture complète
+#
+# Usage (depuis Python_tracking_3/):  python benchmarks/bench_storage.py [--rows 500000] [--batch 200]
+# Des lignes synthétiques (montée puis descente, capteurs bruités, NULL
+# éparpillés) sont écrites par lots de `batch` lignes, comme l'écrivain DB:
+#   sqlite         executemany + agrégats (rollups) + COMMIT, en WAL
+#   sqlite+binlog  idem + journal binaire après chaque COMMIT
+#   binlog         ajout seul au segment
+# puis relues en colonnes (queries.fetch_columns: SQLite puis np.memmap) et
+# réduites sans copie sur le memmap. On vérifie que les deux lectures sont identiques.
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import binlog  # noqa: E402
+import queries  # noqa: E402
+from rollups import init_rollups, apply_batch  # noqa: E402
+from telemetry import COLUMNS, CREATE_TABLE_SQL, INSERT_SQL  # noqa: E402
+
+SCAN_COLUMNS = ('latitude', 'longitude', 'altitude_gps', 'altitude_bme', 'temperature', 'pressure', 'rssi')
+
+
+def synthetic_rows(n, seed=1):
+    rng = random.Random(seed)
+    t0, lat, lon = 1760000000.0, 45.0, 5.0
+    rows = []
+    for i in range(n):
+        phase = i / n
+        altitude = 30000 * (phase * 2 if phase < 0.5 else (1 - phase) * 2)
+        lat += rng.uniform(-1e-5, 2e-5); lon += rng.uniform(-1e-5, 3e-5)
+        fix = rng.random() > 0.05
+        values = {'timestamp': t0 + i * 1.0, 'latitude': lat if fix else None, 'longitude': lon if fix else None,
+                  'altitude_gps': altitude + rng.gauss(0, 5) if fix else None, 'satellites': rng.randint(4, 12),
+                  'temperature': 20 - altitude / 150 + rng.gauss(0, 0.2), 'pressure': 1013 * 0.88 ** (altitude / 1000),
+                  'humidity': rng.uniform(10, 90), 'altitude_bme': altitude + rng.gauss(0, 15),
+                  'air_quality': rng.randint(1, 5), 'tvoc': rng.randint(0, 500), 'eco2': rng.randint(400, 2000),
+                  'ozone': rng.randint(0, 100), 'uv_index': rng.uniform(0, 11), 'pm1_std': rng.randint(0, 50),
+                  'pm25_std': rng.randint(0, 80), 'pm10_std': rng.randint(0, 120), 'rssi': rng.randint(-120, -40),
+                  'flight_id': 'bench', 'receiver_id': 'rx1', 'packet_key': f"{i:x}", 'snr': rng.uniform(-10, 10)}
+        rows.append(tuple(values.get(c) for c in COLUMNS))
+    return rows
+
+
+def open_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(CREATE_TABLE_SQL)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON telemetry (timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_flight_timestamp ON telemetry (flight_id, timestamp)")
+    init_rollups(conn)
+    conn.commit()
+    return conn
+
+
+def ingest_sqlite(conn, rows, batch, hooks, after_commit=()):
+    t0 = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        chunk = rows[i:i + batch]
+        with conn:
+            conn.executemany(INSERT_SQL, chunk)
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            for hook in hooks: hook(conn, chunk)
+        for callback in after_commit: callback(chunk, last_id)
+    return time.perf_counter() - t0
+
+
+def ingest_binlog(writer, rows, batch):
+    t0 = time.perf_counter()
+    for i in range(0, len(rows), batch): writer.append_rows(rows[i:i + batch], i + 1)
+    return time.perf_counter() - t0
+
+
+def best_of(fn, repeat=3):
+    best, result = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite vs journal binaire: écriture et lecture complète")
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--batch', type=int, default=200, help="Lignes par lot (DB_FLUSH_MAX_ROWS)")
+    args = parser.parse_args()
+
+    print(f"Génération de {args.rows} lignes synthétiques...")
+    rows = synthetic_rows(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"\n{'écriture':<16}{'s':>8}{'lignes/s':>12}{'Mo':>8}")
+        conn = open_db(os.path.join(tmp, 'sqlite.db'))
+        elapsed = ingest_sqlite(conn, rows, args.batch, [apply_batch])
+        size = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp) if f.startswith('sqlite.db'))
+        print(f"{'sqlite':<16}{elapsed:>8.2f}{args.rows / elapsed:>12.0f}{size / 1e6:>8.1f}")
+        conn.close()
+
+        both_dir = os.path.join(tmp, 'both')
+        writer = binlog.BinlogWriter(both_dir)
+        conn = open_db(os.path.join(tmp, 'both.db'))
+        elapsed = ingest_sqlite(conn, rows, args.batch, [apply_batch], [writer.committed])
+        writer.close()
+        print(f"{'sqlite+binlog':<16}{elapsed:>8.2f}{args.rows / elapsed:>12.0f}")
+
+        writer = binlog.BinlogWriter(os.path.join(tmp, 'binlog'))
+        elapsed = ingest_binlog(writer, rows, args.batch)
+        writer.close()
+        size = sum(os.path.getsize(p) for _, p in binlog.segment_paths(os.path.join(tmp, 'binlog')))
+        print(f"{'binlog':<16}{elapsed:>8.2f}{args.rows / elapsed:>12.0f}{size / 1e6:>8.1f}")
+
+        print(f"\n{'lecture complète':<28}{'ms':>10}  ({len(SCAN_COLUMNS)} colonnes)")
+        queries.binlog_reader = None
+        t_sql, (ts_sql, v_sql) = best_of(lambda: queries.fetch_columns(conn, SCAN_COLUMNS))
+        print(f"{'sqlite fetch_columns':<28}{t_sql * 1000:>10.1f}")
+        queries.binlog_reader = reader = binlog.BinlogReader(both_dir)
+        t_bin, (ts_bin, v_bin) = best_of(lambda: queries.fetch_columns(conn, SCAN_COLUMNS))
+        print(f"{'binlog fetch_columns':<28}{t_bin * 1000:>10.1f}  (x{t_sql / t_bin:.0f})")
+        t_view, peak = best_of(lambda: max(float(np.nanmax(records['altitude_gps']))
+                                           for _, records in reader.segments()))
+        print(f"{'memmap nanmax (vue)':<28}{t_view * 1000:>10.1f}")
+        conn.close()
+
+        same = np.array_equal(ts_sql, ts_bin) and all(np.array_equal(v_sql[c], v_bin[c], equal_nan=True)
+                                                      for c in SCAN_COLUMNS)
+        print(f"\nLectures identiques: {'oui' if same else 'NON'} (altitude max {peak:.0f} m)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+# binlog.py - Journal binaire à largeur fixe de la télémétrie, lu par np.memmap
+#
+# Option de stockage à côté de SQLite (STORAGE_BACKEND='sqlite+binlog' dans
+# app.py): chaque ligne commitée dans telemetry est aussi ajoutée, dans le
+# même lot de l'écrivain DB, comme un enregistrement binaire de taille fixe
+# (dtype structuré NumPy, petit-boutiste, sans alignement):
+#   id int64, colonnes REAL en float64 (NULL = NaN),
+#   colonnes INTEGER en int32 (NULL = NULL_INT, le minimum de int32).
+# Les colonnes TEXT ne sont pas stockées: le vol est donné par le dossier
+# (binlog/<vol>/), récepteur et packet_key restent dans SQLite.
+#
+# Segments: binlog/<vol>/seg-<premier id>.btl = en-tête de HEADER_BYTES octets
+# (MAGIC + JSON: vol, champs) puis les enregistrements bout à bout. Un lecteur
+# fait np.memmap(offset=HEADER_BYTES) du segment: tableau structuré sans copie,
+# colonnes accessibles en vues (seg['altitude_gps']). Un enregistrement
+# incomplet en fin de fichier (arrêt brutal) est ignoré par les lecteurs et
+# tronqué par l'écrivain à la réouverture. Un changement de schéma ouvre un
+# nouveau segment; les lecteurs combinent les segments champ par champ.
+#
+# SQLite reste la référence (pagination, exports, dédoublonnage, agrégats);
+# le journal binaire sert les lectures en colonnes (queries.fetch_columns:
+# analyses, séries des graphiques), y compris les heures archivées en Parquet.
+#
+# CLI:  python binlog.py build --db data/balloon_data.db --dir data/binlog
+#       python binlog.py info --dir data/binlog
+
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from telemetry import TELEMETRY_SCHEMA
+
+log = logging.getLogger('balloon.db')
+
+MAGIC = b'BTLOG\x001\n'
+HEADER_BYTES = 4096
+NULL_INT = np.iinfo(np.int32).min
+SEGMENT_BYTES = 64 * 1024 * 1024 # Nouveau segment au-delà (~350 000 enregistrements)
+SEGMENT_SUFFIX = '.btl'
+
+_INT_MAX = np.iinfo(np.int32).max
+
+
+def _field_format(sql_type):
+    if sql_type.startswith('TEXT'): return None
+    return '<i4' if sql_type.startswith('INTEGER') else '<f8'
+
+
+# Champs stockés (id + colonnes numériques), positions dans une ligne d'INSERT_SQL
+FIELDS = [('id', '<i8')] + [(name, _field_format(t)) for name, t in TELEMETRY_SCHEMA if _field_format(t)]
+RECORD_DTYPE = np.dtype(FIELDS)
+_ROW_INDEX = {name: i for i, (name, _) in enumerate(TELEMETRY_SCHEMA)}
+_FLIGHT_INDEX = _ROW_INDEX['flight_id']
+
+
+def _safe_name(value):
+    return re.sub(r'[^\w.-]', '_', value) if value else '_'
+
+
+def _header(flight, dtype):
+    meta = json.dumps({'flight_id': flight, 'fields': [list(f) for f in dtype.descr],
+                       'null_int': int(NULL_INT)}).encode('utf-8')
+    if len(MAGIC) + len(meta) + 1 > HEADER_BYTES: raise ValueError("En-tête de segment trop grand")
+    return MAGIC + meta + b' ' * (HEADER_BYTES - len(MAGIC) - len(meta) - 1) + b'\n'
+
+
+def read_header(path):
+    """(vol, dtype) d'un segment; ValueError si ce n'en est pas un."""
+    with open(path, 'rb') as f: head = f.read(HEADER_BYTES)
+    if len(head) < HEADER_BYTES or not head.startswith(MAGIC): raise ValueError(f"Segment invalide: {path}")
+    meta = json.loads(head[len(MAGIC):].decode('utf-8'))
+    return meta['flight_id'], np.dtype([tuple(f) for f in meta['fields']])
+
+
+def to_records(rows, first_id):
+    """Lignes d'INSERT_SQL (ids consécutifs à partir de first_id) -> tableau structuré RECORD_DTYPE."""
+    records = np.empty(len(rows), dtype=RECORD_DTYPE)
+    records['id'] = np.arange(first_id, first_id + len(rows), dtype=np.int64)
+    columns = list(zip(*rows))
+    for name, fmt in FIELDS[1:]:
+        values = columns[_ROW_INDEX[name]]
+        if fmt == '<f8':
+            records[name] = np.array(values, dtype=np.float64) # None -> NaN
+        else:
+            records[name] = np.clip(np.array([NULL_INT if v is None else int(v) for v in values], dtype=np.int64),
+                                    NULL_INT, _INT_MAX)
+    return records
+
+
+class BinlogWriter:
+    """Ajoute les lots commités à un segment par vol (appelé par l'écrivain DB, un seul thread)."""
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self._files = {} # vol -> fichier ouvert en ajout
+        self._lock = threading.Lock()
+        self._stats = {'records': 0, 'segments': 0, 'errors': 0}
+
+    def stats(self):
+        with self._lock: return dict(self._stats)
+
+    def _open_segment(self, flight, first_id):
+        folder = os.path.join(self.directory, _safe_name(flight))
+        os.makedirs(folder, exist_ok=True)
+        existing = sorted(p for p in os.listdir(folder) if p.endswith(SEGMENT_SUFFIX))
+        if existing: # Reprise du dernier segment s'il a le bon schéma et de la place
+            path = os.path.join(folder, existing[-1])
+            try: _, dtype = read_header(path)
+            except (OSError, ValueError): dtype = None
+            size = os.path.getsize(path)
+            if dtype == RECORD_DTYPE and size < self.segment_bytes:
+                f = open(path, 'r+b')
+                whole = HEADER_BYTES + (size - HEADER_BYTES) // RECORD_DTYPE.itemsize * RECORD_DTYPE.itemsize
+                if whole != size: # Enregistrement incomplet (arrêt brutal): on le retire
+                    log.warning("Journal binaire %s: %d octet(s) de fin tronqué(s)", path, size - whole)
+                    f.truncate(whole)
+                f.seek(whole)
+                return f
+        path = os.path.join(folder, f"seg-{first_id:012d}{SEGMENT_SUFFIX}")
+        f = open(path, 'xb')
+        f.write(_header(flight, RECORD_DTYPE))
+        with self._lock: self._stats['segments'] += 1
+        return f
+
+    def append(self, records, flight):
+        """Ajoute un tableau RECORD_DTYPE au segment courant du vol (rotation au-delà de segment_bytes)."""
+        if not len(records): return
+        f = self._files.get(flight)
+        if f is not None and f.tell() >= self.segment_bytes:
+            f.close()
+            f = None
+        if f is None:
+            f = self._files[flight] = self._open_segment(flight, int(records['id'][0]))
+        try:
+            f.write(records.tobytes())
+            f.flush() # Visible des lecteurs (memmap) dès le commit du lot
+        except OSError as e:
+            with self._lock: self._stats['errors'] += 1
+            log.error("ERREUR journal binaire (%s): %s", flight, e)
+            return
+        with self._lock: self._stats['records'] += len(records)
+
+    def append_rows(self, rows, first_id):
+        """Lignes d'INSERT_SQL d'ids consécutifs, éventuellement de plusieurs vols."""
+        records = to_records(rows, first_id)
+        flights = [row[_FLIGHT_INDEX] for row in rows]
+        if len(set(flights)) == 1:
+            self.append(records, flights[0])
+            return
+        flights = np.array(flights, dtype=object)
+        for flight in dict.fromkeys(flights): self.append(records[flights == flight], flight)
+
+    def committed(self, rows, last_id):
+        """Callback after_commit du DBWriter: lot commité, ids consécutifs jusqu'à last_id."""
+        self.append_rows(rows, last_id - len(rows) + 1)
+
+    def close(self):
+        for f in self._files.values(): f.close()
+        self._files = {}
+
+
+# --- Lecture ---
+def segment_paths(directory, flight=None):
+    """Segments (vol, chemin) par vol puis par premier id."""
+    if not os.path.isdir(directory): return []
+    result = []
+    for folder in sorted(os.listdir(directory)):
+        path = os.path.join(directory, folder)
+        if not os.path.isdir(path) or (flight is not None and folder != _safe_name(flight)): continue
+        result.extend((folder, os.path.join(path, name)) for name in sorted(os.listdir(path))
+                      if name.endswith(SEGMENT_SUFFIX))
+    return result
+
+
+def open_segment(path):
+    """(vol, tableau structuré np.memmap en lecture seule) d'un segment; enregistrement incomplet ignoré."""
+    flight, dtype = read_header(path)
+    count = (os.path.getsize(path) - HEADER_BYTES) // dtype.itemsize
+    if count <= 0: return flight, np.empty(0, dtype=dtype)
+    return flight, np.memmap(path, dtype=dtype, mode='r', offset=HEADER_BYTES, shape=(count,))
+
+
+class BinlogReader:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self, flight=None):
+        """Génère (vol, tableau structuré) de chaque segment: vues sans copie pour l'analyse vectorisée."""
+        for _folder, path in segment_paths(self.directory, flight):
+            seg_flight, records = open_segment(path)
+            if flight is None or seg_flight == flight: yield seg_flight, records
+
+    def has_columns(self, columns):
+        return all(c in RECORD_DTYPE.names for c in columns)
+
+    def columns(self, columns, start=None, end=None, flight=None):
+        """Comme queries.fetch_columns: (timestamp, {col: float64}) triés par temps, NULL -> NaN."""
+        ts_parts, parts = [], {c: [] for c in columns}
+        for _flight, records in self.segments(flight):
+            ts = records['timestamp']
+            mask = None
+            if start is not None: mask = ts >= start
+            if end is not None: mask = ts <= end if mask is None else mask & (ts <= end)
+            if mask is not None:
+                if not mask.any(): continue
+                if not mask.all(): records, ts = records[mask], ts[mask]
+            ts_parts.append(ts)
+            for c in columns:
+                values = records[c] if c in records.dtype.names else np.full(len(records), np.nan)
+                if values.dtype == np.int32: values = np.where(values == NULL_INT, np.nan, values)
+                parts[c].append(values)
+        if not ts_parts: return np.empty(0), {c: np.empty(0) for c in columns}
+        ts = np.concatenate(ts_parts).astype(np.float64, copy=False)
+        values = {c: np.concatenate(parts[c]).astype(np.float64, copy=False) for c in columns}
+        if len(ts) > 1 and np.any(ts[1:] < ts[:-1]): # Vols entrelacés, paquets en retard
+            order = np.argsort(ts, kind='stable')
+            ts, values = ts[order], {c: v[order] for c, v in values.items()}
+        return ts, values
+
+    def count(self):
+        return sum(len(records) for _, records in self.segments())
+
+
+def build(conn, writer, chunk_rows=50000):
+    """Remplit un journal binaire vide depuis la base (partie chaude + archive), dans l'ordre des ids."""
+    import queries
+    names = [c for c in RECORD_DTYPE.names if c not in ('id', 'timestamp')]
+    flights = [row[0] for row in conn.execute("SELECT DISTINCT flight_id FROM telemetry")]
+    try: flights += [row[0] for row in conn.execute("SELECT DISTINCT flight_id FROM archive_segments")]
+    except sqlite3.OperationalError: pass # Base sans archive
+    total = 0
+    for flight in dict.fromkeys(flights):
+        ts, values = queries.fetch_columns(conn, ['id'] + names, flight=flight)
+        order = np.argsort(values['id'], kind='stable')
+        records = np.empty(len(ts), dtype=RECORD_DTYPE)
+        records['id'] = values['id'][order]
+        records['timestamp'] = ts[order]
+        for name in names:
+            column = values[name][order]
+            if RECORD_DTYPE[name].kind == 'i':
+                column = np.where(np.isnan(column), NULL_INT, np.clip(np.nan_to_num(column), NULL_INT, _INT_MAX))
+            records[name] = column
+        for i in range(0, len(records), chunk_rows): writer.append(records[i:i + chunk_rows], flight)
+        total += len(records)
+    return total
+
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Journal binaire de la télémétrie (np.memmap)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_cmd = sub.add_parser('build', help="Construit le journal depuis une base existante")
+    build_cmd.add_argument('--db', required=True)
+    build_cmd.add_argument('--dir', required=True)
+    info = sub.add_parser('info', help="Segments et nombre d'enregistrements")
+    info.add_argument('--dir', required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        if segment_paths(args.dir): parser.error(f"{args.dir} contient déjà des segments")
+        writer = BinlogWriter(args.dir)
+        t0 = time.perf_counter()
+        with sqlite3.connect(args.db) as conn: total = build(conn, writer)
+        writer.close()
+        print(f"{total} enregistrements écrits en {time.perf_counter() - t0:.2f} s")
+    else:
+        total = 0
+        for _folder, path in segment_paths(args.dir):
+            flight, records = open_segment(path)
+            print(f"{flight}\t{len(records)}\t{os.path.getsize(path)}\t{path}")
+            total += len(records)
+        print(f"total: {total} enregistrements de {RECORD_DTYPE.itemsize} octets")
+
+
+if __name__ == '__main__':
+    main()
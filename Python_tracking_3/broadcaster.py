@@ -0,0 +1,255 @@
+# broadcaster.py - Diffusion Socket.IO découplée de l'ingestion
+#
+# Le thread série ne fait que déposer la dernière trame (publish) et le dernier
+# statut (set_status): c'est non bloquant et les trames intermédiaires sont
+# fusionnées. Un thread dédié envoie ensuite à chaque client:
+#   - au plus `max_rate_hz` trames par seconde et par client;
+#   - uniquement la trame la plus récente (les trames périmées d'un client
+#     lent sont abandonnées, jamais mises en file);
+#   - si le client acquitte (callback Socket.IO), pas de nouvel envoi tant que
+#     la précédente n'est pas acquittée: c'est la contre-pression par client.
+#     Un client qui n'acquitte jamais (ancien script) passe en mode débit seul.
+#   - serial_status seulement quand il change (par source);
+#   - les autres événements (publish_event, ex. prediction_update) fusionnés de
+#     la même façon: seul le dernier payload de chaque événement part.
+# Plusieurs vols: chaque vol a sa trame courante et chaque client ne reçoit que
+# celle du vol suivi (subscribe). Statuts et événements vont à la salle
+# Socket.IO du vol (room), ou à tous si room est None.
+# Les clients qui l'ont demandé reçoivent 'update_bin' (deltas binaires, voir
+# wire.py) au lieu du JSON complet, avec une trame clé périodique.
+
+import logging
+import threading
+import time
+
+from telemetry import RECORD_FIELDS
+from wire import encode_frame
+from metrics import STAGE_SECONDS
+
+log = logging.getLogger('balloon.socket')
+
+PROTOCOLS = ('json', 'delta')
+
+
+class _Frame:
+    __slots__ = ('seq', 'values', 'json')
+
+    def __init__(self):
+        self.seq = 0
+        self.values = None
+        self.json = None  # payload dict construit une seule fois par trame
+
+
+class _ClientState:
+    __slots__ = ('sid', 'flight', 'seq', 'sent_at', 'inflight', 'acks', 'acked_once', 'sent', 'dropped',
+                 'protocol', 'last_values', 'since_key', 'key_at')
+
+    def __init__(self, sid, flight, seq, protocol='json'):
+        self.sid = sid
+        self.flight = flight    # vol suivi (clé de _frames)
+        self.seq = seq          # dernière trame envoyée à ce client
+        self.sent_at = 0.0
+        self.inflight = False   # envoi en attente d'acquittement
+        self.acks = True        # le client acquitte-t-il ? (sinon débit seul)
+        self.acked_once = False
+        self.sent = 0
+        self.dropped = 0        # trames jamais envoyées car remplacées avant son tour
+        self.protocol = protocol
+        self.last_values = None # dernière trame envoyée (base des deltas), None = trame clé
+        self.since_key = 0
+        self.key_at = 0.0
+
+
+class Broadcaster:
+    def __init__(self, socketio, event='update_data', max_rate_hz=4.0, ack_timeout_s=5.0,
+                 keyframe_every=50, keyframe_interval_s=30.0):
+        self.socketio = socketio
+        self.event = event
+        self.keyframe_every = keyframe_every
+        self.keyframe_interval_s = keyframe_interval_s
+        self.min_interval = 1.0 / max_rate_hz if max_rate_hz > 0 else 0.0
+        self.ack_timeout_s = ack_timeout_s
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._frames = {}            # vol -> _Frame (dernière trame publiée)
+        self._status = {}            # source -> dernier statut diffusé
+        self._pending_status = {}    # source -> (room, statut) changé, pas encore diffusé
+        self._pending_events = {}    # (événement, room) -> dernier payload pas encore diffusé
+        self._clients = {}
+        self._stats = {'published': 0, 'frames_sent': 0, 'frames_dropped': 0,
+                       'status_sent': 0, 'events_sent': 0, 'ack_timeouts': 0, 'bytes_delta': 0,
+                       'keyframes': 0}
+
+    # --- Côté ingestion (non bloquant) ---
+    def publish(self, record, flight=None):
+        """Dépose la dernière trame (TelemetryRecord) du vol; remplace celle pas encore envoyée."""
+        values = tuple(record) # instantané: l'appelant peut modifier record ensuite
+        with self._lock:
+            frame = self._frames.get(flight)
+            if frame is None: frame = self._frames[flight] = _Frame()
+            frame.seq += 1
+            frame.values, frame.json = values, None
+            self._stats['published'] += 1
+        self._wake.set()
+
+    def set_status(self, status, key=None, room=None):
+        """Diffuse serial_status (de la source `key`) seulement s'il diffère du dernier envoyé."""
+        with self._lock:
+            if status == self._status.get(key): return
+            self._status[key] = status
+            self._pending_status[key] = (room, status)
+        self._wake.set()
+
+    def publish_event(self, event, payload, room=None):
+        """Diffuse `event` (à la salle `room`); un payload non encore envoyé est remplacé."""
+        with self._lock: self._pending_events[event, room] = payload
+        self._wake.set()
+
+    def current_status(self, key=None):
+        with self._lock: return self._status.get(key)
+
+    # --- Clients ---
+    def _frame_seq(self, flight):
+        frame = self._frames.get(flight)
+        return frame.seq if frame else 0
+
+    def add_client(self, sid, protocol='json', flight=None):
+        """Le client a reçu l'état courant à la connexion: on part de la trame actuelle."""
+        if protocol not in PROTOCOLS: protocol = 'json'
+        with self._lock:
+            client = self._clients[sid] = _ClientState(sid, flight, self._frame_seq(flight), protocol)
+            if protocol == 'delta': client.seq -= 1 # la trame clé initiale part au prochain tour
+        self._wake.set()
+
+    def set_flight(self, sid, flight):
+        """Le client suit un autre vol: sa dernière trame part au prochain tour (trame clé en delta)."""
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None: return False
+            client.flight, client.last_values = flight, None
+            client.seq = self._frame_seq(flight) - 1
+        self._wake.set()
+        return True
+
+    def set_protocol(self, sid, protocol):
+        """Change le protocole d'un client; en delta, la prochaine trame est une trame clé."""
+        if protocol not in PROTOCOLS: return False
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None: return False
+            client.protocol, client.last_values = protocol, None
+            if protocol == 'delta': client.seq = min(client.seq, self._frame_seq(client.flight) - 1)
+        self._wake.set()
+        return True
+
+    def request_keyframe(self, sid):
+        """Le client a perdu le fil (trou de seq, rechargement): prochaine trame complète."""
+        self.set_protocol(sid, 'delta')
+
+    def remove_client(self, sid):
+        with self._lock: self._clients.pop(sid, None)
+
+    def client_count(self):
+        with self._lock: return len(self._clients)
+
+    def stats(self):
+        with self._lock:
+            current = dict(self._stats)
+            current['clients'] = len(self._clients)
+            current['lagging_clients'] = sum(1 for c in self._clients.values() if c.inflight)
+        return current
+
+    # --- Cycle de vie ---
+    def start(self):
+        if self._thread and self._thread.is_alive(): return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='broadcaster', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        self._stop.set(); self._wake.set()
+        if self._thread: self._thread.join(timeout=timeout)
+
+    # --- Thread d'envoi ---
+    def _on_ack(self, client):
+        def ack(*_args):
+            with self._lock:
+                client.inflight = False
+                client.acked_once = True
+            self._wake.set()  # une trame plus récente attend peut-être ce client
+        return ack
+
+    def _run(self):
+        next_wake = None
+        while not self._stop.is_set():
+            self._wake.wait(timeout=0.5 if next_wake is None else max(0.0, next_wake - time.monotonic()))
+            self._wake.clear()
+            next_wake = None
+            now = time.monotonic()
+            to_send = []
+            with self._lock:
+                statuses, self._pending_status = self._pending_status, {}
+                events, self._pending_events = self._pending_events, {}
+                for client in self._clients.values():
+                    frame = self._frames.get(client.flight)
+                    if frame is None: continue # Rien publié encore pour ce vol
+                    seq, values = frame.seq, frame.values
+                    if client.seq >= seq: continue
+                    if client.inflight:
+                        if now - client.sent_at < self.ack_timeout_s:
+                            due = client.sent_at + self.ack_timeout_s
+                            next_wake = due if next_wake is None else min(next_wake, due)
+                            continue
+                        # Pas d'acquittement à temps
+                        self._stats['ack_timeouts'] += 1
+                        client.inflight = False
+                        if not client.acked_once: client.acks = False
+                    due = client.sent_at + self.min_interval
+                    if now < due:
+                        next_wake = due if next_wake is None else min(next_wake, due)
+                        continue
+                    skipped = seq - client.seq - 1
+                    if skipped > 0:
+                        client.dropped += skipped; self._stats['frames_dropped'] += skipped
+                    client.seq, client.sent_at, client.sent = seq, now, client.sent + 1
+                    client.inflight = client.acks
+                    if client.protocol == 'json':
+                        if frame.json is None: frame.json = dict(zip(RECORD_FIELDS, values))
+                        to_send.append((client, self.event, frame.json, values[0]))
+                    else:
+                        keyframe = (client.last_values is None or client.since_key >= self.keyframe_every
+                                    or now - client.key_at >= self.keyframe_interval_s)
+                        try: data = encode_frame(values, None if keyframe else client.last_values, seq)
+                        except Exception: # Une trame inencodable ne doit pas arrêter la diffusion
+                            log.exception("Trame %d du vol %s non encodée pour %s", seq, client.flight, client.sid)
+                            client.inflight = False
+                            continue
+                        if keyframe:
+                            client.since_key, client.key_at = 0, now
+                            self._stats['keyframes'] += 1
+                        else: client.since_key += 1
+                        client.last_values = values
+                        self._stats['bytes_delta'] += len(data)
+                        to_send.append((client, 'update_bin', data, values[0]))
+                self._stats['frames_sent'] += len(to_send)
+                self._stats['status_sent'] += len(statuses)
+                self._stats['events_sent'] += len(events)
+
+            # Émissions hors verrou (I/O)
+            for room, status in statuses.values():
+                self.socketio.emit('serial_status', status, to=room)
+            for (event, room), payload in events.items():
+                self.socketio.emit(event, payload, to=room)
+            for client, event, payload, received_at in to_send:
+                try:
+                    if client.acks:
+                        self.socketio.emit(event, payload, to=client.sid, callback=self._on_ack(client))
+                    else:
+                        self.socketio.emit(event, payload, to=client.sid)
+                except Exception as e:
+                    log.warning("Erreur émission vers %s: %s", client.sid, e)
+                    continue
+                # Ligne reçue -> trame partie vers ce client (attente du débit / de l'acquittement comprise)
+                if received_at: STAGE_SECONDS.observe(max(0.0, time.time() - received_at), ('delivery',))
@@ -0,0 +1,187 @@
+# chase.py - Service de poursuite: distance, cap, élévation et ETA de chaque chasseur, calculés côté serveur
+#
+# Un client qui partage sa position (register_chaser) devient un chasseur du
+# vol qu'il suit. À chaque fix du ballon, update() calcule en UNE passe NumPy
+# pour tous les chasseurs du vol:
+#   distance_m / bearing_deg    vers le ballon (grand cercle, cap initial depuis le nord)
+#   elevation_deg, slant_range_m angle au-dessus de l'horizon (courbure terrestre
+#                               comprise) et distance directe jusqu'au ballon
+#   target_*                    point visé: atterrissage prédit s'il est connu, sinon le ballon
+#   eta_s                       trajet route estimé (distance x CHASE_ROAD_FACTOR) à la vitesse du
+#                               chasseur, ou CHASE_DEFAULT_SPEED_KMH s'il est (presque) à l'arrêt
+#   landing_margin_s            avance (> 0) ou retard sur l'atterrissage prédit
+# Les positions sont rangées par vol dans des tableaux contigus (retrait par
+# échange avec la dernière ligne): 50 chasseurs coûtent à peu près comme un.
+
+import math
+import threading
+
+import numpy as np
+
+from analytics import EARTH_RADIUS_M, haversine_m
+
+CHASE_ROAD_FACTOR = 1.3         # Route / vol d'oiseau (détours)
+CHASE_DEFAULT_SPEED_KMH = 50.0  # Vitesse supposée d'un chasseur arrêté ou qui ne la donne pas
+CHASE_MIN_SPEED_KMH = 5.0       # En dessous: à l'arrêt (feu rouge, piéton)
+
+
+def bearing_deg(lat1, lon1, lat2, lon2):
+    """Cap initial (degrés depuis le nord, sens horaire) de 1 vers 2, élément par élément."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dlambda = np.radians(lon2 - lon1)
+    y = np.sin(dlambda) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dlambda)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def parse_position(data):
+    """{'lat', 'lon'[, 'alt', 'speed_kmh']} envoyé par un client -> (lat, lon, alt, speed_kmh); ValueError si invalide."""
+    if not isinstance(data, dict): raise ValueError("Position attendue: {'lat', 'lon'[, 'alt', 'speed_kmh']}")
+    values = []
+    for key, required in (('lat', True), ('lon', True), ('alt', False), ('speed_kmh', False)):
+        value = data.get(key)
+        if value is None and not required: values.append(None); continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"'{key}' invalide: {value!r}")
+        values.append(float(value))
+    lat, lon, alt, speed = values
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180): raise ValueError(f"Position hors limites: {lat}, {lon}")
+    return lat, lon, alt, speed
+
+
+def _round(values, digits):
+    """Tableau -> liste JSON arrondie (NaN -> None)."""
+    return [None if v != v else v for v in np.round(values, digits).tolist()] # v != v: NaN
+
+
+class _Group:
+    """Chasseurs d'un vol: une ligne par chasseur dans des tableaux qui grandissent par doublement."""
+
+    FIELDS = ('lat', 'lon', 'alt', 'speed')
+
+    def __init__(self, capacity=16):
+        self.sids = []
+        self.index = {} # sid -> ligne
+        self.cols = {name: np.empty(capacity) for name in self.FIELDS}
+
+    def set(self, sid, values):
+        row = self.index.get(sid)
+        if row is None:
+            row = self.index[sid] = len(self.sids)
+            self.sids.append(sid)
+            if row >= len(self.cols['lat']):
+                for name, column in self.cols.items(): self.cols[name] = np.concatenate((column, np.empty(len(column))))
+        for name, value in zip(self.FIELDS, values): self.cols[name][row] = value
+
+    def remove(self, sid):
+        row = self.index.pop(sid, None)
+        if row is None: return False
+        last = len(self.sids) - 1
+        if row != last: # La dernière ligne prend la place libérée
+            moved = self.sids[last]
+            self.sids[row], self.index[moved] = moved, row
+            for column in self.cols.values(): column[row] = column[last]
+        self.sids.pop()
+        return True
+
+    def view(self, name):
+        return self.cols[name][:len(self.sids)]
+
+
+class ChaseService:
+    def __init__(self, road_factor=CHASE_ROAD_FACTOR, default_speed_kmh=CHASE_DEFAULT_SPEED_KMH,
+                 min_speed_kmh=CHASE_MIN_SPEED_KMH):
+        self.road_factor = road_factor
+        self.default_speed = default_speed_kmh / 3.6
+        self.min_speed = min_speed_kmh / 3.6
+        self._lock = threading.Lock()
+        self._groups = {}  # vol -> _Group
+        self._flight_of = {} # sid -> vol
+        self._stats = {'registered': 0, 'updates': 0, 'payloads': 0}
+
+    def register(self, sid, flight, latitude, longitude, altitude=None, speed_kmh=None):
+        """Ajoute ou déplace le chasseur `sid` (vol suivi, position, altitude et vitesse si connues)."""
+        values = (latitude, longitude, np.nan if altitude is None else altitude,
+                  np.nan if speed_kmh is None else speed_kmh / 3.6)
+        with self._lock:
+            previous = self._flight_of.get(sid)
+            if previous is not None and previous != flight: self._groups[previous].remove(sid)
+            if previous is None: self._stats['registered'] += 1
+            self._groups.setdefault(flight, _Group()).set(sid, values)
+            self._flight_of[sid] = flight
+
+    def set_flight(self, sid, flight):
+        """Le chasseur suit un autre vol (même position). False s'il n'est pas enregistré."""
+        with self._lock:
+            previous = self._flight_of.get(sid)
+            if previous is None: return False
+            if previous == flight: return True
+            group = self._groups[previous]
+            row = group.index[sid]
+            values = tuple(group.cols[name][row] for name in _Group.FIELDS)
+            group.remove(sid)
+            self._groups.setdefault(flight, _Group()).set(sid, values)
+            self._flight_of[sid] = flight
+            return True
+
+    def unregister(self, sid):
+        with self._lock:
+            flight = self._flight_of.pop(sid, None)
+            return flight is not None and self._groups[flight].remove(sid)
+
+    def count(self, flight=None):
+        with self._lock:
+            if flight is None: return len(self._flight_of)
+            group = self._groups.get(flight)
+            return len(group.sids) if group else 0
+
+    def stats(self):
+        with self._lock: return dict(self._stats, chasers=len(self._flight_of))
+
+    def update(self, flight, record, prediction=None, sid=None):
+        """[(sid, payload)] des chasseurs du vol (ou du seul `sid`) pour un fix du ballon; [] sans fix."""
+        if record.latitude is None or record.longitude is None: return []
+        with self._lock:
+            group = self._groups.get(flight)
+            if group is None or not group.sids: return []
+            if sid is not None:
+                if sid not in group.index: return []
+                rows = [group.index[sid]]
+            else:
+                rows = slice(None)
+            sids = [sid] if sid is not None else list(group.sids)
+            lat, lon, alt, speed = (group.view(name)[rows].copy() for name in _Group.FIELDS)
+            self._stats['updates'] += 1
+            self._stats['payloads'] += len(sids)
+
+        b_lat, b_lon = record.latitude, record.longitude
+        distance = haversine_m(lat, lon, b_lat, b_lon)
+        bearing = bearing_deg(lat, lon, b_lat, b_lon)
+        landing = (prediction or {}).get('landing')
+        if record.altitude_gps is not None:
+            ground = landing.get('altitude') if landing and landing.get('altitude') is not None else 0.0
+            height = record.altitude_gps - np.where(np.isnan(alt), ground, alt)
+            # Chute de l'horizon d²/2R: un ballon lointain paraît plus bas
+            elevation = np.degrees(np.arctan2(height - distance ** 2 / (2 * EARTH_RADIUS_M), distance))
+            slant = np.hypot(distance, height)
+        else:
+            elevation = slant = np.full(len(sids), np.nan)
+        if landing:
+            target = 'landing'
+            target_distance = haversine_m(lat, lon, landing['latitude'], landing['longitude'])
+            target_bearing = bearing_deg(lat, lon, landing['latitude'], landing['longitude'])
+        else:
+            target, target_distance, target_bearing = 'balloon', distance, bearing
+        speed = np.where(np.isnan(speed) | (speed < self.min_speed), self.default_speed, speed)
+        eta = target_distance * self.road_factor / speed
+        if landing and landing.get('eta') is not None:
+            margin = _round(landing['eta'] - (record.timestamp + eta), 0)
+        else:
+            margin = [None] * len(sids)
+
+        columns = zip(sids, _round(distance, 1), _round(bearing, 1), _round(elevation, 2), _round(slant, 1),
+                      _round(target_distance, 1), _round(target_bearing, 1), _round(eta, 0), margin)
+        return [(s, {'flight_id': flight, 'timestamp': record.timestamp, 'distance_m': d, 'bearing_deg': b,
+                     'elevation_deg': e, 'slant_range_m': r, 'target': target, 'target_distance_m': td,
+                     'target_bearing_deg': tb, 'eta_s': t, 'landing_margin_s': m})
+                for s, d, b, e, r, td, tb, t, m in columns]
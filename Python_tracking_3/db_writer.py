@@ -0,0 +1,287 @@
+# db_writer.py - Étage d'écriture SQLite dédié (file bornée + commits groupés)
+
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import STAGE_SECONDS
+
+log = logging.getLogger('balloon.db')
+
+FLUSH_RETRIES = 5          # Nouvelles tentatives d'un lot quand la base est verrouillée (busy/locked)
+FLUSH_RETRY_DELAY_S = 0.2  # Attente avant la 1re, doublée à chaque tentative
+
+
+class DBWriter:
+    """Thread unique qui possède LA connexion SQLite d'écriture.
+
+    Les producteurs (thread série) appellent submit() qui ne fait qu'empiler
+    la ligne dans une file bornée. Le thread écrivain regroupe les lignes et
+    fait un seul COMMIT dès que `flush_max_rows` lignes sont en attente ou que
+    `flush_interval_s` secondes se sont écoulées depuis la première ligne non
+    commitée. En cas de crash, on perd donc au plus une fenêtre de flush.
+    Base verrouillée par un autre processus (busy/locked, malgré le timeout de
+    connexion): le lot est retenté FLUSH_RETRIES fois avec attente croissante;
+    un lot abandonné est compté dans 'dropped'.
+
+    `hooks`: fonctions hook(conn, batch) appelées dans la même transaction que
+    l'INSERT du lot (ex: mise à jour des agrégats de rollups.py).
+    `after_commit`: fonctions callback(rows, last_id) appelées une fois le COMMIT
+    réussi, avec les lignes de `insert_sql` et l'id de la dernière insérée (les ids
+    du lot sont consécutifs); rien n'est appelé si le lot est annulé.
+    submit(row, sql) écrit une ligne d'une autre table (ex: packet_receptions)
+    dans le même lot; les hooks ne voient que les lignes de `insert_sql`.
+    """
+
+    def __init__(self, db_filename, insert_sql, queue_maxsize=10000,
+                 flush_max_rows=200, flush_interval_s=1.0, put_timeout_s=0.5, hooks=(),
+                 after_commit=()):
+        self.db_filename = db_filename
+        self.insert_sql = insert_sql
+        self.flush_max_rows = flush_max_rows
+        self.flush_interval_s = flush_interval_s
+        self.put_timeout_s = put_timeout_s
+        self.hooks = list(hooks)
+        self.after_commit = list(after_commit)
+        self._queue = queue.Queue(maxsize=queue_maxsize)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        # Métriques de contre-pression (lues par stats())
+        self._stats = {
+            'submitted': 0,        # lignes acceptées dans la file
+            'dropped': 0,          # lignes perdues: file pleine après put_timeout_s, ou lot en erreur
+            'blocked': 0,          # submit() qui ont dû attendre une place
+            'written': 0,          # lignes de insert_sql commitées (hors submit(row, sql))
+            'commits': 0,          # nombre de transactions
+            'errors': 0,           # erreurs SQLite
+            'retries': 0,          # lots retentés (base verrouillée)
+            'queue_high_water': 0, # profondeur max observée
+            'last_batch_size': 0,
+            'last_commit_ms': 0.0,
+        }
+
+    # --- Côté producteur ---
+    def submit(self, row, sql=None):
+        """Empile un tuple de valeurs (ordre de insert_sql, ou de `sql`). Retourne False si perdu."""
+        item = row if sql is None else (sql, row)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._stats_lock: self._stats['blocked'] += 1
+            try:
+                self._queue.put(item, timeout=self.put_timeout_s)
+            except queue.Full:
+                with self._stats_lock: self._stats['dropped'] += 1
+                log.error("ERREUR DB (writer): file pleine, ligne perdue (ts=%s)", row[0] if row else None)
+                return False
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats['submitted'] += 1
+            if depth > self._stats['queue_high_water']: self._stats['queue_high_water'] = depth
+        return True
+
+    def stats(self):
+        with self._stats_lock: current = dict(self._stats)
+        current['queue_depth'] = self._queue.qsize()
+        current['queue_maxsize'] = self._queue.maxsize
+        return current
+
+    # --- Cycle de vie ---
+    def start(self):
+        if self._thread and self._thread.is_alive(): return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Demande l'arrêt: le thread vide la file et fait un dernier commit."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    # --- Côté écrivain ---
+    def _open(self):
+        conn = sqlite3.connect(self.db_filename, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL suffit en WAL: pas de corruption, au pire perte du dernier commit si coupure OS
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _run(self):
+        log.info("Démarrage écrivain DB (%s, batch=%d, fenêtre=%ss)",
+                 self.db_filename, self.flush_max_rows, self.flush_interval_s)
+        conn = self._open()
+        batch = []
+        deadline = None
+        try:
+            while True:
+                # Sans lot en cours on se réveille régulièrement pour voir l'arrêt
+                timeout = 0.5 if deadline is None else max(0.0, deadline - time.monotonic())
+                if self._stop.is_set(): timeout = 0
+                try:
+                    row = self._queue.get(timeout=timeout)
+                    batch.append(row)
+                    if deadline is None: deadline = time.monotonic() + self.flush_interval_s
+                    # Vider ce qui est déjà disponible sans attendre
+                    while len(batch) < self.flush_max_rows:
+                        try: batch.append(self._queue.get_nowait())
+                        except queue.Empty: break
+                except queue.Empty:
+                    if self._stop.is_set() and not batch: break
+
+                if batch and (len(batch) >= self.flush_max_rows
+                              or time.monotonic() >= deadline or self._stop.is_set()):
+                    self._flush(conn, batch)
+                    batch = []
+                    deadline = None
+        finally:
+            if batch: self._flush(conn, batch)
+            conn.close()
+            log.info("Écrivain DB arrêté.")
+
+    def _flush(self, conn, batch):
+        t0 = time.perf_counter()
+        rows, others = batch, None
+        if any(len(item) == 2 and isinstance(item[0], str) for item in batch): # Lignes d'autres tables
+            rows, others = [], {}
+            for item in batch:
+                if len(item) == 2 and isinstance(item[0], str): others.setdefault(item[0], []).append(item[1])
+                else: rows.append(item)
+        for attempt in range(FLUSH_RETRIES + 1):
+            try:
+                with conn:
+                    conn.executemany(self.insert_sql, rows)
+                    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0] # Avant les autres INSERT
+                    if others:
+                        for sql, extra_rows in others.items(): conn.executemany(sql, extra_rows)
+                    for hook in self.hooks: hook(conn, rows)
+                break
+            except sqlite3.OperationalError as e:
+                message = str(e).lower()
+                if attempt < FLUSH_RETRIES and ('locked' in message or 'busy' in message):
+                    with self._stats_lock: self._stats['retries'] += 1
+                    delay = FLUSH_RETRY_DELAY_S * 2 ** attempt
+                    log.warning("Base verrouillée (%s), lot de %d lignes retenté dans %.1f s", e, len(batch), delay)
+                    time.sleep(delay) # Thread écrivain (ou exécuteur de l'AsyncDBWriter): la boucle n'attend pas
+                    continue
+                self._drop_batch(batch, e)
+                return
+            except sqlite3.Error as e:
+                self._drop_batch(batch, e)
+                return
+        if rows:
+            for callback in self.after_commit:
+                try: callback(rows, last_id)
+                except Exception: log.exception("Erreur après commit (%s)", getattr(callback, '__qualname__', callback))
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        with self._stats_lock:
+            self._stats['written'] += len(rows)
+            self._stats['commits'] += 1
+            self._stats['last_batch_size'] = len(rows)
+            self._stats['last_commit_ms'] = round(elapsed_ms, 3)
+        STAGE_SECONDS.observe(elapsed_ms / 1000, ('db_commit',))
+        log.debug("%d lignes (+%d d'autres tables) commitées en %.1f ms", len(rows), len(batch) - len(rows), elapsed_ms)
+
+    def _drop_batch(self, batch, error):
+        with self._stats_lock:
+            self._stats['errors'] += 1
+            self._stats['dropped'] += len(batch)
+        log.error("ERREUR DB (batch insert %d lignes, lot perdu): %s", len(batch), error)
+
+
+class AsyncDBWriter(DBWriter):
+    """Variante asyncio (aio_server.py): même regroupement, même _flush, sans thread producteur.
+
+    submit() est appelé depuis la boucle: il n'attend jamais (une ligne qui ne
+    tient pas dans la file est perdue et comptée). La contre-pression passe par
+    `await drain()`, que le lecteur appelle avant chaque paquet. Les COMMIT
+    (bloquants, SQLite) tournent dans un unique thread dédié qui garde la connexion.
+    """
+
+    def __init__(self, db_filename, insert_sql, queue_maxsize=10000, **kwargs):
+        super().__init__(db_filename, insert_sql, queue_maxsize=queue_maxsize, **kwargs)
+        self.queue_maxsize = queue_maxsize
+        self._pending = deque()
+        self._wake_async = asyncio.Event()
+        self._room = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._executor = None
+
+    # --- Côté producteur (dans la boucle) ---
+    def submit(self, row, sql=None):
+        if len(self._pending) >= self.queue_maxsize:
+            with self._stats_lock: self._stats['dropped'] += 1
+            log.error("ERREUR DB (writer): file pleine, ligne perdue (ts=%s)", row[0] if row else None)
+            return False
+        self._pending.append(row if sql is None else (sql, row))
+        depth = len(self._pending)
+        with self._stats_lock:
+            self._stats['submitted'] += 1
+            if depth > self._stats['queue_high_water']: self._stats['queue_high_water'] = depth
+        self._wake_async.set()
+        return True
+
+    async def drain(self):
+        """Attend qu'il reste de la place dans la file (contre-pression vers le lecteur)."""
+        while len(self._pending) >= self.queue_maxsize:
+            with self._stats_lock: self._stats['blocked'] += 1
+            self._room.clear()
+            await self._room.wait()
+
+    def stats(self):
+        with self._stats_lock: current = dict(self._stats)
+        current['queue_depth'] = len(self._pending)
+        current['queue_maxsize'] = self.queue_maxsize
+        return current
+
+    # --- Cycle de vie ---
+    def start(self):
+        if self._task and not self._task.done(): return
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run_async())
+
+    async def stop(self, timeout=5):
+        """Vide la file (dernier commit) puis ferme la connexion."""
+        self._stopping = True
+        self._wake_async.set()
+        if self._task:
+            try: await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError: self._task.cancel()
+
+    # --- Côté écrivain ---
+    async def _run_async(self):
+        log.info("Démarrage écrivain DB asyncio (%s, batch=%d, fenêtre=%ss)",
+                 self.db_filename, self.flush_max_rows, self.flush_interval_s)
+        loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        conn = await loop.run_in_executor(self._executor, self._open)
+        try:
+            while True:
+                if not self._pending:
+                    if self._stopping: break
+                    self._wake_async.clear()
+                    try: await asyncio.wait_for(self._wake_async.wait(), 0.5)
+                    except asyncio.TimeoutError: pass
+                    continue # Réveil par stop() sans ligne: pas de lot vide
+                # Laisser le lot se remplir jusqu'à flush_max_rows ou flush_interval_s
+                deadline = loop.time() + self.flush_interval_s
+                while len(self._pending) < self.flush_max_rows and not self._stopping:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0: break
+                    self._wake_async.clear()
+                    try: await asyncio.wait_for(self._wake_async.wait(), remaining)
+                    except asyncio.TimeoutError: break
+                batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.flush_max_rows))]
+                self._room.set()
+                await loop.run_in_executor(self._executor, self._flush, conn, batch)
+        finally:
+            await loop.run_in_executor(self._executor, conn.close)
+            self._executor.shutdown(wait=False)
+            log.info("Écrivain DB arrêté.")
@@ -0,0 +1,100 @@
+# decoder.py - Décodeur par table des lignes compactes "GPS,..|ENV,..|AIR,..|OZ,..|UV,..|PMS,.."
+#
+# Chaque en-tête de section est associé à une spécification précompilée
+# (champ, type, sentinelle ERR, règle de validité). Le décodage remplit un
+# TelemetryRecord (liste de taille fixe, ordre = RECORD_FIELDS, voir telemetry.py)
+# au lieu de reconstruire un dict et de parcourir une chaîne if/elif.
+# Ajouter un capteur = appeler register_section(), sans toucher au décodeur.
+
+from telemetry import RECORD_FIELDS, FIELD_INDEX, EMPTY_RECORD, TelemetryRecord
+from metrics import PARSE_ERRORS # Sections rejetées, par en-tête et raison (voir /metrics)
+
+ERR = "ERR"
+
+# En-tête -> (nb minimum de valeurs, règle section, ((index, type, sentinelle, règle champ), ...))
+SECTIONS = {}
+
+
+def register_section(header, fields, min_values=None, check=None):
+    """Déclare une section capteur.
+
+    fields: liste de (nom, type) ou (nom, type, règle) dans l'ordre des valeurs
+            de la ligne; `règle` reçoit la valeur convertie et renvoie True si
+            elle est exploitable. Un nom None ignore la valeur à cette position.
+    min_values: nombre de valeurs requis (défaut: len(fields)).
+    check: règle sur les valeurs brutes de toute la section (ex: fix GPS).
+    """
+    compiled = []
+    for pos, spec in enumerate(fields):
+        name, conv = spec[0], spec[1]
+        rule = spec[2] if len(spec) > 2 else None
+        if name is None: continue
+        if name not in FIELD_INDEX:
+            raise ValueError(f"Champ inconnu '{name}' pour la section {header}")
+        compiled.append((pos, FIELD_INDEX[name], conv, ERR, rule))
+    SECTIONS[header] = (len(fields) if min_values is None else min_values, check, tuple(compiled))
+
+
+def _gps_has_fix(values):
+    # Position "ERR" ou 0,0 = pas de fix: on ignore toute la section GPS
+    if values[0] == ERR or values[1] == ERR: return False
+    try: return float(values[0]) != 0.0 or float(values[1]) != 0.0
+    except ValueError: return False
+
+
+register_section("GPS", [('latitude', float), ('longitude', float), ('altitude_gps', float),
+                         ('satellites', int), (None, str), (None, str)], check=_gps_has_fix)
+register_section("ENV", [('temperature', float), ('pressure', float),  # Pa
+                         ('humidity', float), ('altitude_bme', float)])
+register_section("AIR", [('air_quality', int), ('tvoc', int), ('eco2', int)])
+register_section("OZ", [('ozone', int)])
+register_section("UV", [('uv_index', float, lambda v: v >= 0)])
+register_section("PMS", [('pm1_std', int), ('pm25_std', int), ('pm10_std', int)])
+register_section("SEQ", [(None, int)]) # Numéro de paquet: lu par dedup.py, rien à stocker
+
+
+def new_record():
+    return TelemetryRecord()
+
+
+def decode_into(record, compact_line, timestamp=None):
+    """Remplit `record` (réinitialisé) à partir d'une ligne compacte. Retourne record."""
+    record[:] = EMPTY_RECORD
+    record[0] = timestamp
+    sections, errors = SECTIONS, PARSE_ERRORS
+    for part in compact_line.strip().split('|'):
+        header, _, rest = part.partition(',')
+        spec = sections.get(header)
+        if spec is None:
+            if part: errors.inc(('?', 'unknown')) # En-tête inconnu (ligne corrompue): cardinalité bornée
+            continue
+        min_values, check, fields = spec
+        values = rest.split(',')
+        if len(values) < min_values:
+            errors.inc((header, 'no_fix' if rest == 'NO_FIX' else 'short')); continue
+        if check is not None and not check(values):
+            errors.inc((header, 'rejected')); continue
+        for pos, idx, conv, sentinel, rule in fields:
+            raw = values[pos]
+            if raw == sentinel:
+                errors.inc((header, 'sensor_err')); continue
+            try: value = conv(raw)
+            except ValueError:
+                errors.inc((header, 'invalid')); continue
+            if rule is None or rule(value): record[idx] = value
+            else: errors.inc((header, 'out_of_range'))
+    return record
+
+
+def decode(compact_line, timestamp=None):
+    """Décode une ligne dans un nouveau TelemetryRecord."""
+    return decode_into(TelemetryRecord(), compact_line, timestamp)
+
+
+def decode_batch(lines, timestamps=None):
+    """Décode une liste de lignes d'un coup. Retourne une liste d'enregistrements."""
+    records = [TelemetryRecord() for _ in lines]
+    if timestamps is None: timestamps = (None,) * len(lines)
+    for record, line, ts in zip(records, lines, timestamps):
+        decode_into(record, line, ts)
+    return records
@@ -0,0 +1,129 @@
+# dedup.py - Fusion des paquets LoRa reçus par plusieurs récepteurs d'un même vol
+#
+# Deux stations qui entendent le même paquet le remontent chacune à quelques
+# centaines de ms d'écart. Le paquet est identifié par un condensé de son
+# contenu (ou de son numéro de séquence "SEQ,n" quand le firmware l'envoie)
+# dans une fenêtre glissante de DEDUP_WINDOW_S: la première réception devient
+# la ligne canonique de telemetry (colonne packet_key), chaque réception (y
+# compris la première) est notée dans packet_receptions avec son RSSI / SNR.
+# L'index des paquets récents est borné (fenêtre + nombre d'entrées).
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEDUP_WINDOW_S = 2.0       # Écart maximal entre deux réceptions d'un même paquet
+DEDUP_MAX_ENTRIES = 1024   # Borne mémoire de l'index des paquets récents
+
+CREATE_RECEPTIONS_SQL = """
+CREATE TABLE IF NOT EXISTS packet_receptions (
+    packet_key TEXT NOT NULL,
+    flight_id TEXT NOT NULL,
+    receiver_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    rssi INTEGER,
+    snr REAL,
+    PRIMARY KEY (packet_key, receiver_id)
+)"""
+INSERT_RECEPTION_SQL = ("INSERT OR IGNORE INTO packet_receptions "
+                        "(packet_key, flight_id, receiver_id, timestamp, rssi, snr) VALUES (?, ?, ?, ?, ?, ?)")
+
+
+def init_dedup(conn):
+    conn.execute(CREATE_RECEPTIONS_SQL)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_receptions_flight_ts ON packet_receptions (flight_id, timestamp)")
+
+
+def packet_digest(compact_line):
+    """Identité d'un paquet: numéro de séquence s'il est présent, sinon condensé du contenu."""
+    payload = compact_line.strip()
+    for part in payload.split('|'):
+        header, _, rest = part.partition(',')
+        if header == 'SEQ' and rest.strip().isdigit(): return f"seq{int(rest)}"
+    return hashlib.blake2b(payload.encode('utf-8', errors='ignore'), digest_size=8).hexdigest()
+
+
+class _Entry:
+    __slots__ = ('packet_key', 'first_ts', 'receivers', 'repeats')
+
+    def __init__(self, packet_key, first_ts, receiver_id, repeats=0):
+        self.packet_key = packet_key
+        self.first_ts = first_ts
+        self.receivers = {receiver_id}
+        self.repeats = repeats # Même contenu déjà vu dans la même milliseconde
+
+
+class PacketDeduplicator:
+    """Index borné des paquets récents d'un vol (partagé par les threads de ses récepteurs)."""
+
+    def __init__(self, window_s=DEDUP_WINDOW_S, max_entries=DEDUP_MAX_ENTRIES):
+        self.window_s = window_s
+        self.max_entries = max_entries
+        self._recent = OrderedDict() # condensé -> _Entry, par ordre de première réception
+        self._lock = threading.Lock()
+        self._stats = {'packets': 0, 'duplicates': 0, 'receivers': {}}
+
+    def _evict(self, now):
+        recent = self._recent
+        while recent:
+            entry = next(iter(recent.values()))
+            if len(recent) <= self.max_entries and now - entry.first_ts <= self.window_s: break
+            recent.popitem(last=False)
+
+    def observe(self, compact_line, receiver_id, timestamp):
+        """Enregistre une réception. Retourne (packet_key, True si première réception)."""
+        digest = packet_digest(compact_line)
+        with self._lock:
+            self._evict(timestamp)
+            per_receiver = self._stats['receivers'].setdefault(receiver_id, {'heard': 0, 'first': 0})
+            per_receiver['heard'] += 1
+            entry = self._recent.get(digest)
+            # Un récepteur n'entend pas deux fois le même paquet: même contenu = nouveau paquet
+            if entry is not None and receiver_id not in entry.receivers:
+                entry.receivers.add(receiver_id)
+                self._stats['duplicates'] += 1
+                return entry.packet_key, False
+            packet_key, repeats = f"{int(timestamp * 1000):x}-{digest}", 0 # Unique même si le contenu se répète
+            if entry is not None and entry.packet_key.startswith(packet_key): # ... dans la même ms (rejeu rapide)
+                repeats = entry.repeats + 1
+                packet_key = f"{packet_key}-{repeats}"
+            self._recent.pop(digest, None)
+            self._recent[digest] = _Entry(packet_key, timestamp, receiver_id, repeats)
+            self._stats['packets'] += 1
+            per_receiver['first'] += 1
+            return packet_key, True
+
+    def stats(self):
+        with self._lock:
+            return {'packets': self._stats['packets'], 'duplicates': self._stats['duplicates'],
+                    'indexed': len(self._recent),
+                    'receivers': {r: dict(s) for r, s in self._stats['receivers'].items()}}
+
+
+def receiver_coverage(conn, start=None, end=None, flight=None):
+    """Couverture de chaque récepteur: part des paquets du vol entendus, paquets entendus seul, RSSI / SNR."""
+    clauses, params = [], []
+    if flight is not None: clauses.append("flight_id = ?"); params.append(flight)
+    if start is not None: clauses.append("timestamp >= ?"); params.append(start)
+    if end is not None: clauses.append("timestamp <= ?"); params.append(end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    totals = dict(conn.execute(f"SELECT flight_id, COUNT(DISTINCT packet_key) FROM packet_receptions "
+                               f"{where} GROUP BY flight_id", params).fetchall())
+    only = {(f, r): n for f, r, n in conn.execute(
+        f"SELECT flight_id, receiver_id, COUNT(*) FROM (SELECT flight_id, MIN(receiver_id) AS receiver_id "
+        f"FROM packet_receptions {where} GROUP BY flight_id, packet_key HAVING COUNT(*) = 1) "
+        f"GROUP BY flight_id, receiver_id", params)}
+    result = []
+    for flight_id, receiver_id, heard, rssi_avg, rssi_min, rssi_max, snr_avg, first_ts, last_ts in conn.execute(
+            f"SELECT flight_id, receiver_id, COUNT(*), AVG(rssi), MIN(rssi), MAX(rssi), AVG(snr), "
+            f"MIN(timestamp), MAX(timestamp) FROM packet_receptions {where} "
+            f"GROUP BY flight_id, receiver_id ORDER BY flight_id, receiver_id", params):
+        total = totals.get(flight_id) or 0
+        result.append({'flight_id': flight_id, 'receiver_id': receiver_id, 'heard': heard,
+                       'flight_packets': total, 'coverage': round(heard / total, 4) if total else None,
+                       'only_receiver': only.get((flight_id, receiver_id), 0),
+                       'rssi_avg': None if rssi_avg is None else round(rssi_avg, 1),
+                       'rssi_min': rssi_min, 'rssi_max': rssi_max,
+                       'snr_avg': None if snr_avg is None else round(snr_avg, 2),
+                       'first_timestamp': first_ts, 'last_timestamp': last_ts})
+    return result
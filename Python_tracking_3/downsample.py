@@ -0,0 +1,58 @@
+# downsample.py - Réduction de séries temporelles côté serveur (LTTB, min/max par seau)
+#
+# Entrées: x (timestamps croissants) et y (valeurs) en tableaux NumPy sans NaN.
+# Sorties: indices des points conservés (triés), pour garder les vrais points mesurés.
+
+import numpy as np
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: garde la forme visuelle avec n_out points."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    # Seaux de taille égale entre le premier et le dernier point
+    every = (n - 2) / (n_out - 2)
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nlo, nhi = hi, min(int((i + 2) * every) + 1, n)
+        # Point moyen du seau suivant
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - avg_x) * (by - y[a]) - (x[a] - bx) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(x, y, n_out):
+    """Min et max de chaque seau temporel (garde les pics, ~n_out points)."""
+    n = len(x)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    n_buckets = max(1, n_out // 2)
+    edges = np.searchsorted(x, np.linspace(x[0], x[-1], n_buckets + 1)[1:-1], side='left')
+    bounds = np.concatenate(([0], edges, [n]))
+    keep = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        if hi <= lo: continue
+        seg = y[lo:hi]
+        i_min, i_max = lo + int(np.argmin(seg)), lo + int(np.argmax(seg))
+        keep.extend(sorted({i_min, i_max}))
+    return np.asarray(keep, dtype=np.int64)
+
+
+METHODS = {'lttb': lttb_indices, 'minmax': minmax_indices}
+
+
+def downsample(x, y, n_out, method='lttb'):
+    """Retourne (x, y) réduits. Les NaN (valeurs absentes) sont ignorés."""
+    x = np.asarray(x, dtype=np.float64); y = np.asarray(y, dtype=np.float64)
+    valid = ~np.isnan(y)
+    x, y = x[valid], y[valid]
+    if len(x) == 0: return x, y
+    idx = METHODS[method](x, y, n_out)
+    return x[idx], y[idx]
@@ -0,0 +1,101 @@
+# export.py - Export en flux de la table telemetry (CSV / NDJSON / XLSX / Parquet)
+#
+# Les lignes sont lues par paquets avec fetchmany() et sérialisées au fil de
+# l'eau: la mémoire reste constante quel que soit le nombre de lignes. Les
+# heures archivées (archive.py) sont lues segment par segment et fusionnées
+# dans l'ordre chronologique.
+
+import csv
+import heapq
+import io
+import json
+import tempfile
+from datetime import datetime, timezone
+from itertools import islice
+from operator import itemgetter
+
+import archive
+from telemetry import COLUMNS
+
+EXPORT_COLUMNS = COLUMNS + ('timestamp_iso',)
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+if archive.available(): MIMETYPES['parquet'] = 'application/vnd.apache.parquet'
+
+
+def _iso(ts):
+    try: return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError, OverflowError, OSError): return None
+
+
+def iter_rows(conn, chunk_rows=1000, flight=None):
+    """Génère les lignes (ordre EXPORT_COLUMNS) par paquets, dans l'ordre chronologique."""
+    where, params = ("WHERE flight_id = ? ", (flight,)) if flight is not None else ("", ())
+    cursor = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM telemetry {where}ORDER BY timestamp ASC", params)
+    hot = (row for rows in iter(lambda: cursor.fetchmany(chunk_rows), []) for row in rows)
+    rows = heapq.merge(archive.iter_rows(conn, COLUMNS, flight=flight), hot, key=itemgetter(0))
+    while True:
+        chunk = list(islice(rows, chunk_rows))
+        if not chunk: break
+        yield [row + (_iso(row[0]),) for row in chunk]
+
+
+def csv_chunks(row_chunks):
+    """Génère le CSV (en-tête + un bloc de texte par paquet de lignes)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue().encode('utf-8')
+    for rows in row_chunks:
+        buffer.seek(0); buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+
+
+def ndjson_chunks(row_chunks):
+    """Génère un objet JSON par ligne (NDJSON)."""
+    for rows in row_chunks:
+        yield ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n' for row in rows).encode('utf-8')
+
+
+def write_xlsx(row_chunks, sheet_name='TelemetryData'):
+    """Écrit un classeur openpyxl en mode write-only dans un fichier temporaire.
+
+    Un .xlsx est un zip: il ne peut pas être envoyé avant d'être complet, mais
+    le mode write-only garde la mémoire plate (les lignes partent sur disque).
+    Retourne le fichier temporaire positionné au début (supprimé à la fermeture).
+    """
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(EXPORT_COLUMNS)
+    for rows in row_chunks:
+        for row in rows: sheet.append(row)
+    output = tempfile.TemporaryFile(suffix='.xlsx')
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def write_parquet(row_chunks):
+    """Écrit un fichier Parquet (zstd) dans un fichier temporaire, un groupe de lignes à la fois.
+
+    La mémoire reste bornée par un groupe (archive.ROW_GROUP_ROWS lignes), et
+    c'est de loin le format le plus rapide à produire et à relire.
+    """
+    types = archive.arrow_types()
+    schema = archive.pa.schema([(c, types.get(c, archive.pa.string())) for c in EXPORT_COLUMNS])
+    output = tempfile.TemporaryFile(suffix='.parquet')
+    with archive.pq.ParquetWriter(output, schema, compression=archive.COMPRESSION) as writer:
+        pending = []
+        for rows in row_chunks:
+            pending.extend(rows)
+            if len(pending) >= archive.ROW_GROUP_ROWS:
+                writer.write_table(archive.rows_to_table(pending, EXPORT_COLUMNS, types).cast(schema))
+                pending = []
+        if pending: writer.write_table(archive.rows_to_table(pending, EXPORT_COLUMNS, types).cast(schema))
+    output.seek(0)
+    return output
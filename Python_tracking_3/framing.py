@@ -0,0 +1,123 @@
+# framing.py - Regroupe les lignes imprimées par le récepteur pour UN paquet LoRa
+#
+# Pour chaque paquet, le firmware du récepteur imprime:
+#   --- DONNEES RECUES ---              début de trame
+#   Donnees brutes: GPS,...|ENV,...     ligne compacte (la seule décodée)
+#   RSSI: -111 | SNR: 3.75              qualité du lien (ou deux lignes RSSI: / SNR:)
+#   -- DONNEES TRAITEES --              bloc décodé par le firmware (lisible)
+#   ...
+#   ------------------------            fin de trame
+# Le RSSI / SNR arrivent APRÈS la ligne de données: les rattacher au paquet
+# suivant (ancien last_rssi_value) décalait toute la série. La machine à états
+# ci-dessous rattache chaque valeur à la trame en cours et la ferme sur le
+# marqueur de fin, sur le début de la trame suivante ou après FRAME_TIMEOUT_S
+# (firmware sans marqueur, ligne perdue). Une valeur hors trame est ignorée.
+
+import time
+
+FRAME_TIMEOUT_S = 0.5   # Trame fermée si rien ne la complète dans ce délai
+MAX_DECODED_LINES = 64  # Lignes du bloc décodé gardées par trame
+
+START_MARKERS = ("--- DONNEES RECUES ---", "--- DONNÉES REÇUES ---")
+DECODED_MARKERS = ("-- DONNEES TRAITEES --", "-- DONNÉES TRAITÉES --")
+
+# États
+IDLE, STARTED, LINK, DECODED = 'idle', 'started', 'link', 'decoded'
+
+
+class Frame:
+    """Tout ce que le récepteur a imprimé pour un paquet."""
+    __slots__ = ('data', 'rssi', 'snr', 'decoded', 'received_at', 'started', 'closed_by')
+
+    def __init__(self, data, received_at, started):
+        self.data = data                # Ligne compacte (sans préfixe)
+        self.rssi = None
+        self.snr = None
+        self.decoded = []               # Bloc "DONNEES TRAITEES" du firmware
+        self.received_at = received_at  # time.time() à la ligne de données
+        self.started = started          # time.monotonic(), pour le délai
+        self.closed_by = None           # 'end', 'next', 'timeout' ou 'flush'
+
+
+def _number(text, conv):
+    try: return conv(float(text.strip()))
+    except ValueError: return None
+
+
+def parse_link_quality(line):
+    """'RSSI: -111 | SNR: 3.75', 'RSSI: -111' ou 'SNR: 3.75' -> (rssi, snr), None si absent."""
+    rssi = snr = None
+    for part in line.split('|'):
+        key, sep, value = part.partition(':')
+        if not sep: continue
+        key = key.strip().upper()
+        if key == 'RSSI': rssi = _number(value, lambda v: int(round(v)))
+        elif key == 'SNR': snr = _number(value, float)
+    return rssi, snr
+
+
+def _is_end_marker(line):
+    return len(line) >= 8 and line.strip('-') == ''
+
+
+class Framer:
+    """Machine à états ligne par ligne: feed() / poll() retournent les trames complètes."""
+
+    def __init__(self, data_prefixes, timeout_s=FRAME_TIMEOUT_S):
+        self.data_prefixes = tuple(data_prefixes)
+        self.timeout_s = timeout_s
+        self.state = IDLE
+        self.frame = None
+        self.stats = {'frames': 0, 'timeouts': 0, 'orphan_link_lines': 0, 'missing_link': 0}
+
+    def _close(self, reason):
+        frame, self.frame, self.state = self.frame, None, IDLE
+        frame.closed_by = reason
+        self.stats['frames'] += 1
+        if reason == 'timeout': self.stats['timeouts'] += 1
+        if frame.rssi is None and frame.snr is None: self.stats['missing_link'] += 1
+        return frame
+
+    def poll(self, now=None):
+        """Ferme la trame en cours si elle a dépassé le délai. Retourne [trame] ou []."""
+        if self.frame is None: return []
+        now = time.monotonic() if now is None else now
+        if now - self.frame.started > self.timeout_s: return [self._close('timeout')]
+        return []
+
+    def flush(self):
+        return [self._close('flush')] if self.frame is not None else []
+
+    def feed(self, line, now=None, received_at=None):
+        """Traite une ligne (déjà décodée et nettoyée). Retourne les trames fermées par cette ligne."""
+        now = time.monotonic() if now is None else now
+        done = self.poll(now)
+        if not line: return done
+
+        if line in START_MARKERS:
+            if self.frame is not None: done.append(self._close('next'))
+            self.state = STARTED
+            return done
+
+        prefix = next((p for p in self.data_prefixes if line.startswith(p)), None)
+        if prefix is not None:
+            if self.frame is not None: done.append(self._close('next'))
+            self.frame = Frame(line[len(prefix):], time.time() if received_at is None else received_at, now)
+            self.state = LINK
+            return done
+
+        if self.frame is None:
+            if line.startswith(('RSSI:', 'SNR:')): self.stats['orphan_link_lines'] += 1
+            return done
+
+        if line.startswith(('RSSI:', 'SNR:')) and self.state == LINK:
+            rssi, snr = parse_link_quality(line)
+            if rssi is not None: self.frame.rssi = rssi
+            if snr is not None: self.frame.snr = snr
+        elif line in DECODED_MARKERS:
+            self.state = DECODED
+        elif _is_end_marker(line):
+            done.append(self._close('end'))
+        elif self.state == DECODED and len(self.frame.decoded) < MAX_DECODED_LINES:
+            self.frame.decoded.append(line)
+        return done
@@ -0,0 +1,198 @@
+# fusion.py - Filtre de Kalman incrémental (fusion GPS + baromètre) dans la chaîne d'ingestion
+#
+# Deux filtres à état de taille fixe, mis à jour en O(1) par paquet:
+#   - vertical:   état [altitude, vitesse verticale, biais baro, pente du biais].
+#                 Mesures: altitude GPS (= h) et altitude barométrique tirée de
+#                 `pressure` (= h + biais). L'écart à l'atmosphère standard
+#                 grandit avec l'altitude (1-3 % de h selon la température):
+#                 le biais suit h via sa pente (m de biais par m parcouru), elle-même
+#                 lentement variable avec l'altitude. Le GPS cale biais et pente,
+#                 le baromètre lisse le bruit du GPS et prend le relais quand le fix manque.
+#   - horizontal: vitesse constante sur chaque axe (est / nord, mètres locaux
+#                 autour du premier fix), mesure = position GPS.
+# Adaptatif: le bruit de mesure GPS suit le nombre de satellites, celui du
+# baromètre la pente dh/dp (1 Pa vaut ~0,1 m au sol mais ~6 m à 30 km), les mesures
+# aberrantes (innovation > GATE_SIGMA écarts-types) sont rejetées, et le filtre
+# repart de la mesure après trop de rejets consécutifs d'un même capteur, un rejet
+# simultané du GPS et du baromètre, ou un long trou de réception.
+# Les sorties sont écrites dans les colonnes *_fused du TelemetryRecord (persistées).
+
+import math
+
+import numpy as np
+
+from analytics import EARTH_RADIUS_M
+
+SEA_LEVEL_PA = 101325.0
+ACCEL_SIGMA_V = 0.5        # Bruit de processus vertical (m/s²)
+ACCEL_SIGMA_H = 1.0        # Bruit de processus horizontal (m/s², rafales)
+BIAS_SIGMA = 0.05          # Dérive du biais baro dans le temps (m/sqrt(s))
+BIAS_SLOPE_SIGMA = 0.03    # Écart-type initial de la pente du biais (atmosphère non standard: ~1-3 %)
+BIAS_SLOPE_DRIFT = 1e-4    # Variation de la pente avec l'altitude (1/sqrt(m) parcouru)
+GPS_ALT_SIGMA_M = 8.0      # Écart-type altitude GPS avec REF_SATELLITES satellites
+GPS_POS_SIGMA_M = 4.0      # Écart-type position GPS avec REF_SATELLITES satellites
+BARO_SIGMA_M = 1.0         # Écart-type minimal de l'altitude barométrique
+BARO_PRESSURE_SIGMA_PA = 2.0 # Bruit du capteur de pression (~BME280, valeur entière en Pa)
+REF_SATELLITES = 8
+GATE_SIGMA = 5.0           # Rejet d'une mesure au-delà de N écarts-types d'innovation
+MAX_REJECTS = 5            # Rejets consécutifs avant réinitialisation sur la mesure
+RESET_GAP_S = 120.0        # Trou de réception au-delà duquel on repart de zéro
+
+
+def pressure_altitude(pressure_pa, sea_level_pa=SEA_LEVEL_PA):
+    """Altitude barométrique standard (m) depuis une pression en Pa."""
+    if pressure_pa is None or pressure_pa <= 0: return None
+    return 44330.0 * (1.0 - (pressure_pa / sea_level_pa) ** (1 / 5.255))
+
+
+def pressure_altitude_sigma(pressure_pa, sea_level_pa=SEA_LEVEL_PA):
+    """Écart-type (m) de pressure_altitude dû au bruit du capteur: sigma_p * |dh/dp|."""
+    ratio = pressure_pa / sea_level_pa
+    slope = 44330.0 / (5.255 * sea_level_pa) * ratio ** (1 / 5.255 - 1)
+    return max(BARO_SIGMA_M, BARO_PRESSURE_SIGMA_PA * slope)
+
+
+class _Kalman:
+    """Kalman linéaire générique à mesures scalaires séquentielles."""
+
+    def __init__(self, x, p_diag):
+        self.x = np.array(x, dtype=float)
+        self.P = np.diag(np.array(p_diag, dtype=float))
+        self.rejects = {} # type de mesure -> rejets consécutifs (une mesure acceptée ne blanchit pas les autres)
+
+    def predict(self, F, Q, x=None):
+        """x: état prédit si la transition n'est pas linéaire (F en est alors la jacobienne)."""
+        self.x = F @ self.x if x is None else x
+        self.P = F @ self.P @ F.T + Q
+
+    def update(self, H, z, r, kind='pos'):
+        """Mesure scalaire z = H.x + bruit(r) de type `kind`. Retourne False si rejetée (porte d'innovation)."""
+        y = z - H @ self.x
+        PH = self.P @ H
+        s = H @ PH + r
+        if y * y > GATE_SIGMA ** 2 * s:
+            self.rejects[kind] = self.rejects.get(kind, 0) + 1
+            return False
+        k = PH / s
+        self.x = self.x + k * y
+        self.P = self.P - np.outer(k, PH)
+        self.rejects[kind] = 0
+        return True
+
+    def max_rejects(self):
+        return max(self.rejects.values(), default=0)
+
+
+def _cv_q(dt, sigma):
+    """Bruit de processus d'un modèle à vitesse constante (accélération blanche)."""
+    q = sigma * sigma
+    return q * np.array([[dt ** 4 / 4, dt ** 3 / 2], [dt ** 3 / 2, dt * dt]])
+
+
+_H_GPS_ALT = np.array([1.0, 0.0, 0.0, 0.0])
+_H_BARO = np.array([1.0, 0.0, 1.0, 0.0])
+_H_POS = np.array([1.0, 0.0])
+
+
+class FusionFilter:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._t = None
+        self._vertical = None
+        self._east = self._north = None
+        self._origin = None
+
+    # --- Vertical ---
+    def _init_vertical(self, gps_alt, baro_alt, bme_alt, slope=0.0, slope_var=BIAS_SLOPE_SIGMA ** 2):
+        # Référence: le GPS, sinon l'altitude calculée par le firmware (sa propre pression de référence)
+        h = next((a for a in (gps_alt, bme_alt, baro_alt) if a is not None))
+        bias = baro_alt - h if baro_alt is not None else 0.0
+        # Sans GPS, le biais est inconnu: grande incertitude, l'altitude suit le baro
+        bias_var = BARO_SIGMA_M ** 2 + GPS_ALT_SIGMA_M ** 2 if gps_alt is not None else 100.0 ** 2
+        self._vertical = _Kalman([h, 0.0, bias, slope], [GPS_ALT_SIGMA_M ** 2, 25.0, bias_var, slope_var])
+
+    def _update_vertical(self, dt, gps_alt, gps_sigma, baro_alt, baro_sigma, bme_alt):
+        kf = self._vertical
+        if dt > 0:
+            h, v, bias, slope = kf.x
+            dh = v * dt # Le biais avance de pente x dh (non linéaire: jacobienne dans F)
+            F = np.array([[1.0, dt, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0],
+                          [0.0, slope * dt, 1.0, dh], [0.0, 0.0, 0.0, 1.0]])
+            Q = np.zeros((4, 4))
+            Q[:2, :2] = _cv_q(dt, ACCEL_SIGMA_V)
+            Q[2, 2] = BIAS_SIGMA ** 2 * dt
+            Q[3, 3] = BIAS_SLOPE_DRIFT ** 2 * abs(dh)
+            kf.predict(F, Q, np.array([h + dh, v, bias + slope * dh, slope]))
+        baro_ok = baro_alt is None or kf.update(_H_BARO, baro_alt, baro_sigma ** 2, 'baro')
+        gps_ok = gps_alt is None or kf.update(_H_GPS_ALT, gps_alt, gps_sigma ** 2, 'gps')
+        # Deux capteurs indépendants rejetés ensemble: c'est le modèle qui a cassé (éclatement), pas une mesure
+        both_rejected = not baro_ok and not gps_ok
+        if both_rejected or kf.max_rejects() >= MAX_REJECTS: # L'atmosphère n'a pas changé: on garde la pente
+            self._init_vertical(gps_alt, baro_alt, bme_alt, kf.x[3], kf.P[3, 3])
+
+    # --- Horizontal ---
+    def _to_local(self, lat, lon):
+        lat0, lon0 = self._origin
+        return (math.radians(lon - lon0) * EARTH_RADIUS_M * math.cos(math.radians(lat0)),
+                math.radians(lat - lat0) * EARTH_RADIUS_M)
+
+    def _to_geo(self, east, north):
+        lat0, lon0 = self._origin
+        return (lat0 + math.degrees(north / EARTH_RADIUS_M),
+                lon0 + math.degrees(east / (EARTH_RADIUS_M * math.cos(math.radians(lat0)))))
+
+    def _init_horizontal(self, lat, lon):
+        self._origin = (lat, lon)
+        self._east = _Kalman([0.0, 0.0], [GPS_POS_SIGMA_M ** 2, 100.0])
+        self._north = _Kalman([0.0, 0.0], [GPS_POS_SIGMA_M ** 2, 100.0])
+
+    def _update_horizontal(self, dt, lat, lon, pos_sigma):
+        if dt > 0:
+            F = np.array([[1.0, dt], [0.0, 1.0]])
+            Q = _cv_q(dt, ACCEL_SIGMA_H)
+            self._east.predict(F, Q); self._north.predict(F, Q)
+        if lat is None: return
+        east, north = self._to_local(lat, lon)
+        r = pos_sigma ** 2
+        self._east.update(_H_POS, east, r); self._north.update(_H_POS, north, r)
+        if max(self._east.max_rejects(), self._north.max_rejects()) >= MAX_REJECTS: self._init_horizontal(lat, lon)
+
+    # --- Entrée principale ---
+    def update(self, record):
+        """Filtre un TelemetryRecord et écrit les champs *_fused (None tant que non initialisé)."""
+        t = record.timestamp
+        if t is None: return record
+        dt = 0.0 if self._t is None else t - self._t
+        if dt > RESET_GAP_S or dt < 0: self.reset(); dt = 0.0
+        self._t = t
+
+        sats = record.satellites
+        scale = max(1.0, REF_SATELLITES / sats) if sats else 1.0 # Moins de satellites = GPS moins fiable
+        has_fix = record.latitude is not None and record.longitude is not None
+        gps_alt = record.altitude_gps if has_fix else None
+        baro_alt = pressure_altitude(record.pressure)
+        if baro_alt is not None: baro_sigma = pressure_altitude_sigma(record.pressure)
+        else: baro_alt, baro_sigma = record.altitude_bme, BARO_SIGMA_M
+
+        if self._vertical is None:
+            if gps_alt is not None or baro_alt is not None: self._init_vertical(gps_alt, baro_alt, record.altitude_bme)
+        else:
+            self._update_vertical(dt, gps_alt, GPS_ALT_SIGMA_M * scale, baro_alt, baro_sigma, record.altitude_bme)
+        if self._origin is None:
+            if has_fix: self._init_horizontal(record.latitude, record.longitude)
+        else:
+            self._update_horizontal(dt, record.latitude if has_fix else None, record.longitude,
+                                    GPS_POS_SIGMA_M * scale)
+
+        if self._vertical is not None:
+            h, v = self._vertical.x[:2]
+            record.altitude_fused, record.vspeed_fused = round(float(h), 2), round(float(v), 2)
+        if self._origin is not None:
+            (east, ve), (north, vn) = self._east.x, self._north.x
+            lat, lon = self._to_geo(east, north)
+            record.latitude_fused, record.longitude_fused = round(lat, 7), round(lon, 7)
+            record.speed_fused_kmh = round(math.hypot(ve, vn) * 3.6, 2)
+            record.heading_fused = round(math.degrees(math.atan2(ve, vn)) % 360, 1)
+        return record
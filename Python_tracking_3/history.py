@@ -0,0 +1,68 @@
+# history.py - Historique récent en mémoire partagé par tous les clients Socket.IO
+#
+# Tampon circulaire des N derniers points, tenu à jour par l'ingestion.
+# La liste envoyée aux clients (initial_history) n'est reconstruite qu'une fois
+# par changement, puis partagée: une salle entière qui recharge la page ne
+# touche plus la base. since(ts) permet à un client qui se reconnecte de ne
+# recevoir que les points manqués.
+
+import bisect
+import sqlite3
+import threading
+from collections import deque
+
+from telemetry import COLUMNS
+
+
+class HistoryCache:
+    def __init__(self, maxlen=100):
+        self.maxlen = maxlen
+        self._lock = threading.Lock()
+        self._points = deque(maxlen=maxlen)   # dicts (colonnes de la table)
+        self._timestamps = deque(maxlen=maxlen)
+        self._version = 0
+        self._snapshot = []
+        self._snapshot_version = 0
+
+    def load(self, db_filename, flight=None):
+        """Amorce le tampon avec les N derniers points de la base (d'un vol si `flight`)."""
+        where, params = ("WHERE flight_id = ? ", (flight,)) if flight is not None else ("", ())
+        conn = sqlite3.connect(db_filename)
+        try:
+            rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM telemetry {where}"
+                                f"ORDER BY timestamp DESC LIMIT ?", params + (self.maxlen,)).fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            self._points.clear(); self._timestamps.clear()
+            for row in reversed(rows):
+                self._points.append(dict(zip(COLUMNS, row))); self._timestamps.append(row[0])
+            self._version += 1
+        return len(rows)
+
+    def append(self, record):
+        """Ajoute un TelemetryRecord (appelé par l'ingestion après insert_data)."""
+        point = dict(zip(COLUMNS, record.as_row()))
+        with self._lock:
+            self._points.append(point); self._timestamps.append(point['timestamp'])
+            self._version += 1
+
+    def snapshot(self):
+        """Liste chronologique partagée (ne pas modifier), reconstruite une fois par changement."""
+        with self._lock:
+            if self._snapshot_version != self._version:
+                self._snapshot = list(self._points)
+                self._snapshot_version = self._version
+            return self._snapshot
+
+    def since(self, timestamp):
+        """Points strictement postérieurs à `timestamp`, ou None si le tampon ne remonte pas assez loin."""
+        with self._lock:
+            if not self._timestamps: return []
+            # Tampon plein et client plus ancien que son début: des points ont pu sortir
+            if timestamp < self._timestamps[0] and len(self._points) == self.maxlen: return None
+            idx = bisect.bisect_right(self._timestamps, timestamp)
+            return [self._points[i] for i in range(idx, len(self._points))]
+
+    def __len__(self):
+        with self._lock: return len(self._points)
@@ -0,0 +1,275 @@
+# journal.py - Journal brut append-only des lignes reçues (reprise après crash, rejeu)
+#
+# Chaque ligne lue sur une source est ajoutée AVANT tout décodage, avec son
+# heure de réception et son vol / récepteur: si le parseur ou la base échoue,
+# la donnée reste dans le journal et peut être rejouée après correction.
+# (Python_tracking_2 ouvrait / refermait serial_log.txt à chaque ligne.)
+#
+# Fichier ouvert en continu, écritures tamponnées, fsync toutes les
+# JOURNAL_FSYNC_INTERVAL_S par un thread dédié (au plus cette fenêtre perdue
+# en cas de coupure), rotation par taille et à chaque changement de jour UTC.
+# Segments data/journal/journal-AAAAMMJJ-HHMMSS-NNNN.bjl:
+#   en-tête  MAGIC (8 octets)
+#   record   <I longueur ligne> <I crc32> <d received_at> <H longueur tag> tag ligne
+# Le CRC couvre tout ce qui suit son champ. Un redémarrage ouvre toujours un
+# nouveau segment: une écriture interrompue ne peut tronquer que la fin d'un
+# segment, que la lecture ignore (et compte).
+#
+# Rejeu dans une base neuve, à pleine vitesse (même découpage en trames,
+# dédoublonnage, décodage et fusion que le serveur):
+#   python journal.py replay data/journal --db data/rebuilt.db
+#   python journal.py cat data/journal/journal-20250101-000000-0000.bjl
+
+import argparse
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+import logs
+
+log = logging.getLogger('balloon.db')
+
+MAGIC = b'BJRNL\x001\n'
+JOURNAL_SEGMENT_BYTES = 64 * 1024 * 1024 # Rotation au-delà de cette taille
+JOURNAL_FSYNC_INTERVAL_S = 1.0
+JOURNAL_BUFFER_BYTES = 64 * 1024
+SEGMENT_SUFFIX = '.bjl'
+
+_RECORD = struct.Struct('<IIdH')  # longueur ligne, crc32, received_at, longueur tag
+_CRC_PART = struct.Struct('<dH')  # partie de l'en-tête couverte par le CRC
+
+
+def _tag(flight_id, receiver_id):
+    return f"{flight_id}@{receiver_id}".encode('utf-8')
+
+
+def _day(timestamp):
+    return time.gmtime(timestamp)[:3]
+
+
+class JournalWriter:
+    """Ajout thread-safe des lignes brutes (un journal partagé par toutes les sources)."""
+
+    def __init__(self, directory, segment_bytes=JOURNAL_SEGMENT_BYTES,
+                 fsync_interval_s=JOURNAL_FSYNC_INTERVAL_S, buffer_bytes=JOURNAL_BUFFER_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval_s = fsync_interval_s
+        self.buffer_bytes = buffer_bytes
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._size = 0
+        self._day = None
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'records': 0, 'bytes': 0, 'segments': 0, 'fsyncs': 0, 'errors': 0,
+                       'last_fsync_ms': 0.0}
+
+    # --- Cycle de vie ---
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._thread and self._thread.is_alive(): return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="journal-fsync", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread: self._thread.join(timeout=self.fsync_interval_s + 2)
+        with self._lock:
+            self._sync_locked()
+            if self._file: self._file.close()
+            self._file = None
+
+    def _run(self):
+        while not self._stop.wait(self.fsync_interval_s):
+            with self._lock:
+                if self._dirty: self._sync_locked()
+
+    # --- Écriture ---
+    def append(self, raw, received_at, flight_id, receiver_id):
+        """Ajoute une ligne brute (bytes, sans fin de ligne). Ne lève pas: une erreur est comptée."""
+        tag = _tag(flight_id, receiver_id)
+        body = _CRC_PART.pack(received_at, len(tag)) + tag + raw
+        record = _RECORD.pack(len(raw), zlib.crc32(body), received_at, len(tag)) + tag + raw
+        with self._lock:
+            try:
+                if self._file is None or self._size >= self.segment_bytes or _day(received_at) != self._day:
+                    self._rotate_locked(received_at)
+                self._file.write(record)
+            except OSError as e:
+                self._stats['errors'] += 1
+                if self._stats['errors'] == 1: log.error("ERREUR JOURNAL: %s", e)
+                return False
+            self._size += len(record)
+            self._dirty = True
+            self._stats['records'] += 1
+            self._stats['bytes'] += len(record)
+        return True
+
+    def _rotate_locked(self, timestamp):
+        if self._file:
+            self._sync_locked()
+            self._file.close()
+        base = f"journal-{time.strftime('%Y%m%d-%H%M%S', time.gmtime(timestamp))}"
+        seq = 0
+        while os.path.exists(os.path.join(self.directory, f"{base}-{seq:04d}{SEGMENT_SUFFIX}")): seq += 1
+        self._path = os.path.join(self.directory, f"{base}-{seq:04d}{SEGMENT_SUFFIX}")
+        self._file = open(self._path, 'xb', buffering=self.buffer_bytes)
+        self._file.write(MAGIC)
+        self._size = len(MAGIC)
+        self._day = _day(timestamp)
+        self._dirty = True
+        self._stats['segments'] += 1
+        log.info("Journal: nouveau segment %s", self._path)
+
+    def _sync_locked(self):
+        if self._file is None or not self._dirty: return
+        started = time.perf_counter()
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError as e:
+            self._stats['errors'] += 1
+            log.error("ERREUR JOURNAL (fsync): %s", e)
+            return
+        self._dirty = False
+        self._stats['fsyncs'] += 1
+        self._stats['last_fsync_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    def stats(self):
+        with self._lock:
+            current = dict(self._stats)
+            current['segment'] = self._path
+            current['segment_bytes'] = self._size
+        return current
+
+
+# --- Lecture ---
+def segment_paths(paths):
+    """Fichiers .bjl désignés (fichiers et / ou dossiers), dans l'ordre chronologique des noms."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(os.path.join(path, name) for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+        else:
+            found.append(path)
+    return sorted(found, key=os.path.basename)
+
+
+def read_segment(path, stats=None):
+    """Itère (received_at, flight_id, receiver_id, ligne brute) d'un segment.
+
+    Un record tronqué (fin de segment après un crash) ou dont le CRC est faux
+    arrête la lecture du segment; `stats` reçoit les compteurs.
+    """
+    stats = {} if stats is None else stats
+    for key in ('records', 'truncated', 'corrupt', 'bad_header'): stats.setdefault(key, 0)
+    with open(path, 'rb') as f: data = f.read()
+    if not data.startswith(MAGIC):
+        stats['bad_header'] += 1
+        return
+    view, offset, end = memoryview(data), len(MAGIC), len(data)
+    header_size, unpack = _RECORD.size, _RECORD.unpack_from
+    while offset < end:
+        if end - offset < header_size:
+            stats['truncated'] += 1; return
+        line_len, crc, received_at, tag_len = unpack(view, offset)
+        body_start, record_end = offset + 4 + 4, offset + header_size + tag_len + line_len
+        if record_end > end:
+            stats['truncated'] += 1; return
+        if zlib.crc32(view[body_start:record_end]) != crc:
+            stats['corrupt'] += 1; return
+        tag_end = offset + header_size + tag_len
+        flight_id, _, receiver_id = bytes(view[offset + header_size:tag_end]).decode('utf-8').partition('@')
+        stats['records'] += 1
+        yield received_at, flight_id, receiver_id, bytes(view[tag_end:record_end])
+        offset = record_end
+
+
+def read_journal(paths, stats=None):
+    for path in segment_paths(paths):
+        yield from read_segment(path, stats)
+
+
+# --- Rejeu ---
+def replay(paths, db_filename, flush_max_rows=5000):
+    """Rejoue un journal dans une base neuve avec la chaîne du serveur (sans diffusion)."""
+    import app as balloon # Import tardif: app.py importe ce module
+    from pipeline import FlightState, SourcePipeline
+
+    balloon.DB_FILENAME = db_filename
+    balloon.BINLOG_DIR = balloon.binlog_dir_for(db_filename) # Jamais le journal binaire du serveur en service
+    balloon.init_db()
+    writer = balloon.start_db_writer(flush_max_rows=flush_max_rows, put_timeout_s=None) # Bloque au lieu de perdre
+    flights, pipelines, stats = {}, {}, {}
+    frames = stored = 0
+    started = time.perf_counter()
+
+    def ingest(pipeline, ready):
+        nonlocal frames, stored
+        for frame in ready:
+            frames += 1
+            with pipeline.flight.ingest_lock:
+                if balloon.store_frame(pipeline, frame)[1] is not None: stored += 1
+
+    try:
+        for received_at, flight_id, receiver_id, raw in read_journal(paths, stats):
+            pipeline = pipelines.get((flight_id, receiver_id))
+            if pipeline is None:
+                if flight_id not in flights:
+                    flights[flight_id] = FlightState(flight_id, balloon.HISTORY_SIZE, balloon.DEDUP_WINDOW_S)
+                pipeline = pipelines[flight_id, receiver_id] = SourcePipeline(
+                    flights[flight_id], receiver_id, 'journal://', balloon.DATA_PREFIXES, balloon.FRAME_TIMEOUT_S)
+            # Horloge = heures de réception du journal: les délais de trame se rejouent à l'identique
+            # (feed() expire la trame en cours de ce récepteur; les autres sont expirées ici)
+            for other in pipelines.values():
+                if other is not pipeline and other.framer.frame is not None:
+                    ingest(other, other.framer.poll(received_at))
+            ready = pipeline.framer.feed(raw.decode('utf-8', errors='ignore').strip(),
+                                         now=received_at, received_at=received_at)
+            if ready: ingest(pipeline, ready)
+        for pipeline in pipelines.values(): ingest(pipeline, pipeline.framer.flush())
+    finally:
+        writer.stop()
+        if balloon.binlog_writer: balloon.binlog_writer.close()
+    elapsed = time.perf_counter() - started
+    written = writer.stats()
+    print(f"Rejeu: {stats.get('records', 0)} lignes, {frames} trames, {stored} paquets stockés "
+          f"({written['written']} lignes DB, {written['dropped']} perdues) en {elapsed:.2f} s "
+          f"[{len(flights)} vol(s), {len(pipelines)} récepteur(s)]")
+    if stats.get('truncated') or stats.get('corrupt') or stats.get('bad_header'):
+        print(f"Segments: {stats['truncated']} fin(s) tronquée(s), {stats['corrupt']} CRC faux, "
+              f"{stats['bad_header']} en-tête(s) invalide(s)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Journal brut des lignes reçues")
+    commands = parser.add_subparsers(dest='command', required=True)
+    replay_cmd = commands.add_parser('replay', help="rejoue le journal dans une base neuve")
+    replay_cmd.add_argument('paths', nargs='+', help="segments .bjl ou dossiers")
+    replay_cmd.add_argument('--db', required=True, help="base SQLite à créer (ne doit pas exister)")
+    cat_cmd = commands.add_parser('cat', help="affiche les lignes (heure, vol@récepteur, ligne)")
+    cat_cmd.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+    logs.configure(level='WARNING') # Sortie = résumé du rejeu / lignes du journal
+
+    if args.command == 'replay':
+        if os.path.exists(args.db): parser.error(f"{args.db} existe déjà: le rejeu remplit une base neuve")
+        replay(args.paths, args.db)
+    else:
+        stats = {}
+        for received_at, flight_id, receiver_id, raw in read_journal(args.paths, stats):
+            print(f"{received_at:.3f} {flight_id}@{receiver_id} {raw.decode('utf-8', errors='replace')}")
+        print(f"# {stats.get('records', 0)} lignes, {stats.get('truncated', 0)} fin(s) tronquée(s), "
+              f"{stats.get('corrupt', 0)} CRC faux")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# logs.py - Journalisation par composant (remplace les print() du flux paquet)
+#
+# Loggers stdlib, un par composant:
+#   balloon          démarrage / arrêt, routes
+#   balloon.serial   sources et lignes lues
+#   balloon.parser   trames, dédoublonnage, décodage
+#   balloon.db       écrivain SQLite, journal brut
+#   balloon.socket   clients Socket.IO, diffusion
+# Les messages du flux paquet sont en DEBUG avec des arguments %s: ils ne sont
+# formatés que si le niveau est actif. Désactivés, ils coûtent un appel et un
+# test de niveau (mis en cache par logging). Les arguments coûteux à calculer
+# (as_dict()) sont gardés par isEnabledFor(DEBUG).
+#
+# Deux sorties: la console (niveau BALLOON_LOG_LEVEL, INFO par défaut; texte ou
+# une ligne JSON par message avec BALLOON_LOG_FORMAT=json) et un tampon
+# circulaire en mémoire (BALLOON_LOG_RING messages) qui garde tout ce que les
+# loggers laissent passer, vidé à la demande (GET /api/logs). Passer un
+# composant en DEBUG (BALLOON_LOG="serial=debug,db=debug" ou POST
+# /api/logs/level) remplit le tampon sans inonder la console.
+
+import json
+import logging
+import os
+from collections import deque
+
+LOG_LEVEL = os.environ.get('BALLOON_LOG_LEVEL', 'INFO')
+LOG_COMPONENT_LEVELS = os.environ.get('BALLOON_LOG', '')  # "serial=debug,db=warning"
+LOG_FORMAT = os.environ.get('BALLOON_LOG_FORMAT', 'text') # 'text' ou 'json'
+LOG_RING_SIZE = int(os.environ.get('BALLOON_LOG_RING', 5000))
+
+ROOT = 'balloon'
+COMPONENTS = ('serial', 'parser', 'db', 'socket')
+TEXT_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+ring = None # RingBufferHandler installé par configure()
+
+
+def logger_name(component=None):
+    if not component or component == ROOT: return ROOT
+    if component not in COMPONENTS: raise ValueError(f"Composant inconnu: {component} ({', '.join(COMPONENTS)})")
+    return f"{ROOT}.{component}"
+
+
+def parse_level(level):
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int): raise ValueError(f"Niveau inconnu: {level}")
+    return value
+
+
+def _entry(record):
+    """Enregistrement -> dict (tampon circulaire, format JSON)."""
+    entry = {'ts': record.created, 'level': record.levelname, 'logger': record.name,
+             'thread': record.threadName, 'message': record.getMessage()}
+    if record.exc_info: entry['exc'] = logging.Formatter().formatException(record.exc_info)
+    return entry
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(_entry(record), ensure_ascii=False, default=str)
+
+
+class RingBufferHandler(logging.Handler):
+    """Garde les `capacity` derniers messages (déjà formatés) pour un vidage à la demande."""
+
+    def __init__(self, capacity=LOG_RING_SIZE):
+        super().__init__(logging.DEBUG)
+        self.entries = deque(maxlen=capacity)
+        self.overwritten = 0
+
+    def emit(self, record):
+        try: entry = _entry(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.entries) == self.entries.maxlen: self.overwritten += 1
+        self.entries.append(entry)
+
+    def dump(self, level=None, component=None, since=None, limit=None):
+        """Messages du tampon, du plus ancien au plus récent, filtrés."""
+        minimum = parse_level(level) if level else logging.NOTSET
+        prefix = logger_name(component) if component else None
+        with self.lock: entries = list(self.entries)
+        selected = [e for e in entries
+                    if logging.getLevelName(e['level']) >= minimum
+                    and (prefix is None or e['logger'] == prefix or e['logger'].startswith(prefix + '.'))
+                    and (since is None or e['ts'] > since)]
+        return selected[-limit:] if limit else selected
+
+
+def format_entries(entries):
+    """Vidage texte (une ligne par message, comme la console)."""
+    formatter = logging.Formatter(TEXT_FORMAT)
+    lines = []
+    for e in entries:
+        record = logging.makeLogRecord({'name': e['logger'], 'levelname': e['level'], 'msg': e['message'],
+                                        'created': e['ts'], 'msecs': (e['ts'] % 1) * 1000})
+        lines.append(formatter.format(record) + (f"\n{e['exc']}" if e.get('exc') else ''))
+    return '\n'.join(lines) + '\n'
+
+
+def set_level(component, level):
+    """Change le niveau d'un composant à chaud ('' ou 'balloon' = défaut de tous)."""
+    logging.getLogger(logger_name(component)).setLevel(parse_level(level))
+
+
+def levels():
+    return {name: logging.getLevelName(logging.getLogger(logger_name(name)).getEffectiveLevel())
+            for name in (ROOT,) + COMPONENTS}
+
+
+def parse_component_levels(spec):
+    """'serial=debug,db=warning' -> {'serial': 'debug', 'db': 'warning'}."""
+    result = {}
+    for part in (spec or '').split(','):
+        if not part.strip(): continue
+        component, sep, level = part.partition('=')
+        if not sep: raise ValueError(f"BALLOON_LOG: '{part}' (attendu composant=niveau)")
+        result[component.strip()] = level.strip()
+    return result
+
+
+def configure(level=LOG_LEVEL, component_levels=LOG_COMPONENT_LEVELS, fmt=LOG_FORMAT, ring_size=LOG_RING_SIZE):
+    """Installe console + tampon circulaire sur le logger 'balloon' (appelable plusieurs fois)."""
+    global ring
+    root = logging.getLogger(ROOT)
+    for handler in list(root.handlers): root.removeHandler(handler)
+    root.setLevel(parse_level(level))
+    root.propagate = False # Pas de double sortie via la config de werkzeug / uvicorn
+    for component in COMPONENTS: logging.getLogger(logger_name(component)).setLevel(logging.NOTSET)
+    for component, component_level in parse_component_levels(component_levels).items():
+        set_level(component, component_level)
+
+    console = logging.StreamHandler()
+    console.setLevel(parse_level(level)) # Un composant en DEBUG n'alimente que le tampon
+    console.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT))
+    root.addHandler(console)
+    ring = RingBufferHandler(ring_size)
+    root.addHandler(ring)
+    return ring
@@ -0,0 +1,223 @@
+# metrics.py - Métriques internes: latence par étape, débit, erreurs de décodage
+#
+# Où part le temps entre la ligne lue sur la source et la mise à jour du
+# tableau de bord? Chaque étape du flux paquet alimente un histogramme
+# (balloon_stage_seconds{stage=...}):
+#   read      traitement d'une ligne lue (journal, UTF-8, découpage en trames)
+#   frame     attente de la fin de trame (RSSI / SNR, marqueur) après la ligne de données
+#   decode    decoder.decode()
+#   parse     parse_serial_data() complet (décodage + vitesse + fusion)
+#   insert    insert_data() (mise en file de l'écrivain, contre-pression comprise)
+#   emit      dépôt pour le diffuseur (publish / statut / prédiction)
+#   process   process_frame() complet
+#   delivery  réception de la ligne -> émission Socket.IO vers un client
+#   db_commit un COMMIT groupé de l'écrivain DB
+# Coût: un perf_counter() par borne et un observe() (bisect + verrou), quelques
+# µs par paquet: à laisser actif en production. Les compteurs qui existent déjà
+# ailleurs (paquets par récepteur, file DB, clients, journal...) ne sont pas
+# dupliqués: des collecteurs les lisent au moment de l'export.
+#
+# Export: render_prometheus() (format texte Prometheus 0.0.4, route /metrics)
+# et snapshot() (dict JSON, route /api/status).
+
+import bisect
+import math
+import threading
+import time
+
+# Bornes (secondes) des histogrammes de latence: 50 µs .. 30 s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RATE_WINDOW_S = 60 # Fenêtre du débit glissant (paquets/s)
+
+STARTED_AT = time.time()
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra: pairs.append(extra)
+    if not pairs: return ''
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value is None: return 'NaN'
+    if value == math.inf: return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Compteur (étiqueté) incrémenté par le code instrumenté."""
+    kind = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name, self.description, self.labels = name, description, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock: self._values[labels] = self._values.get(labels, 0) + amount
+
+    def values(self):
+        with self._lock: return dict(self._values)
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}"
+                for key, v in sorted(self.values().items())]
+
+    def snapshot(self):
+        return {'/'.join(key) or 'total': v for key, v in sorted(self.values().items())}
+
+
+class Histogram:
+    """Histogramme à bornes fixes (cumulées à l'export, comme Prometheus)."""
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.description, self.labels = name, description, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {} # étiquettes -> [comptes par borne (+Inf en dernier), somme, nombre, max, min]
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None: series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0, value, value]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+            if value > series[3]: series[3] = value
+            if value < series[4]: series[4] = value
+
+    def _copy(self):
+        with self._lock: return {k: (list(s[0]), s[1], s[2], s[3], s[4]) for k, s in self._series.items()}
+
+    def quantile(self, q, counts, total, minimum=None, maximum=None):
+        """Estimation par interpolation linéaire dans la borne qui contient le rang q.
+
+        Bornée aux valeurs extrêmes observées si elles sont données: sans cela
+        un p99 tombé dans la borne +Inf vaudrait la dernière borne finie, et un
+        p50 pourrait dépasser le max réel.
+        """
+        if not total: return None
+        rank, seen, lower = q * total, 0, 0.0
+        estimate = lower
+        for upper, n in zip(self.buckets + (math.inf,), counts):
+            if n and seen + n >= rank:
+                if upper == math.inf: estimate = lower if maximum is None else maximum
+                else: estimate = lower + (upper - lower) * (rank - seen) / n
+                break
+            seen += n
+            lower = upper
+        if maximum is not None: estimate = min(estimate, maximum)
+        if minimum is not None: estimate = max(estimate, minimum)
+        return estimate
+
+    def render(self):
+        lines = []
+        for key, (counts, total_sum, count, _max, _min) in sorted(self._copy().items()):
+            cumulative = 0
+            for upper, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, ('le', _format_value(upper)))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+    def snapshot(self):
+        result = {}
+        for key, (counts, total_sum, count, maximum, minimum) in sorted(self._copy().items()):
+            p50, p95, p99 = (_ms(self.quantile(q, counts, count, minimum, maximum)) for q in (0.5, 0.95, 0.99))
+            result['/'.join(key) or 'all'] = {
+                'count': count, 'mean_ms': round(total_sum / count * 1000, 3) if count else None,
+                'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'max_ms': _ms(maximum)}
+        return result
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class RateMeter:
+    """Événements par seconde sur une fenêtre glissante (une case par seconde)."""
+
+    def __init__(self, window_s=RATE_WINDOW_S):
+        self.window_s = window_s
+        self._slots = [[0, 0] for _ in range(window_s)] # [seconde, nombre]
+        self._lock = threading.Lock()
+
+    def mark(self, n=1, now=None):
+        second = int(time.time() if now is None else now)
+        slot = self._slots[second % self.window_s]
+        with self._lock:
+            if slot[0] != second: slot[0], slot[1] = second, 0
+            slot[1] += n
+
+    def rate(self, span_s=10, now=None):
+        """Moyenne sur les `span_s` dernières secondes complètes."""
+        span_s = min(span_s, self.window_s - 1)
+        current = int(time.time() if now is None else now)
+        with self._lock:
+            total = sum(n for second, n in self._slots if current - span_s <= second < current)
+        return total / span_s
+
+
+# --- Métriques du flux paquet ---
+STAGE_SECONDS = Histogram('balloon_stage_seconds', "Durée de chaque étape du flux paquet", ('stage',))
+PARSE_ERRORS = Counter('balloon_parse_errors_total',
+                       "Sections de ligne compacte rejetées, par en-tête et raison", ('section', 'reason'))
+PROCESS_ERRORS = Counter('balloon_process_errors_total', "Exceptions du flux paquet, par étape", ('stage',))
+PACKET_RATE = RateMeter()
+
+_metrics = [STAGE_SECONDS, PARSE_ERRORS, PROCESS_ERRORS]
+_collectors = []
+
+
+def register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def register_collector(collect):
+    """collect() -> [(nom, type, aide, noms d'étiquettes, {valeurs d'étiquettes: valeur})], lu à l'export."""
+    _collectors.append(collect)
+
+
+def _collected():
+    for collect in _collectors:
+        try: yield from collect()
+        except Exception as e: # Un collecteur cassé ne doit pas casser /metrics
+            PROCESS_ERRORS.inc(('metrics',))
+            yield ('balloon_collector_error', 'gauge', f"Collecteur en erreur: {e}", (), {(): 1})
+
+
+def render_prometheus():
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    lines.append("# HELP balloon_uptime_seconds Secondes depuis le démarrage")
+    lines.append("# TYPE balloon_uptime_seconds gauge")
+    lines.append(f"balloon_uptime_seconds {_format_value(time.time() - STARTED_AT)}")
+    for name, kind, description, label_names, values in _collected():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{_format_labels(label_names, key)} {_format_value(v)}"
+                     for key, v in sorted(values.items(), key=lambda item: tuple(map(str, item[0]))))
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot():
+    result = {'uptime_s': round(time.time() - STARTED_AT, 1),
+              'packets_per_s': {'10s': round(PACKET_RATE.rate(10), 3), '60s': round(PACKET_RATE.rate(59), 3)},
+              'stages': STAGE_SECONDS.snapshot(), 'parse_errors': PARSE_ERRORS.snapshot(),
+              'process_errors': PROCESS_ERRORS.snapshot()}
+    for metric in _metrics[3:]: result[metric.name] = metric.snapshot()
+    for name, _kind, _description, _label_names, values in _collected():
+        result[name] = {'/'.join(map(str, key)) or 'value': v for key, v in values.items()}
+    return result
@@ -0,0 +1,209 @@
+# predictor.py - Prédiction du point d'atterrissage en temps réel
+#
+# Alimenté après chaque paquet par le thread série (update), sans relire la base:
+#   - vitesse verticale récente: pente (moindres carrés) de l'altitude sur
+#     VRATE_WINDOW_S secondes;
+#   - vent par couche d'altitude: dérive horizontale entre fixes GPS successifs
+#     (espacés d'au moins WIND_MIN_DT_S), moyenne et variance par couche de
+#     LAYER_M mètres, mises à jour de façon incrémentale (Welford);
+#   - descente sous parachute: v(h) = v0 * exp(h / 2H) (atmosphère exponentielle,
+#     vitesse limite ~ 1/sqrt(rho)); v0 est recalé sur la descente observée.
+# La trajectoire est intégrée couche par couche (NumPy, quelques dizaines de
+# couches) jusqu'à l'altitude du sol. L'ellipse d'incertitude (95 %) combine la
+# variance du vent de chaque couche et l'incertitude sur la vitesse de descente.
+
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+from analytics import EARTH_RADIUS_M
+from telemetry import COLUMNS, TelemetryRecord
+
+SCALE_HEIGHT_M = 7238.0        # Hauteur d'échelle de l'atmosphère (densité)
+LAYER_M = 250.0                # Épaisseur des couches de vent
+MAX_ALTITUDE_M = 45000.0
+VRATE_WINDOW_S = 30.0          # Fenêtre de la pente d'altitude
+WIND_MIN_DT_S = 5.0            # Écart minimal entre deux fixes pour estimer le vent...
+WIND_MAX_DT_S = 120.0          # ...et maximal (au-delà, fixes non consécutifs)
+DESCENT_TRIGGER_MPS = -2.0     # Vitesse verticale sous ce seuil = descente (après éclatement)
+DEFAULT_ASCENT_MPS = 5.0
+DEFAULT_DESCENT_V0_MPS = 5.0   # Vitesse de descente au niveau de la mer avant calage
+DEFAULT_BURST_ALTITUDE_M = 30000.0
+DESCENT_RATE_SIGMA = 0.15      # Incertitude relative sur la vitesse de descente
+WIND_SIGMA_FLOOR_MPS = 1.0     # Écart-type minimal du vent d'une couche observée
+WIND_SIGMA_UNKNOWN_MPS = 5.0   # ...et d'une couche jamais observée
+ELLIPSE_CHI2_95 = 5.991        # Quantile 95 % du chi2 à 2 degrés de liberté
+PRIME_BURST_DROP_M = 1000.0    # Reprise: à plus de N m sous le maximum du vol = en descente
+
+_N_LAYERS = int(MAX_ALTITUDE_M // LAYER_M) + 1
+_LAYER_BOTTOM = np.arange(_N_LAYERS) * LAYER_M
+
+
+def _density_factor(h):
+    """sqrt(rho0 / rho(h)) pour une atmosphère exponentielle."""
+    return np.exp(np.asarray(h, dtype=float) / (2 * SCALE_HEIGHT_M))
+
+
+def _offset(lat, lon, east_m, north_m):
+    """Déplace (lat, lon) de east_m / north_m mètres (approximation locale)."""
+    dlat = math.degrees(north_m / EARTH_RADIUS_M)
+    dlon = math.degrees(east_m / (EARTH_RADIUS_M * math.cos(math.radians(lat))))
+    return lat + dlat, lon + dlon
+
+
+class LandingPredictor:
+    def __init__(self, burst_altitude=DEFAULT_BURST_ALTITUDE_M, ground_altitude=None,
+                 descent_v0=DEFAULT_DESCENT_V0_MPS):
+        self.burst_altitude = burst_altitude
+        self.ground_altitude = ground_altitude # None = altitude du premier point reçu
+        self.descent_v0 = descent_v0
+        self.descending = False
+        self.last = None                       # Dernière prédiction (dict JSON)
+        self._alts = deque()                   # (t, altitude) sur VRATE_WINDOW_S
+        self._anchor = None                    # Dernier fix utilisé pour le vent
+        # Vent par couche: nombre, moyenne et M2 (Welford) des composantes est / nord
+        self._n = np.zeros(_N_LAYERS)
+        self._mean = np.zeros((_N_LAYERS, 2))
+        self._m2 = np.zeros((_N_LAYERS, 2))
+        self._last_wind = None
+
+    # --- Entrées ---
+    def _altitude(self, record):
+        """Altitude filtrée (fusion.py) si disponible, sinon GPS puis baromètre."""
+        for value in (record.altitude_fused, record.altitude_gps, record.altitude_bme):
+            if value is not None: return value
+        return None
+
+    def _update_wind(self, t, lat, lon, alt):
+        if self._anchor is None: self._anchor = (t, lat, lon, alt); return
+        t0, lat0, lon0, alt0 = self._anchor
+        dt = t - t0
+        if dt < WIND_MIN_DT_S: return
+        self._anchor = (t, lat, lon, alt)
+        if dt > WIND_MAX_DT_S: return
+        east = math.radians(lon - lon0) * EARTH_RADIUS_M * math.cos(math.radians((lat + lat0) / 2)) / dt
+        north = math.radians(lat - lat0) * EARTH_RADIUS_M / dt
+        wind = np.array((east, north))
+        layer = min(max(int(((alt + alt0) / 2) // LAYER_M), 0), _N_LAYERS - 1)
+        self._n[layer] += 1
+        delta = wind - self._mean[layer]
+        self._mean[layer] += delta / self._n[layer]
+        self._m2[layer] += delta * (wind - self._mean[layer])
+        self._last_wind = wind
+
+    def vertical_rate(self):
+        if len(self._alts) < 3: return None
+        t, h = np.array(self._alts).T
+        if t[-1] - t[0] < 1.0: return None
+        return float(np.polyfit(t - t[0], h, 1)[0])
+
+    def update(self, record, predict=True):
+        """Intègre un TelemetryRecord; retourne la nouvelle prédiction ou None (pas de fix)."""
+        t, alt = record.timestamp, self._altitude(record)
+        if t is None or alt is None: return None
+        if self.ground_altitude is None: self.ground_altitude = alt
+        self._alts.append((t, alt))
+        while self._alts and t - self._alts[0][0] > VRATE_WINDOW_S: self._alts.popleft()
+        rate = record.vspeed_fused if record.vspeed_fused is not None else self.vertical_rate()
+        if rate is not None and rate < DESCENT_TRIGGER_MPS and alt > self.ground_altitude + 100:
+            self.descending = True
+            # Recalage du modèle de descente sur la vitesse observée
+            self.descent_v0 = -rate / float(_density_factor(alt))
+        if record.latitude is None or record.longitude is None: return None
+        self._update_wind(t, record.latitude, record.longitude, alt)
+        if not predict: return None
+        started = time.perf_counter()
+        self.last = self._predict(t, record.latitude, record.longitude, alt, rate)
+        self.last['compute_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return self.last
+
+    def prime(self, conn, rows=3600, flight=None):
+        """Reprise après redémarrage: sol = premier point du vol, vents des `rows` derniers points."""
+        where, params = ("flight_id = ? AND ", (flight,)) if flight is not None else ("", ())
+        first = conn.execute(f"SELECT COALESCE(altitude_gps, altitude_bme) FROM telemetry "
+                             f"WHERE {where}COALESCE(altitude_gps, altitude_bme) IS NOT NULL "
+                             f"ORDER BY timestamp LIMIT 1", params).fetchone()
+        if first and self.ground_altitude is None: self.ground_altitude = first[0]
+        highest = conn.execute(f"SELECT MAX(COALESCE(altitude_gps, altitude_bme)) FROM telemetry "
+                               f"WHERE {where}1", params).fetchone()[0]
+        recent = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM telemetry WHERE {where}1 "
+                              f"ORDER BY timestamp DESC LIMIT ?", params + (rows,)).fetchall()
+        last_fix = None
+        for row in reversed(recent):
+            record = TelemetryRecord.from_mapping(dict(zip(COLUMNS, row)))
+            self.update(record, predict=False)
+            if record.latitude is not None and record.longitude is not None: last_fix = record
+        # Éclatement antérieur à la fenêtre relue: le vol est déjà loin sous son maximum
+        if last_fix is not None and highest is not None and highest - self._altitude(last_fix) > PRIME_BURST_DROP_M:
+            self.descending = True
+        if last_fix is not None: self.update(last_fix)
+        return len(recent)
+
+    # --- Intégration ---
+    def _winds(self):
+        """Vent moyen et écart-type par couche; couches vides = couche observée la plus proche."""
+        observed = np.flatnonzero(self._n > 0)
+        mean = np.zeros((_N_LAYERS, 2))
+        sigma = np.full((_N_LAYERS, 2), WIND_SIGMA_UNKNOWN_MPS)
+        if len(observed) == 0:
+            if self._last_wind is not None: mean[:] = self._last_wind
+            return mean, sigma
+        nearest = observed[np.abs(_LAYER_BOTTOM[:, None] - _LAYER_BOTTOM[observed][None, :]).argmin(axis=1)]
+        mean = self._mean[nearest]
+        n = self._n[observed]
+        var = np.where(n[:, None] > 1, self._m2[observed] / np.maximum(n - 1, 1)[:, None], 0.0)
+        sigma[observed] = np.maximum(np.sqrt(var), WIND_SIGMA_FLOOR_MPS)
+        return mean, sigma
+
+    def _segment(self, h_from, h_to, speeds):
+        """Durée passée dans chaque couche entre h_from et h_to (vitesse verticale > 0 par couche)."""
+        lo, hi = min(h_from, h_to), max(h_from, h_to)
+        thickness = np.clip(np.minimum(_LAYER_BOTTOM + LAYER_M, hi) - np.maximum(_LAYER_BOTTOM, lo), 0, None)
+        return thickness / speeds
+
+    def _predict(self, t, lat, lon, alt, rate):
+        wind, sigma = self._winds()
+        mid = _LAYER_BOTTOM + LAYER_M / 2
+        descent_speed = self.descent_v0 * _density_factor(mid)
+        ground = min(self.ground_altitude, alt)
+        burst = None
+        if self.descending:
+            dt_ascent = np.zeros(_N_LAYERS)
+            top = alt
+        else:
+            ascent = rate if rate is not None and rate > 0.5 else DEFAULT_ASCENT_MPS
+            top = max(self.burst_altitude, alt)
+            dt_ascent = self._segment(alt, top, np.full(_N_LAYERS, ascent))
+        dt_descent = self._segment(top, ground, descent_speed)
+
+        ascent_drift = (dt_ascent[:, None] * wind).sum(axis=0)
+        drift = ascent_drift + (dt_descent[:, None] * wind).sum(axis=0)
+        if not self.descending:
+            burst_lat, burst_lon = _offset(lat, lon, *ascent_drift)
+            burst = {'latitude': burst_lat, 'longitude': burst_lon, 'altitude': top,
+                     'time_to_burst_s': round(float(dt_ascent.sum()), 1)}
+        land_lat, land_lon = _offset(lat, lon, *drift)
+
+        # Covariance horizontale: vent indépendant par couche + erreur relative sur la descente
+        dt = dt_ascent + dt_descent
+        cov = np.diag(((dt[:, None] * sigma) ** 2).sum(axis=0))
+        descent_drift = (dt_descent[:, None] * wind).sum(axis=0)
+        cov += DESCENT_RATE_SIGMA ** 2 * np.outer(descent_drift, descent_drift)
+        eigval, eigvec = np.linalg.eigh(cov)
+        axes = np.sqrt(np.maximum(eigval, 0) * ELLIPSE_CHI2_95)
+        major = eigvec[:, 1]
+        time_to_landing = float(dt.sum())
+        return {'timestamp': t, 'phase': 'descent' if self.descending else 'ascent',
+                'latitude': lat, 'longitude': lon, 'altitude': alt,
+                'vertical_rate': None if rate is None else round(rate, 2),
+                'landing': {'latitude': land_lat, 'longitude': land_lon, 'altitude': ground,
+                            'time_to_landing_s': round(time_to_landing, 1),
+                            'eta': t + time_to_landing},
+                'burst': burst,
+                'ellipse': {'semi_major_m': round(float(axes[1]), 1), 'semi_minor_m': round(float(axes[0]), 1),
+                            # Angle du grand axe, en degrés depuis le nord vers l'est
+                            'bearing_deg': round(math.degrees(math.atan2(major[0], major[1])) % 180, 1)},
+                'descent_v0': round(self.descent_v0, 2),
+                'wind_layers': int(np.count_nonzero(self._n))}
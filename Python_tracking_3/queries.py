@@ -0,0 +1,129 @@
+# queries.py - Lectures de la table telemetry: fenêtre temporelle, projection de colonnes,
+# pagination par clé (keyset) et séries réduites pour les graphiques.
+#
+# Toutes les requêtes filtrent sur `timestamp` pour profiter de idx_timestamp.
+# La pagination utilise (timestamp, id) comme clé: pas d'OFFSET, donc chaque
+# page coûte le même prix quelle que soit sa position dans le vol.
+# Les heures archivées en Parquet (archive.py) sont fusionnées avec la partie
+# chaude sur la même clé: le découpage est invisible pour l'appelant.
+
+import heapq
+from itertools import islice
+from operator import itemgetter
+
+import numpy as np
+
+import archive
+from telemetry import COLUMNS, NUMERIC_COLUMNS as _NUMERIC
+from downsample import downsample, METHODS
+
+NUMERIC_COLUMNS = tuple(c for c in _NUMERIC if c != 'timestamp')
+binlog_reader = None # binlog.BinlogReader si STORAGE_BACKEND='sqlite+binlog': fetch_columns lit les segments
+
+
+class QueryError(ValueError):
+    """Paramètre de requête invalide (renvoyé au client en 400)."""
+
+
+def parse_columns(raw, default=NUMERIC_COLUMNS):
+    """'altitude_bme,temperature' -> tuple validé (liste blanche = schéma)."""
+    if not raw: return tuple(default)
+    columns = tuple(c.strip() for c in raw.split(',') if c.strip())
+    unknown = [c for c in columns if c not in COLUMNS]
+    if unknown: raise QueryError(f"Colonnes inconnues: {', '.join(unknown)}")
+    return tuple(c for c in columns if c != 'timestamp')
+
+
+def parse_float(raw, name):
+    if raw is None or raw == '': return None
+    try: return float(raw)
+    except ValueError: raise QueryError(f"Paramètre '{name}' invalide: {raw}")
+
+
+def parse_bbox(raw, name='bbox'):
+    """'ouest,sud,est,nord' (degrés) -> tuple validé, None si absent. ouest > est: emprise à cheval sur l'antiméridien."""
+    if not raw: return None
+    bbox = tuple(parse_float(v.strip(), name) for v in raw.split(','))
+    if len(bbox) != 4 or None in bbox: raise QueryError(f"Paramètre '{name}' invalide (attendu ouest,sud,est,nord)")
+    west, south, east, north = bbox
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise QueryError(f"Paramètre '{name}' hors limites: {raw}")
+    return bbox
+
+
+def encode_cursor(timestamp, row_id):
+    return f"{timestamp!r}:{row_id}"
+
+
+def decode_cursor(raw):
+    if not raw: return None
+    try:
+        ts, row_id = raw.rsplit(':', 1)
+        return float(ts), int(row_id)
+    except ValueError:
+        raise QueryError(f"Curseur invalide: {raw}")
+
+
+def _window_clause(start, end, flight=None):
+    clauses, params = [], []
+    if flight is not None: clauses.append("flight_id = ?"); params.append(flight)
+    if start is not None: clauses.append("timestamp >= ?"); params.append(start)
+    if end is not None: clauses.append("timestamp <= ?"); params.append(end)
+    return clauses, params
+
+
+def fetch_page(conn, columns, start=None, end=None, limit=1000, cursor=None, flight=None):
+    """Une page de lignes brutes après `cursor`. Retourne (lignes, next_cursor ou None)."""
+    clauses, params = _window_clause(start, end, flight)
+    if cursor is not None:
+        clauses.append("(timestamp > ? OR (timestamp = ? AND id > ?))")
+        params += [cursor[0], cursor[0], cursor[1]]
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = (f"SELECT id, timestamp, {', '.join(columns)} FROM telemetry {where} "
+           f"ORDER BY timestamp, id LIMIT ?")
+    rows = conn.execute(sql, params + [limit + 1]).fetchall()
+    archived = archive.iter_rows(conn, ('id', 'timestamp') + tuple(columns), start, end, flight, cursor)
+    rows = list(islice(heapq.merge(archived, rows, key=itemgetter(1, 0)), limit + 1))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    names = ('timestamp',) + tuple(columns)
+    return [dict(zip(names, row[1:])) for row in rows], next_cursor
+
+
+def fetch_columns(conn, columns, start=None, end=None, flight=None):
+    """Charge la fenêtre en tableaux NumPy colonne par colonne (None -> NaN)."""
+    if binlog_reader is not None and binlog_reader.has_columns(columns):
+        return binlog_reader.columns(columns, start, end, flight)
+    clauses, params = _window_clause(start, end, flight)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cursor = conn.execute(f"SELECT timestamp, {', '.join(columns)} FROM telemetry {where} "
+                          f"ORDER BY timestamp", params)
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(5000)
+        if not rows: break
+        chunks.append(np.array(rows, dtype=np.float64))
+    data = np.concatenate(chunks) if chunks else np.empty((0, len(columns) + 1))
+    ts, values = data[:, 0], {col: data[:, i + 1] for i, col in enumerate(columns)}
+    cold = archive.read_table(conn, ('timestamp',) + tuple(columns), start, end, flight)
+    if cold is None or not cold.num_rows: return ts, values
+    # Archive (plus ancienne en général) + partie chaude, remises dans l'ordre chronologique
+    ts = np.concatenate((archive.to_numpy(cold, 'timestamp'), ts))
+    order = np.argsort(ts, kind='stable')
+    ts = ts[order]
+    return ts, {col: np.concatenate((archive.to_numpy(cold, col), values[col]))[order] for col in columns}
+
+
+def fetch_series(conn, columns, start=None, end=None, points=500, method='lttb', flight=None):
+    """Séries réduites à ~`points` points par colonne: {col: [[t, v], ...]}."""
+    if method not in METHODS: raise QueryError(f"Méthode inconnue: {method}")
+    text = [c for c in columns if c not in NUMERIC_COLUMNS]
+    if text: raise QueryError(f"Colonnes non numériques: {', '.join(text)}")
+    ts, values = fetch_columns(conn, columns, start, end, flight)
+    series = {}
+    for col in columns:
+        x, y = downsample(ts, values[col], points, method)
+        series[col] = np.column_stack((x, y)).tolist()
+    return len(ts), series
@@ -0,0 +1,159 @@
+# rollups.py - Tables d'agrégats multi-résolution (10 s, 1 min, 10 min) tenues à jour à l'insertion
+#
+# Chaque palier stocke, par seau de temps: nombre de lignes, puis pour chaque
+# colonne numérique min / max / somme / nombre de valeurs non nulles (la
+# moyenne = somme / nombre). Les agrégats sont mis à jour dans la MÊME
+# transaction que l'INSERT du lot (hook de DBWriter), donc toujours cohérents
+# avec la table brute. Un graphique de vol de 24 h lit ~1 500 lignes au lieu de 86 000.
+# Les seaux sont séparés par vol (clé (flight_id, bucket)).
+# Les agrégats restent dans SQLite quand les heures brutes partent dans l'archive
+# Parquet (archive.py): seule la lecture brute (petites fenêtres) y retourne.
+
+import heapq
+import math
+from operator import itemgetter
+
+import archive
+from telemetry import COLUMNS
+
+ROLLUP_TIERS = (('10s', 10), ('1min', 60), ('10min', 600))
+ROLLUP_COLUMNS = ('altitude_gps', 'altitude_bme', 'temperature', 'pressure', 'humidity',
+                  'ozone', 'uv_index', 'pm1_std', 'pm25_std', 'pm10_std', 'rssi')
+_TS_INDEX = COLUMNS.index('timestamp')
+_FLIGHT_INDEX = COLUMNS.index('flight_id')
+_COL_INDEX = tuple(COLUMNS.index(c) for c in ROLLUP_COLUMNS)
+
+
+def table_name(tier):
+    return f"telemetry_rollup_{tier}"
+
+
+def _create_sql(tier):
+    cols = ",\n".join(f"    {c}_min REAL, {c}_max REAL, {c}_sum REAL NOT NULL DEFAULT 0, "
+                      f"{c}_n INTEGER NOT NULL DEFAULT 0" for c in ROLLUP_COLUMNS)
+    return (f"CREATE TABLE IF NOT EXISTS {table_name(tier)} (\n"
+            f"    flight_id TEXT NOT NULL DEFAULT '',\n    bucket INTEGER NOT NULL,\n"
+            f"    n INTEGER NOT NULL,\n{cols},\n    PRIMARY KEY (flight_id, bucket)\n)")
+
+
+def _upsert_sql(tier):
+    names = ['flight_id', 'bucket', 'n'] + [f"{c}_{k}" for c in ROLLUP_COLUMNS for k in ('min', 'max', 'sum', 'n')]
+    updates = ["n = n + excluded.n"]
+    for c in ROLLUP_COLUMNS:
+        # MIN()/MAX() scalaires renvoient NULL si un argument est NULL: d'où le COALESCE
+        updates.append(f"{c}_min = COALESCE(MIN({c}_min, excluded.{c}_min), {c}_min, excluded.{c}_min)")
+        updates.append(f"{c}_max = COALESCE(MAX({c}_max, excluded.{c}_max), {c}_max, excluded.{c}_max)")
+        updates.append(f"{c}_sum = {c}_sum + excluded.{c}_sum")
+        updates.append(f"{c}_n = {c}_n + excluded.{c}_n")
+    return (f"INSERT INTO {table_name(tier)} ({', '.join(names)}) "
+            f"VALUES ({', '.join(['?'] * len(names))}) "
+            f"ON CONFLICT(flight_id, bucket) DO UPDATE SET {', '.join(updates)}")
+
+
+def _rebuild_sql(tier, seconds):
+    aggs = ", ".join(f"MIN({c}), MAX({c}), TOTAL({c}), COUNT({c})" for c in ROLLUP_COLUMNS)
+    return (f"INSERT OR REPLACE INTO {table_name(tier)} "
+            f"SELECT COALESCE(flight_id, ''), CAST(timestamp / {seconds} AS INTEGER) * {seconds}, "
+            f"COUNT(*), {aggs} FROM telemetry GROUP BY 1, 2")
+
+
+_UPSERT_SQL = {tier: _upsert_sql(tier) for tier, _ in ROLLUP_TIERS}
+
+
+def init_rollups(conn):
+    """Crée les tables de paliers; les remplit depuis telemetry si elles viennent d'être créées."""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    for tier, seconds in ROLLUP_TIERS:
+        name = table_name(tier)
+        if name in existing and 'flight_id' not in {r[1] for r in conn.execute(f"PRAGMA table_info({name})")}:
+            # Ancien format (un seul vol): données dérivées, on reconstruit
+            conn.execute(f"DROP TABLE {name}")
+            existing.discard(name)
+        conn.execute(_create_sql(tier))
+        if table_name(tier) not in existing:
+            conn.execute(_rebuild_sql(tier, seconds))
+
+
+def apply_batch(conn, rows):
+    """Hook DBWriter: agrège le lot en mémoire puis un UPSERT par seau et par palier."""
+    for tier, seconds in ROLLUP_TIERS:
+        buckets = {}
+        for row in rows:
+            ts = row[_TS_INDEX]
+            if ts is None: continue
+            flight, bucket = row[_FLIGHT_INDEX] or '', int(ts // seconds) * seconds
+            agg = buckets.get((flight, bucket))
+            if agg is None:
+                agg = buckets[flight, bucket] = [flight, bucket, 0] + [None, None, 0.0, 0] * len(ROLLUP_COLUMNS)
+            agg[2] += 1
+            for j, idx in enumerate(_COL_INDEX):
+                v = row[idx]
+                if v is None: continue
+                base = 3 + 4 * j
+                if agg[base] is None or v < agg[base]: agg[base] = v
+                if agg[base + 1] is None or v > agg[base + 1]: agg[base + 1] = v
+                agg[base + 2] += v
+                agg[base + 3] += 1
+        if buckets:
+            conn.executemany(_UPSERT_SQL[tier], buckets.values())
+
+
+def _flight_clause(flight):
+    return ("", ()) if flight is None else (" AND flight_id = ?", (flight,))
+
+
+def choose_tier(conn, start, end, points, flight=None):
+    """Palier le plus fin dont le nombre de lignes sur la fenêtre reste <= points.
+
+    Retourne None pour lire les données brutes (fenêtre assez petite).
+    """
+    flight_sql, flight_params = _flight_clause(flight)
+    if start is None or end is None:
+        row = conn.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM telemetry WHERE 1{flight_sql}",
+                           flight_params).fetchone()
+        bounds = [v for v in row + tuple(archive.extent(conn, flight)) if v is not None]
+        if not bounds: return None
+        start = min(bounds) if start is None else start
+        end = max(bounds) if end is None else end
+    # Estimation brute: compte indexé (idx_timestamp / idx_flight_timestamp), rapide même sur gros volumes
+    n_raw = conn.execute(f"SELECT COUNT(*) FROM telemetry WHERE timestamp BETWEEN ? AND ?{flight_sql}",
+                         (start, end) + flight_params).fetchone()[0]
+    n_raw += archive.count(conn, start, end, flight)
+    if n_raw <= points: return None
+    span = max(0.0, end - start)
+    for tier, seconds in ROLLUP_TIERS:
+        if math.ceil(span / seconds) + 1 <= points: return tier
+    return ROLLUP_TIERS[-1][0]
+
+
+def fetch_summary(conn, columns, start=None, end=None, points=2000, flight=None):
+    """Séries {col: [[t, min, avg, max], ...]} depuis le palier le moins coûteux."""
+    unknown = [c for c in columns if c not in ROLLUP_COLUMNS]
+    if unknown: raise ValueError(f"Colonnes sans agrégats: {', '.join(unknown)}")
+    tier = choose_tier(conn, start, end, points, flight)
+    clauses, params = [], []
+    if flight is not None:
+        clauses.append("flight_id = ?"); params.append(flight)
+    key = 'timestamp' if tier is None else 'bucket'
+    if start is not None:
+        # Inclure le seau qui contient `start`
+        seconds = dict(ROLLUP_TIERS).get(tier, 0)
+        clauses.append(f"{key} >= ?"); params.append(start - seconds if tier else start)
+    if end is not None: clauses.append(f"{key} <= ?"); params.append(end)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    series = {c: [] for c in columns}
+    if tier is None:
+        sql = f"SELECT timestamp, {', '.join(columns)} FROM telemetry {where} ORDER BY timestamp"
+        archived = archive.iter_rows(conn, ('timestamp',) + tuple(columns), start, end, flight)
+        for row in heapq.merge(archived, conn.execute(sql, params), key=itemgetter(0)):
+            for c, v in zip(columns, row[1:]):
+                if v is not None: series[c].append([row[0], v, v, v])
+        return 'raw', series
+    # GROUP BY: sans filtre de vol, les seaux de tous les vols sont fusionnés
+    select = ", ".join(f"MIN({c}_min), TOTAL({c}_sum) / NULLIF(SUM({c}_n), 0), MAX({c}_max)" for c in columns)
+    sql = f"SELECT bucket, {select} FROM {table_name(tier)} {where} GROUP BY bucket ORDER BY bucket"
+    for row in conn.execute(sql, params):
+        for j, c in enumerate(columns):
+            mn, avg, mx = row[1 + 3 * j: 4 + 3 * j]
+            if avg is not None: series[c].append([row[0], mn, avg, mx])
+    return tier, series
@@ -0,0 +1,448 @@
+# sources.py - Sources de lignes pour le lecteur (série, TCP, UDP, rejeu de log, pty)
+#
+# Toutes les sources exposent la même interface bloquante:
+#   open()      -> ouvre la source (lève SourceError en cas d'échec)
+#   readline()  -> bytes d'une ligne terminée par \n, ou b'' si rien n'est arrivé
+#                  pendant `timeout` secondes (jamais de boucle d'attente active)
+#   close()
+#   is_open / describe()
+# Ainsi serial_reader_task garde exactement le même chemin parse/insert/emit
+# quelle que soit l'origine des données.
+# Mode asyncio (aio_server.py): fileno() donne un descripteur à surveiller
+# (loop.add_reader) quand un bloc est lisible sans attendre une fois signalé,
+# puis read_ready() lit ce bloc; None = lecture bloquante dans un thread.
+
+import logging
+import os
+import re
+import select
+import socket
+import time
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+
+import serial
+
+log = logging.getLogger('balloon.serial')
+
+
+class SourceError(Exception):
+    """Erreur d'ouverture ou de lecture d'une source (connexion perdue, fichier absent...)."""
+
+
+def _normalize_text(raw):
+    """Ramène une ligne en UTF-8 (les captures Windows sont souvent en cp1252)."""
+    try:
+        raw.decode('utf-8')
+        return raw
+    except UnicodeDecodeError:
+        return raw.decode('latin-1').encode('utf-8')
+
+
+class Source:
+    """Classe de base: gère un tampon de lignes pour les sources orientées flux."""
+    kind = 'source'
+
+    def __init__(self, timeout=1.0):
+        self.timeout = timeout
+        self._buffer = bytearray()
+
+    @property
+    def is_open(self):
+        return False
+
+    def describe(self):
+        return self.kind
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def fileno(self):
+        """Descripteur pollable (mode asyncio), ou None si readline() doit rester bloquant."""
+        return None
+
+    def read_ready(self):
+        """Descripteur signalé lisible: lit le bloc disponible et retourne les lignes complètes."""
+        self._buffer.extend(self._read_chunk())
+        lines = []
+        line = self._pop_line()
+        while line is not None:
+            lines.append(line)
+            line = self._pop_line()
+        return lines
+
+    def _pop_line(self):
+        idx = self._buffer.find(b'\n')
+        if idx < 0: return None
+        line = bytes(self._buffer[:idx + 1])
+        del self._buffer[:idx + 1]
+        return line
+
+    def _read_chunk(self):
+        """Lit un bloc (bloquant au plus `timeout`). b'' si rien n'est arrivé."""
+        raise NotImplementedError
+
+    def readline(self):
+        line = self._pop_line()
+        if line is not None: return line
+        self._buffer.extend(self._read_chunk())
+        line = self._pop_line()
+        return line if line is not None else b''
+
+
+class SerialSource(Source):
+    """Port série (ESP32 receiver). readline() ne rend que des lignes complètes (b'' après `timeout`)."""
+    kind = 'serial'
+
+    def __init__(self, port, baud=115200, timeout=1.0):
+        super().__init__(timeout)
+        self.port, self.baud = port, baud
+        self._ser = None
+
+    @property
+    def is_open(self):
+        return self._ser is not None and self._ser.is_open
+
+    def describe(self):
+        return self.port
+
+    def open(self):
+        try:
+            self._ser = serial.Serial(self.port, self.baud, timeout=self.timeout)
+        except (serial.SerialException, PermissionError, FileNotFoundError) as e:
+            self._ser = None
+            raise SourceError(f"Échec connexion {self.port}: {e}") from e
+        time.sleep(0.5); self._ser.reset_input_buffer()
+
+    def close(self):
+        if self._ser:
+            try: self._ser.close()
+            except Exception: pass
+        self._ser = None
+        self._buffer.clear()
+
+    def _read_chunk(self):
+        # Tout ce qui attend, sinon 1 octet (bloque au plus `timeout`): une ligne arrivée en fin de
+        # fenêtre reste dans le tampon jusqu'à son \n au lieu d'être rendue coupée
+        try:
+            return self._ser.read(self._ser.in_waiting or 1)
+        except (serial.SerialException, OSError) as e:
+            raise SourceError(f"Erreur série pendant lecture: {e}") from e
+
+
+class TcpClientSource(Source):
+    """Client TCP vers une passerelle (ex: ser2net, ESP32 en WiFi, `nc -l`)."""
+    kind = 'tcp'
+
+    def __init__(self, host, port, timeout=1.0):
+        super().__init__(timeout)
+        self.host, self.port = host, port
+        self._sock = None
+
+    @property
+    def is_open(self):
+        return self._sock is not None
+
+    def describe(self):
+        return f"tcp://{self.host}:{self.port}"
+
+    def fileno(self):
+        return self._sock.fileno() if self._sock else None
+
+    def open(self):
+        try:
+            self._sock = socket.create_connection((self.host, self.port), timeout=5)
+            self._sock.settimeout(self.timeout)
+        except OSError as e:
+            self._sock = None
+            raise SourceError(f"Échec connexion {self.describe()}: {e}") from e
+
+    def close(self):
+        if self._sock:
+            try: self._sock.close()
+            except OSError: pass
+        self._sock = None
+        self._buffer.clear()
+
+    def _read_chunk(self):
+        try:
+            chunk = self._sock.recv(4096)
+        except socket.timeout:
+            return b''
+        except OSError as e:
+            raise SourceError(f"Erreur lecture {self.describe()}: {e}") from e
+        if not chunk:
+            raise SourceError(f"Connexion fermée par {self.describe()}")
+        return chunk
+
+
+class TcpServerSource(Source):
+    """Serveur TCP: accepte un émetteur à la fois (outil de charge, relais distant)."""
+    kind = 'tcp-listen'
+
+    def __init__(self, host, port, timeout=1.0):
+        super().__init__(timeout)
+        self.host, self.port = host, port
+        self._server = None
+        self._client = None
+
+    @property
+    def is_open(self):
+        return self._server is not None
+
+    def describe(self):
+        return f"tcp-listen://{self.host}:{self.port}"
+
+    def open(self):
+        try:
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._server.bind((self.host, self.port))
+            self._server.listen(1)
+            self._server.settimeout(self.timeout)
+        except OSError as e:
+            self.close()
+            raise SourceError(f"Impossible d'écouter sur {self.describe()}: {e}") from e
+
+    def close(self):
+        for s in (self._client, self._server):
+            if s:
+                try: s.close()
+                except OSError: pass
+        self._client = self._server = None
+        self._buffer.clear()
+
+    def _read_chunk(self):
+        if self._client is None:
+            try:
+                self._client, addr = self._server.accept()
+                self._client.settimeout(self.timeout)
+                log.info("Émetteur TCP connecté depuis %s:%s", addr[0], addr[1])
+            except socket.timeout:
+                return b''
+        try:
+            chunk = self._client.recv(4096)
+        except socket.timeout:
+            return b''
+        except OSError:
+            chunk = b''
+        if not chunk:
+            # L'émetteur est parti: on repasse en attente d'un nouveau client
+            try: self._client.close()
+            except OSError: pass
+            self._client = None
+            return b''
+        return chunk
+
+
+class UdpSource(Source):
+    """Datagrammes UDP: chaque datagramme contient une ou plusieurs lignes."""
+    kind = 'udp'
+
+    def __init__(self, host, port, timeout=1.0):
+        super().__init__(timeout)
+        self.host, self.port = host, port
+        self._sock = None
+
+    @property
+    def is_open(self):
+        return self._sock is not None
+
+    def describe(self):
+        return f"udp://{self.host}:{self.port}"
+
+    def fileno(self):
+        return self._sock.fileno() if self._sock else None
+
+    def open(self):
+        try:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._sock.bind((self.host, self.port))
+            self._sock.settimeout(self.timeout)
+        except OSError as e:
+            self.close()
+            raise SourceError(f"Impossible d'écouter sur {self.describe()}: {e}") from e
+
+    def close(self):
+        if self._sock:
+            try: self._sock.close()
+            except OSError: pass
+        self._sock = None
+        self._buffer.clear()
+
+    def _read_chunk(self):
+        try:
+            chunk, _ = self._sock.recvfrom(65535)
+        except socket.timeout:
+            return b''
+        except OSError as e:
+            raise SourceError(f"Erreur lecture {self.describe()}: {e}") from e
+        # Un datagramme est une unité complète: forcer la fin de ligne
+        return chunk if chunk.endswith(b'\n') else chunk + b'\n'
+
+
+class ReplaySource(Source):
+    """Rejoue une capture type serial_log.txt ("AAAA-MM-JJ HH:MM:SS.ffffff: ligne").
+
+    speed=1 respecte le rythme d'origine, speed=10 va dix fois plus vite,
+    speed=0 envoie tout sans attendre (benchmark). Les lignes sans horodatage
+    sont rejouées immédiatement. Sans loop, la source reste ouverte et muette
+    une fois la capture terminée (pas de ré-insertion en boucle).
+    """
+    kind = 'replay'
+    LINE_RE = re.compile(rb'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)?): ?(.*)$', re.S)
+
+    def __init__(self, path, speed=1.0, loop=False, timeout=1.0):
+        super().__init__(timeout)
+        self.path, self.speed, self.loop = path, float(speed), loop
+        self._file = None
+        self._pending = None     # (instant de rejeu monotonic, ligne) pas encore dû
+        self._t0_capture = None
+        self._t0_replay = None
+        self._exhausted = False
+
+    @property
+    def is_open(self):
+        return self._file is not None
+
+    def describe(self):
+        return f"replay://{self.path}"
+
+    def open(self):
+        try:
+            self._file = open(self.path, 'rb')
+        except OSError as e:
+            raise SourceError(f"Capture introuvable {self.path}: {e}") from e
+        self._pending = None
+        self._t0_capture = self._t0_replay = None
+        self._exhausted = False
+
+    def close(self):
+        if self._file:
+            self._file.close()
+        self._file = None
+
+    def _next_line(self):
+        raw = self._file.readline()
+        if not raw:
+            if not self.loop: return None
+            self._file.seek(0); self._t0_capture = self._t0_replay = None
+            raw = self._file.readline()
+            if not raw: raise SourceError(f"Capture vide {self.path}")
+        m = self.LINE_RE.match(raw.rstrip(b'\r\n'))
+        if not m:
+            return time.monotonic(), _normalize_text(raw)
+        line = _normalize_text(m.group(2)) + b'\n'
+        if self.speed <= 0:
+            return time.monotonic(), line
+        ts = datetime.strptime(m.group(1).decode(), '%Y-%m-%d %H:%M:%S.%f' if b'.' in m.group(1)
+                               else '%Y-%m-%d %H:%M:%S').timestamp()
+        now = time.monotonic()
+        if self._t0_capture is None: self._t0_capture, self._t0_replay = ts, now
+        return self._t0_replay + (ts - self._t0_capture) / self.speed, line
+
+    def readline(self):
+        if self._exhausted:
+            time.sleep(self.timeout)
+            return b''
+        if self._pending is None:
+            self._pending = self._next_line()
+            if self._pending is None:
+                self._exhausted = True
+                log.info("Fin de la capture %s (rejeu terminé)", self.path)
+                return b''
+        due, line = self._pending
+        delay = due - time.monotonic()
+        if delay > self.timeout:
+            # Pas encore l'heure: on rend la main au lecteur (qui vérifie l'arrêt)
+            time.sleep(self.timeout)
+            return b''
+        if delay > 0: time.sleep(delay)
+        self._pending = None
+        return line
+
+
+class PtySource(Source):
+    """Pseudo-terminal (Linux/macOS): un outil externe écrit dans l'esclave affiché.
+
+    Exemple: `python app.py` avec BALLOON_SOURCE=pty:// puis
+    `cat capture.txt > /dev/pts/N`. Pratique pour simuler l'ESP32 sans matériel.
+    """
+    kind = 'pty'
+
+    def __init__(self, timeout=1.0):
+        super().__init__(timeout)
+        self._master = self._slave = None
+        self.slave_name = None
+
+    @property
+    def is_open(self):
+        return self._master is not None
+
+    def describe(self):
+        return f"pty://{self.slave_name}" if self.slave_name else "pty://"
+
+    def fileno(self):
+        return self._master
+
+    def open(self):
+        try:
+            import tty
+            self._master, self._slave = os.openpty()
+            tty.setraw(self._slave)  # pas d'écho ni de traduction de fins de ligne
+            self.slave_name = os.ttyname(self._slave)
+        except (OSError, AttributeError, ImportError) as e:
+            self.close()
+            raise SourceError(f"pty indisponible sur ce système: {e}") from e
+        log.info("Source pty prête: écrivez les lignes dans %s", self.slave_name)
+
+    def close(self):
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                try: os.close(fd)
+                except OSError: pass
+        self._master = self._slave = None
+        self._buffer.clear()
+
+    def _read_chunk(self):
+        ready, _, _ = select.select([self._master], [], [], self.timeout)
+        if not ready: return b''
+        try:
+            return os.read(self._master, 4096)
+        except OSError as e:
+            raise SourceError(f"Erreur lecture {self.describe()}: {e}") from e
+
+
+def make_source(url, default_baud=115200, timeout=1.0):
+    """Construit une source depuis une URL.
+
+    serial://COM5?baud=115200  (ou simplement 'COM5', '/dev/ttyUSB0')
+    tcp://192.168.4.1:3333     tcp-listen://0.0.0.0:3333
+    udp://0.0.0.0:3334         replay://serial_log.txt?speed=10&loop=1
+    pty://
+    """
+    if '://' not in url:
+        return SerialSource(url, default_baud, timeout=timeout)
+    parsed = urlparse(url)
+    query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+    scheme = parsed.scheme.lower()
+    if scheme == 'serial':
+        # Les ports Windows (COM5) arrivent dans netloc, les chemins Unix dans path
+        port = parsed.netloc + parsed.path
+        return SerialSource(port, int(query.get('baud', default_baud)), timeout=timeout)
+    if scheme in ('tcp', 'tcp-listen', 'udp'):
+        host = parsed.hostname or ('0.0.0.0' if scheme != 'tcp' else 'localhost')
+        if parsed.port is None: raise ValueError(f"Port manquant dans '{url}'")
+        cls = {'tcp': TcpClientSource, 'tcp-listen': TcpServerSource, 'udp': UdpSource}[scheme]
+        return cls(host, parsed.port, timeout=timeout)
+    if scheme == 'replay':
+        path = parsed.netloc + parsed.path
+        return ReplaySource(path, speed=float(query.get('speed', 1.0)),
+                            loop=query.get('loop', '0') in ('1', 'true', 'yes'), timeout=timeout)
+    if scheme == 'pty':
+        return PtySource(timeout=timeout)
+    raise ValueError(f"Type de source inconnu: '{scheme}' ({url})")
@@ -0,0 +1,159 @@
+# spatial.py - Index spatial R*Tree des fixes GPS (emprise, rayon, plus proches voisins)
+#
+# telemetry_rtree(id, min_lat, max_lat, min_lon, max_lon) a une boîte réduite
+# à un point par ligne de telemetry qui a un fix (même id). Des triggers la
+# tiennent à jour dans la transaction de l'INSERT (écrivain DB, rejeu du
+# journal...) et du DELETE (rollover de l'archive). Les lignes déjà en base
+# sont indexées à la création.
+#
+# Le R*Tree stocke des flottants 32 bits arrondis vers l'extérieur: il donne
+# un sur-ensemble, re-filtré sur les coordonnées exactes de telemetry. Les
+# heures archivées en Parquet sont lues via archive.read_bbox (segments
+# écartés par leurs min/max lat/lon). Distances: haversine vectorisée.
+#
+#   fixes_in_bbox   fixes dans une emprise (vue de la carte), par temps croissant
+#   fixes_in_radius fixes à moins de radius_m d'un point, du plus proche au plus loin
+#   nearest_fixes   k fixes les plus proches (rayon élargi jusqu'à en avoir k, puis borné par la k-ième distance)
+
+import math
+
+import numpy as np
+
+import archive
+from analytics import EARTH_RADIUS_M, haversine_m
+
+FIX_COLUMNS = ('id', 'timestamp', 'latitude', 'longitude', 'altitude_gps', 'flight_id')
+NEAREST_START_M = 500.0            # Premier rayon de recherche des plus proches voisins
+MAX_RADIUS_M = math.pi * EARTH_RADIUS_M # Demi-circonférence: tout le globe
+
+CREATE_RTREE_SQL = ("CREATE VIRTUAL TABLE IF NOT EXISTS telemetry_rtree "
+                    "USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+CREATE_TRIGGERS_SQL = (
+    """CREATE TRIGGER IF NOT EXISTS telemetry_rtree_insert AFTER INSERT ON telemetry
+    WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL BEGIN
+        INSERT INTO telemetry_rtree VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS telemetry_rtree_delete AFTER DELETE ON telemetry BEGIN
+        DELETE FROM telemetry_rtree WHERE id = OLD.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS telemetry_rtree_update AFTER UPDATE OF latitude, longitude ON telemetry BEGIN
+        DELETE FROM telemetry_rtree WHERE id = OLD.id;
+        INSERT INTO telemetry_rtree SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+    END""",
+)
+_BACKFILL_SQL = ("INSERT INTO telemetry_rtree SELECT id, latitude, latitude, longitude, longitude "
+                 "FROM telemetry WHERE latitude IS NOT NULL AND longitude IS NOT NULL")
+
+
+def init_spatial(conn):
+    """Crée l'index et ses triggers; indexe les fixes existants à la création. Retourne le nombre indexé."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'telemetry_rtree'").fetchone()
+    conn.execute(CREATE_RTREE_SQL)
+    for sql in CREATE_TRIGGERS_SQL: conn.execute(sql)
+    if exists: return 0
+    return conn.execute(_BACKFILL_SQL).rowcount
+
+
+def _boxes(south, north, west, east):
+    """Emprise -> boîtes (sud, nord, ouest, est); coupée en deux si elle traverse l'antiméridien (ouest > est)."""
+    if west <= east: return [(south, north, west, east)]
+    return [(south, north, west, 180.0), (south, north, -180.0, east)]
+
+
+def _boxes_around(lat, lon, radius_m):
+    """Boîtes qui contiennent le cercle de rayon radius_m autour de (lat, lon)."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    south, north = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    if south <= -90.0 or north >= 90.0: return [(south, north, -180.0, 180.0)] # Pôle dans le cercle
+    dlon = math.degrees(math.asin(min(1.0, math.sin(radius_m / EARTH_RADIUS_M) / math.cos(math.radians(lat)))))
+    if radius_m >= MAX_RADIUS_M / 2 or dlon >= 180.0: return [(south, north, -180.0, 180.0)]
+    west, east = lon - dlon, lon + dlon
+    if west < -180.0: west += 360.0
+    if east > 180.0: east -= 360.0
+    return _boxes(south, north, west, east)
+
+
+def _fetch_box(conn, box, start, end, flight):
+    """Fixes (tuples FIX_COLUMNS) d'une boîte: R*Tree + lignes exactes de telemetry, puis archive."""
+    south, north, west, east = box
+    clauses = ["r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?",
+               "t.latitude BETWEEN ? AND ? AND t.longitude BETWEEN ? AND ?"]
+    params = [south, north, west, east, south, north, west, east]
+    if flight is not None: clauses.append("t.flight_id = ?"); params.append(flight)
+    if start is not None: clauses.append("t.timestamp >= ?"); params.append(start)
+    if end is not None: clauses.append("t.timestamp <= ?"); params.append(end)
+    # CROSS JOIN: le R*Tree pilote la requête (sinon l'index (flight_id, timestamp) peut être préféré)
+    rows = conn.execute(f"SELECT {', '.join('t.' + c for c in FIX_COLUMNS)} "
+                        f"FROM telemetry_rtree r CROSS JOIN telemetry t ON t.id = r.id "
+                        f"WHERE {' AND '.join(clauses)}", params).fetchall()
+    table = archive.read_bbox(conn, FIX_COLUMNS, south, north, west, east, start, end, flight)
+    if table is not None: rows.extend(zip(*(column.to_pylist() for column in table.columns)))
+    return rows
+
+
+def _fetch(conn, boxes, start, end, flight):
+    rows, seen = [], set()
+    for box in boxes:
+        for row in _fetch_box(conn, box, start, end, flight):
+            if row[0] not in seen: seen.add(row[0]); rows.append(row) # Point sur le bord commun de deux boîtes
+    return rows
+
+
+def _as_dicts(rows, distances=None):
+    fixes = [dict(zip(FIX_COLUMNS, row)) for row in rows]
+    if distances is not None:
+        for fix, d in zip(fixes, distances): fix['distance_m'] = round(float(d), 1)
+    return fixes
+
+
+def _distances(rows, lat, lon):
+    lats = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+    lons = np.fromiter((row[3] for row in rows), dtype=np.float64, count=len(rows))
+    return haversine_m(lat, lon, lats, lons)
+
+
+def _thin(items, limit):
+    """Au plus `limit` éléments régulièrement espacés (None = tous)."""
+    if limit is None or len(items) <= limit: return items
+    return [items[i] for i in np.linspace(0, len(items) - 1, limit).round().astype(int)]
+
+
+def fixes_in_bbox(conn, south, north, west, east, start=None, end=None, flight=None, limit=None):
+    """(nombre total, fixes) dans l'emprise par temps croissant; au-delà de `limit`, fixes régulièrement espacés."""
+    rows = _fetch(conn, _boxes(south, north, west, east), start, end, flight)
+    rows.sort(key=lambda row: (row[1], row[0]))
+    return len(rows), _as_dicts(_thin(rows, limit))
+
+
+def fixes_in_radius(conn, lat, lon, radius_m, start=None, end=None, flight=None, limit=None):
+    """(nombre total, fixes avec distance_m) à moins de radius_m, du plus proche au plus loin (les `limit` premiers)."""
+    rows = _fetch(conn, _boxes_around(lat, lon, radius_m), start, end, flight)
+    if not rows: return 0, []
+    distances = _distances(rows, lat, lon)
+    inside = np.flatnonzero(distances <= radius_m)
+    order = inside[np.argsort(distances[inside], kind='stable')][:limit]
+    return len(inside), _as_dicts([rows[i] for i in order], distances[order])
+
+
+def nearest_fixes(conn, lat, lon, k=1, start=None, end=None, flight=None, max_radius_m=MAX_RADIUS_M):
+    """Les k fixes les plus proches (distance_m), à moins de max_radius_m.
+
+    Le rayon de recherche est multiplié par 4 jusqu'à ce que ses boîtes
+    contiennent k fixes; la k-ième distance parmi eux borne alors la réponse:
+    une dernière requête à ce rayon suffit (pas de parcours complet).
+    """
+    radius = min(NEAREST_START_M, max_radius_m)
+    while True:
+        rows = _fetch(conn, _boxes_around(lat, lon, radius), start, end, flight)
+        if len(rows) >= k or radius >= max_radius_m: break
+        radius = min(radius * 4, max_radius_m)
+    if not rows: return []
+    bound = min(float(np.partition(_distances(rows, lat, lon), k - 1)[k - 1]) if len(rows) >= k else radius,
+                max_radius_m)
+    if bound > radius: # Des fixes hors des boîtes peuvent être plus proches que le k-ième trouvé
+        rows = _fetch(conn, _boxes_around(lat, lon, bound), start, end, flight)
+    distances = _distances(rows, lat, lon)
+    inside = np.flatnonzero(distances <= bound)
+    order = inside[np.argsort(distances[inside], kind='stable')][:k]
+    return _as_dicts([rows[i] for i in order], distances[order])
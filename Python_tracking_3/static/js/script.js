@@ -5,7 +5,9 @@ $(document).ready(function () {
   const CONFIG = {
     MAP_INITIAL_COORDS: [14.498, -17.071], // Coordonnées initiales
     MAP_INITIAL_ZOOM: 13,
-    MAP_MAX_BALLOON_TRACK_POINTS: 500, // Max points pour le tracé du ballon
+    TRACK_MAX_POINTS: 2000, // Sommets max du tracé complet simplifié par le serveur (/api/track)
+    TRACK_REFRESH_POINTS: 200, // Points ajoutés en direct avant de recharger le tracé simplifié
+    TRACK_RELOAD_DELAY_MS: 300, // Regroupe les rechargements (zoom, rafale de points)
     CHART_MAX_POINTS: 100, // Max points pour le graphique
     STALE_DATA_THRESHOLD_MS: 60000, // 1 minute avant de considérer les données périmées
     GEOLOCATION_TIMEOUT: 10000, // Timeout pour la géolocalisation (10s)
@@ -14,6 +16,9 @@ $(document).ready(function () {
     USER_MARKER_ICON_URL: "https://img.icons8.com/color/48/000000/marker.png",
     BALLOON_MARKER_ICON_URL: "https://img.icons8.com/office/40/000000/hot-air-balloon.png",
     OSRM_SERVICE_URL: "https://router.project-osrm.org/route/v1", // Service de routage
+    COMPACT_PROTOCOL: false, // true = deltas binaires 'update_bin' (économise la data mobile)
+    CHASE_REGISTER_INTERVAL_MS: 5000, // Position envoyée au serveur au plus toutes les 5 s (service de poursuite)
+    FLIGHT_ID: new URLSearchParams(window.location.search).get("flight"), // ?flight=b2 (défaut: vol principal)
   };
 
   // =========================================================================
@@ -24,14 +29,26 @@ $(document).ready(function () {
   let userMarker;
   let userAccuracyCircle = null; // Cercle de précision pour l'utilisateur
   let balloonTrack; // Tracé du ballon (Polyline)
+  let trackLivePoints = []; // Points ajoutés en direct depuis le dernier tracé simplifié {timestamp, latlng}
+  let trackLastTimestamp = null; // Dernier point présent dans le tracé
+  let trackRequestSeq = 0; // Seule la réponse de la dernière requête /api/track est appliquée
+  let trackReloadTimer = null;
+  let predictionMarker = null; // Point d'atterrissage prédit (serveur, 'prediction_update')
+  let predictionEllipse = null; // Ellipse d'incertitude 95 % autour du point prédit
+  let predictionLine = null; // Ballon -> point prédit
   let routingControl; // Contrôle de routage Leaflet
   let altitudeChart; // Instance du graphique Chart.js
   let socket; // Connexion WebSocket
+  let compactLayout = null; // Layout binaire envoyé par le serveur (protocole compact)
+  let compactState = {}; // État reconstruit à partir des trames delta
+  let lastReceivedTimestamp = null; // Dernier point reçu (reprise de l'historique à la reconnexion)
 
   let isFollowingBalloon = false; // Flag pour le suivi auto du ballon sur la carte
   let lastKnownBalloonPosition = null; // Dernières coordonnées valides reçues du ballon
   let firstValidBalloonPosition = null; // PREMIÈRES coordonnées valides reçues (départ du track)
   let lastKnownUserPosition = null; // Dernières coordonnées connues de l'utilisateur
+  let chaserPosition = null; // Position envoyée par 'register_chaser' (renvoyée à la reconnexion)
+  let chaserSentAt = 0; // Dernier envoi de la position au serveur (ms)
   let lastValidDataTimestamp = null; // Timestamp de la dernière donnée reçue du serveur
   let geolocationWatchId = null; // ID pour le suivi continu de la position utilisateur (watchPosition)
 
@@ -52,6 +69,7 @@ $(document).ready(function () {
     satellites: $("#satellites"),
     speedKmh: $("#speed_kmh"),
     rssi: $("#rssi"),
+    snr: $("#snr"),
     temperature: $("#temperature"),
     pressure: $("#pressure"),
     humidity: $("#humidity"),
@@ -151,6 +169,7 @@ $(document).ready(function () {
 
       // Tracé du ballon (initialement vide)
       balloonTrack = L.polyline([], { color: "red", weight: 3 }).addTo(map);
+      map.on("zoomend", () => scheduleTrackReload()); // Tolérance de simplification liée au zoom
 
       // Contrôle de routage (initialement caché)
       routingControl = L.Routing.control({
@@ -176,9 +195,85 @@ $(document).ready(function () {
     }
   }
 
+  // Polygone approchant l'ellipse (demi-axes en mètres, grand axe orienté depuis le nord vers l'est)
+  function ellipseLatLngs(center, semiMajor, semiMinor, bearingDeg, steps = 48) {
+    const b = (bearingDeg * Math.PI) / 180;
+    const mPerDegLat = 111320;
+    const mPerDegLon = 111320 * Math.cos((center.lat * Math.PI) / 180);
+    const points = [];
+    for (let i = 0; i < steps; i++) {
+      const a = (2 * Math.PI * i) / steps;
+      const u = semiMajor * Math.cos(a), v = semiMinor * Math.sin(a);
+      const east = u * Math.sin(b) + v * Math.cos(b);
+      const north = u * Math.cos(b) - v * Math.sin(b);
+      points.push(L.latLng(center.lat + north / mPerDegLat, center.lng + east / mPerDegLon));
+    }
+    return points;
+  }
+
+  function updatePrediction(prediction) {
+    if (!map || !prediction?.landing) return;
+    const landing = L.latLng(prediction.landing.latitude, prediction.landing.longitude);
+    const eta = new Date(prediction.landing.eta * 1000).toLocaleTimeString();
+    const popup = `<b>Atterrissage prédit</b><br>${landing.lat.toFixed(5)}, ${landing.lng.toFixed(5)}<br>` +
+      `ETA: ${eta} (${Math.round(prediction.landing.time_to_landing_s / 60)} min)<br>` +
+      `Incertitude 95 %: ${(prediction.ellipse.semi_major_m / 1000).toFixed(1)} × ${(prediction.ellipse.semi_minor_m / 1000).toFixed(1)} km`;
+    const ellipse = ellipseLatLngs(landing, prediction.ellipse.semi_major_m, prediction.ellipse.semi_minor_m, prediction.ellipse.bearing_deg);
+    const path = [L.latLng(prediction.latitude, prediction.longitude), landing];
+    if (!predictionMarker) {
+      predictionMarker = L.circleMarker(landing, { radius: 7, color: "darkorange", fillColor: "orange", fillOpacity: 0.9 }).addTo(map).bindPopup(popup);
+      predictionEllipse = L.polygon(ellipse, { color: "orange", weight: 1, fillOpacity: 0.15, interactive: false }).addTo(map);
+      predictionLine = L.polyline(path, { color: "orange", weight: 2, dashArray: "6 6", interactive: false }).addTo(map);
+    } else {
+      predictionMarker.setLatLng(landing).setPopupContent(popup);
+      predictionEllipse.setLatLngs(ellipse);
+      predictionLine.setLatLngs(path);
+    }
+  }
+
   // =========================================================================
   // Initialisation Graphique (Chart.js)
   // =========================================================================
+  // =========================================================================
+  // Tracé complet du vol (simplifié côté serveur selon le zoom)
+  // =========================================================================
+  function loadTrack() {
+    if (!map || !balloonTrack) return;
+    const seq = ++trackRequestSeq;
+    const params = new URLSearchParams({ zoom: map.getZoom(), max_points: CONFIG.TRACK_MAX_POINTS });
+    if (CONFIG.FLIGHT_ID) params.set("flight", CONFIG.FLIGHT_ID);
+    fetch(`/api/track?${params}`)
+      .then((response) => (response.ok ? response.json() : Promise.reject(new Error(`HTTP ${response.status}`))))
+      .then((feature) => {
+        if (seq !== trackRequestSeq) return; // Une requête plus récente est partie
+        const latlngs = feature.geometry.coordinates.map((c) => L.latLng(c[1], c[0])); // [lon, lat, alt]
+        const last = feature.properties.last_timestamp;
+        // Garder les points arrivés en direct après ceux que le serveur connaissait
+        trackLivePoints = trackLivePoints.filter((p) => last === null || !(p.timestamp <= last));
+        trackLivePoints.forEach((p) => latlngs.push(p.latlng));
+        balloonTrack.setLatLngs(latlngs);
+        if (last !== null && (trackLastTimestamp === null || last > trackLastTimestamp)) trackLastTimestamp = last;
+        console.log(`Track loaded: ${feature.properties.points}/${feature.properties.raw_points} points (zoom ${feature.properties.zoom})`);
+      })
+      .catch((err) => console.warn("Track load failed:", err));
+  }
+
+  function scheduleTrackReload() {
+    clearTimeout(trackReloadTimer);
+    trackReloadTimer = setTimeout(() => { trackReloadTimer = null; loadTrack(); }, CONFIG.TRACK_RELOAD_DELAY_MS);
+  }
+
+  function addTrackPoint(timestamp, latlng) {
+    if (!balloonTrack) return;
+    const hasTime = typeof timestamp === "number";
+    if (hasTime && trackLastTimestamp !== null && timestamp <= trackLastTimestamp) return; // Déjà dans le tracé
+    if (hasTime) trackLastTimestamp = timestamp;
+    trackLivePoints.push({ timestamp, latlng });
+    balloonTrack.addLatLng(latlng);
+    // Assez de points bruts ajoutés: tracé simplifié rechargé (sans repousser un rechargement déjà prévu)
+    if (trackLivePoints.length >= CONFIG.TRACK_REFRESH_POINTS && !trackReloadTimer) scheduleTrackReload();
+  }
+
   function initChart() {
     try {
       if ($ui.altitudeChartCanvas.length === 0) {
@@ -217,8 +312,16 @@ $(document).ready(function () {
   // =========================================================================
   // Mise à jour de l'Interface Utilisateur (UI) - Réception Données Ballon
   // =========================================================================
+  // Altitude du graphique: filtrée côté serveur (fusion GPS + baro) si disponible, sinon baromètre brut
+  function chartAltitudeOf(point) {
+    return typeof point.altitude_fused === "number" ? point.altitude_fused : point.altitude_bme;
+  }
+
   function updateUI(data) {
     if (!data) { console.warn("updateUI called with null data."); return; }
+    if (data.timestamp && (lastReceivedTimestamp === null || data.timestamp > lastReceivedTimestamp)) {
+      lastReceivedTimestamp = data.timestamp;
+    }
 
     // Gérer Erreur Serveur spécifique
     if (data.error) { setError(`Erreur serveur: ${data.error}`, true); return; }
@@ -240,6 +343,7 @@ $(document).ready(function () {
     $ui.satellites.text(formatInt(data.satellites));
     $ui.speedKmh.text(formatFloat(data.speed_kmh, 1));
     $ui.rssi.text(formatInt(data.rssi));
+    $ui.snr.text(formatFloat(data.snr, 2));
     $ui.temperature.text(formatFloat(data.temperature, 1));
     const pressureHpa = data.pressure !== null && typeof data.pressure !== "undefined" ? (parseFloat(data.pressure) / 100.0).toFixed(1) : "N/A";
     $ui.pressure.text(pressureHpa);
@@ -274,14 +378,7 @@ $(document).ready(function () {
         balloonMarker.setPopupContent(popupContent);
 
         // Ajouter au tracé
-        if (balloonTrack) {
-          balloonTrack.addLatLng(newLatLng);
-          let latlngs = balloonTrack.getLatLngs();
-          if (latlngs.length > CONFIG.MAP_MAX_BALLOON_TRACK_POINTS) {
-            latlngs.splice(0, latlngs.length - CONFIG.MAP_MAX_BALLOON_TRACK_POINTS);
-            balloonTrack.setLatLngs(latlngs);
-          }
-        }
+        addTrackPoint(data.timestamp, newLatLng);
 
         // Suivre le ballon si activé
         if (isFollowingBalloon) map.panTo(newLatLng);
@@ -309,14 +406,15 @@ $(document).ready(function () {
     } else { console.error("Map/Marker non initialisé pour updateUI"); }
 
     // Mise à jour Graphique Altitude
-    const hasValidAltitude = typeof data.altitude_bme === "number" && !isNaN(data.altitude_bme);
+    const chartAltitude = chartAltitudeOf(data);
+    const hasValidAltitude = typeof chartAltitude === "number" && !isNaN(chartAltitude);
     const hasValidTimestampForChart = data.timestamp && data.timestamp > 0;
 
     if (altitudeChart) {
       if (hasValidAltitude && hasValidTimestampForChart) {
         try {
           const timestampMs = data.timestamp * 1000;
-          const altitude = data.altitude_bme;
+          const altitude = chartAltitude;
           altitudeChart.data.labels.push(timestampMs);
           altitudeChart.data.datasets[0].data.push(altitude);
           // Limiter le nombre de points dans le graphique
@@ -330,17 +428,56 @@ $(document).ready(function () {
     } else { console.error("Chart non initialisé pour updateUI"); }
   }
 
+  // =========================================================================
+  // Protocole compact: application d'une trame delta binaire (voir wire.py)
+  // =========================================================================
+  const textDecoder = new TextDecoder();
+  function applyCompactFrame(buffer) {
+    if (!compactLayout) return null;
+    const view = new DataView(buffer);
+    const flags = view.getUint8(0);
+    const changed = view.getUint32(3, true);
+    const nulls = view.getUint32(7, true);
+    let offset = 11; // Taille de l'en-tête '<BHII'
+    if (flags & 0x01) compactState = {}; // Trame clé: état complet
+    compactLayout.fields.forEach((name, i) => {
+      if (!((changed >>> i) & 1)) return;
+      if ((nulls >>> i) & 1) { compactState[name] = null; return; }
+      switch (compactLayout.codes[i]) {
+        case "d": compactState[name] = view.getFloat64(offset, true); offset += 8; break;
+        case "f": compactState[name] = Number(view.getFloat32(offset, true).toPrecision(7)); offset += 4; break;
+        case "i": compactState[name] = view.getInt32(offset, true); offset += 4; break;
+        case "s": {
+          const len = view.getUint16(offset, true); offset += 2;
+          compactState[name] = textDecoder.decode(new Uint8Array(buffer, offset, len)); offset += len; break;
+        }
+      }
+    });
+    return { ...compactState };
+  }
+
   // =========================================================================
   // Gestion des Événements SocketIO (Connexion Serveur)
   // =========================================================================
   function setupSocketIO() {
     if (socket) socket.disconnect();
-    socket = io(); // Connexion au serveur Socket.IO
+    // Connexion au serveur Socket.IO (protocole compact en option). auth est réévalué à chaque
+    // (re)connexion: après une coupure, 'since' demande seulement les points manqués.
+    socket = io({
+      auth: (cb) => {
+        const auth = {};
+        if (CONFIG.COMPACT_PROTOCOL) auth.proto = "delta";
+        if (CONFIG.FLIGHT_ID) auth.flight = CONFIG.FLIGHT_ID;
+        if (lastReceivedTimestamp !== null) auth.since = lastReceivedTimestamp;
+        cb(auth);
+      },
+    });
 
     socket.on("connect", () => {
       console.log("SocketIO connected.");
       $ui.connectionStatus.removeClass("status-disconnected status-error").addClass("status-ok").attr("title", "Websocket Connecté");
       clearPersistentError();
+      if (chaserPosition) sendChaserPosition(true); // Le serveur oublie les chasseurs déconnectés
     });
 
     socket.on("disconnect", (reason) => {
@@ -356,27 +493,46 @@ $(document).ready(function () {
     });
 
     // Réception des données mises à jour
-    socket.on("update_data", (data) => {
+    socket.on("update_data", (data, ack) => {
       $ui.connectionStatus.addClass("status-receiving"); // Feedback visuel rapide
       setTimeout(() => $ui.connectionStatus.removeClass("status-receiving"), 500);
       updateUI(data); // Appeler la fonction principale de mise à jour
+      if (typeof ack === "function") ack(); // Acquittement: le serveur peut envoyer la trame suivante
+    });
+
+    // Protocole compact: layout puis trames delta binaires
+    socket.on("protocol", (info) => {
+      compactLayout = info.layout; compactState = {};
+      console.log("Compact protocol enabled:", info.mode);
+    });
+
+    socket.on("update_bin", (buffer, ack) => {
+      const data = applyCompactFrame(buffer);
+      if (data) {
+        $ui.connectionStatus.addClass("status-receiving");
+        setTimeout(() => $ui.connectionStatus.removeClass("status-receiving"), 500);
+        updateUI(data);
+      } else {
+        socket.emit("resync"); // Layout pas encore reçu: redemander une trame clé
+      }
+      if (typeof ack === "function") ack();
     });
 
     // Réception de l'historique initial
     socket.on("initial_history", (history) => {
       console.log(`Initial history received (${history?.length || 0} points)`);
+      loadTrack(); // Tracé complet du vol (l'historique ne couvre que les derniers points)
       if (!history || history.length === 0) return;
 
-      const chartLabels = []; const chartAltitudes = []; const trackPoints = [];
+      const chartLabels = []; const chartAltitudes = [];
       let lastValidHistoryPoint = null; firstValidBalloonPosition = null; // Reset first pos
 
       history.forEach((point) => {
-        if (point && typeof point.altitude_bme === "number" && point.timestamp > 0) {
-          chartLabels.push(point.timestamp * 1000); chartAltitudes.push(point.altitude_bme);
+        if (point && typeof chartAltitudeOf(point) === "number" && point.timestamp > 0) {
+          chartLabels.push(point.timestamp * 1000); chartAltitudes.push(chartAltitudeOf(point));
         }
         if (point && typeof point.latitude === "number" && typeof point.longitude === "number") {
           const histLatLng = L.latLng(point.latitude, point.longitude);
-          trackPoints.push(histLatLng);
           lastValidHistoryPoint = point; // Garder le dernier point valide
           if (firstValidBalloonPosition === null) { // Trouver la première position valide de l'historique
               firstValidBalloonPosition = histLatLng;
@@ -390,11 +546,6 @@ $(document).ready(function () {
         altitudeChart.data.datasets[0].data = chartAltitudes.slice(-CONFIG.CHART_MAX_POINTS);
         altitudeChart.update("none");
       }
-      // Mettre à jour le tracé du ballon avec l'historique
-      if (balloonTrack && trackPoints.length > 0) {
-        const limitedTrack = trackPoints.slice(-CONFIG.MAP_MAX_BALLOON_TRACK_POINTS);
-        balloonTrack.setLatLngs(limitedTrack);
-      }
       // Mettre à jour l'UI avec le dernier point de l'historique
       if (lastValidHistoryPoint) {
         updateUI(lastValidHistoryPoint); // Appelle updateUI qui gère lastKnown/firstValid
@@ -405,18 +556,49 @@ $(document).ready(function () {
       }
     });
 
+    // Reprise après reconnexion: seulement les points manqués, ajoutés à la suite
+    socket.on("history_since", (resume) => {
+      const points = resume?.points || [];
+      console.log(`History resumed since ${resume?.since} (${points.length} points)`);
+      points.forEach((point) => {
+        if (altitudeChart && typeof chartAltitudeOf(point) === "number" && point.timestamp > 0) {
+          altitudeChart.data.labels.push(point.timestamp * 1000);
+          altitudeChart.data.datasets[0].data.push(chartAltitudeOf(point));
+        }
+        if (typeof point.latitude === "number" && typeof point.longitude === "number") {
+          addTrackPoint(point.timestamp, L.latLng(point.latitude, point.longitude));
+        }
+      });
+      if (altitudeChart) {
+        const excess = altitudeChart.data.labels.length - CONFIG.CHART_MAX_POINTS;
+        if (excess > 0) {
+          altitudeChart.data.labels.splice(0, excess);
+          altitudeChart.data.datasets[0].data.splice(0, excess);
+        }
+        altitudeChart.update("none");
+      }
+      if (points.length > 0) updateUI(points[points.length - 1]);
+    });
+
+    // Distance / cap / élévation / ETA calculés par le serveur à chaque fix (après register_chaser)
+    socket.on("chase_update", (chase) => updateChaseInfo(chase));
+
+    // Prédiction d'atterrissage (recalculée côté serveur à chaque fix GPS)
+    socket.on("prediction_update", (prediction) => updatePrediction(prediction));
+
     // Réception du statut de la connexion série (Arduino/ESP)
     socket.on("serial_status", (statusInfo) => {
       console.log("Serial Status:", statusInfo);
       const indicator = $ui.serialStatusIndicator; const text = $ui.serialStatusText;
+      const port = statusInfo.receiver_id ? `${statusInfo.receiver_id}: ${statusInfo.port}` : statusInfo.port;
       indicator.removeClass("status-ok status-error status-receiving status-connecting status-disconnected");
       $ui.navbarError.data("is-persistent", false); // Réinitialiser avant de potentiellement définir une erreur persistante
 
       switch (statusInfo.status) {
         case "connected":
-          indicator.addClass("status-ok").attr("title", `Connecté sur ${statusInfo.port}`); text.text("Connecté"); clearPersistentError(); break;
+          indicator.addClass("status-ok").attr("title", `Connecté sur ${port}`); text.text("Connecté"); clearPersistentError(); break;
         case "receiving":
-          indicator.addClass("status-receiving").attr("title", `Données reçues (${statusInfo.port})`); text.text("Réception..."); clearPersistentError(); break;
+          indicator.addClass("status-receiving").attr("title", `Données reçues (${port})`); text.text("Réception..."); clearPersistentError(); break;
         case "error":
           indicator.addClass("status-error").attr("title", `Erreur: ${statusInfo.message}`); text.text("Erreur"); setError(statusInfo.message || "Erreur série inconnue", true); break;
         case "disconnected": default:
@@ -435,6 +617,10 @@ $(document).ready(function () {
     const lon = position.coords.longitude;
     const accuracy = position.coords.accuracy;
     lastKnownUserPosition = L.latLng(lat, lon); // Stocker la position
+    chaserPosition = { lat, lon };
+    if (typeof position.coords.altitude === "number") chaserPosition.alt = position.coords.altitude;
+    if (typeof position.coords.speed === "number") chaserPosition.speed_kmh = position.coords.speed * 3.6;
+    sendChaserPosition();
 
     console.log(`Position utilisateur MàJ: ${lat.toFixed(5)}, ${lon.toFixed(5)} (Précision: ${accuracy.toFixed(0)}m)`);
 
@@ -555,6 +741,11 @@ $(document).ready(function () {
            .removeClass("btn-success btn-warning").addClass("btn-outline-secondary")
            .html(disableButton ? "Suivi désactivé" : "Suivre ma position");
 
+      // Plus de position partagée: le serveur arrête les 'chase_update'
+      chaserPosition = null;
+      if (socket && socket.connected) socket.emit("unregister_chaser");
+      $ui.distance.text("N/A");
+
       // Optionnel: Atténuer marqueur utilisateur et enlever cercle précision
       if (userMarker) userMarker.setOpacity(0.6);
       if (userAccuracyCircle) { userAccuracyCircle.remove(); userAccuracyCircle = null; }
@@ -599,14 +790,39 @@ $(document).ready(function () {
   // =========================================================================
   // Calcul Distance et Mise à Jour Routage
   // =========================================================================
+  /** Envoie la position de l'utilisateur au service de poursuite (au plus une fois par intervalle) */
+  function sendChaserPosition(force = false) {
+    if (!socket || !socket.connected || !chaserPosition) return;
+    if (!force && Date.now() - chaserSentAt < CONFIG.CHASE_REGISTER_INTERVAL_MS) return;
+    chaserSentAt = Date.now();
+    socket.emit("register_chaser", chaserPosition, (reply) => {
+      if (reply && !reply.ok) console.warn("register_chaser refusé:", reply.error);
+    });
+  }
+
+  /** Affiche distance, cap, élévation et ETA reçus du serveur ('chase_update') */
+  function updateChaseInfo(chase) {
+    if (!chase || !lastKnownUserPosition) return;
+    let text = `${(chase.distance_m / 1000).toFixed(2)} km, cap ${chase.bearing_deg.toFixed(0)}°`;
+    if (typeof chase.elevation_deg === "number") text += `, élév. ${chase.elevation_deg.toFixed(1)}°`;
+    if (typeof chase.eta_s === "number") {
+      const minutes = Math.round(chase.eta_s / 60);
+      const eta = minutes < 60 ? `${minutes} min` : `${Math.floor(minutes / 60)}h ${minutes % 60}min`;
+      text += ` (${chase.target === "landing" ? "atterrissage" : "ballon"} ~${eta}`;
+      if (typeof chase.landing_margin_s === "number") {
+        text += chase.landing_margin_s >= 0 ? `, avance ${Math.round(chase.landing_margin_s / 60)} min`
+                                            : `, retard ${Math.round(-chase.landing_margin_s / 60)} min`;
+      }
+      text += ")";
+    }
+    $ui.distance.text(text);
+  }
+
   function updateDistanceAndRoute() {
     // Nécessite la position de l'utilisateur ET une position (même ancienne) du ballon
+    // (distance, cap et ETA: 'chase_update' du serveur; ici seulement la route OSRM)
     if (lastKnownUserPosition && lastKnownBalloonPosition) {
       try {
-        // Distance à vol d'oiseau
-        const distanceMeters = lastKnownUserPosition.distanceTo(lastKnownBalloonPosition);
-        $ui.distance.text(`${(distanceMeters / 1000).toFixed(2)} km`);
-
         // Mettre à jour les points de départ/arrivée pour le routage
         // Ne le fait que si les deux positions sont valides
         if (routingControl) {
@@ -0,0 +1,124 @@
+# telemetry.py - Schéma unique de la table telemetry + enregistrement compact TelemetryRecord
+#
+# L'ordre de TELEMETRY_SCHEMA est LA référence: il définit la table SQLite,
+# l'ordre des placeholders de l'INSERT, les index du décodeur et le
+# layout des lignes NumPy. Ne jamais réordonner sans migrer la base; une
+# nouvelle colonne s'ajoute à la fin (upgrade_table la crée sur une base existante).
+
+from operator import itemgetter
+
+# (colonne, type SQL) - l'ordre est crucial !
+TELEMETRY_SCHEMA = (
+    ('timestamp', 'REAL NOT NULL'),
+    ('latitude', 'REAL'),
+    ('longitude', 'REAL'),
+    ('altitude_gps', 'REAL'),
+    ('satellites', 'INTEGER'),
+    ('temperature', 'REAL'),
+    ('pressure', 'REAL'),
+    ('humidity', 'REAL'),
+    ('altitude_bme', 'REAL'),
+    ('air_quality', 'INTEGER'),
+    ('tvoc', 'INTEGER'),
+    ('eco2', 'INTEGER'),
+    ('ozone', 'INTEGER'),
+    ('uv_index', 'REAL'),
+    ('pm1_std', 'INTEGER'),
+    ('pm25_std', 'INTEGER'),
+    ('pm10_std', 'INTEGER'),
+    ('rssi', 'INTEGER'),
+    ('speed_kmh', 'REAL'),
+    # Sorties du filtre de fusion (fusion.py), à côté des mesures brutes
+    ('altitude_fused', 'REAL'),
+    ('vspeed_fused', 'REAL'),
+    ('latitude_fused', 'REAL'),
+    ('longitude_fused', 'REAL'),
+    ('speed_fused_kmh', 'REAL'),
+    ('heading_fused', 'REAL'),
+    # Provenance: ballon suivi et station de réception (une chaîne d'ingestion par source)
+    ('flight_id', 'TEXT'),
+    ('receiver_id', 'TEXT'),
+    # Identité du paquet radio (dedup.py): une ligne par paquet, même entendu par plusieurs récepteurs
+    ('packet_key', 'TEXT'),
+    # Rapport signal/bruit LoRa (dB) du paquet, à côté de rssi
+    ('snr', 'REAL'),
+)
+COLUMNS = tuple(name for name, _ in TELEMETRY_SCHEMA)
+N_COLUMNS = len(COLUMNS)
+# Colonnes numériques (NumPy, séries, agrégats); les colonnes TEXT en sont exclues
+NUMERIC_COLUMNS = tuple(name for name, sql_type in TELEMETRY_SCHEMA if not sql_type.startswith('TEXT'))
+# Champs transportés en mémoire mais non stockés (message d'erreur pour l'UI)
+EXTRA_FIELDS = ('error',)
+RECORD_FIELDS = COLUMNS + EXTRA_FIELDS
+FIELD_INDEX = {name: i for i, name in enumerate(RECORD_FIELDS)}
+EMPTY_RECORD = (None,) * len(RECORD_FIELDS)
+
+# Champs capteurs (hors GPS/lien radio): s'il y en a un, le paquet est "utile"
+_SENSOR_SLICE = slice(FIELD_INDEX['temperature'], FIELD_INDEX['pm10_std'] + 1)
+
+CREATE_TABLE_SQL = ("CREATE TABLE IF NOT EXISTS telemetry (\n"
+                    "    id INTEGER PRIMARY KEY AUTOINCREMENT,\n"
+                    + ",\n".join(f"    {name} {sql_type}" for name, sql_type in TELEMETRY_SCHEMA)
+                    + "\n)")
+INSERT_SQL = (f"INSERT INTO telemetry ({', '.join(COLUMNS)}) "
+              f"VALUES ({', '.join(['?'] * N_COLUMNS)})")
+
+
+def upgrade_table(conn):
+    """Ajoute à une table existante les colonnes du schéma qui lui manquent. Retourne leurs noms."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(telemetry)")}
+    added = [(name, sql_type) for name, sql_type in TELEMETRY_SCHEMA if name not in existing]
+    for name, sql_type in added:
+        conn.execute(f"ALTER TABLE telemetry ADD COLUMN {name} {sql_type}")
+    return [name for name, _ in added]
+
+
+class TelemetryRecord(list):
+    """Un paquet décodé, stocké dans une liste de taille fixe (ordre RECORD_FIELDS).
+
+    Pas de __dict__ par instance: accès par attribut (record.latitude) via des
+    propriétés générées, accès par index pour le décodeur. as_row()/as_dict()/
+    as_numpy() produisent directement les formes DB, JSON et NumPy.
+    """
+    __slots__ = ()
+
+    def __init__(self, values=EMPTY_RECORD):
+        super().__init__(values)
+
+    def as_row(self):
+        """Tuple dans l'ordre des colonnes de la table (pour executemany)."""
+        return _ROW_GETTER(self)
+
+    def as_dict(self):
+        """Dict JSON-sérialisable (payload Socket.IO, compatible avec l'ancien format)."""
+        return dict(zip(RECORD_FIELDS, self))
+
+    def as_numpy(self):
+        """Ligne float64 (None -> NaN) dans l'ordre NUMERIC_COLUMNS."""
+        import numpy as np
+        return np.array(_NUMERIC_GETTER(self), dtype=np.float64)
+
+    def has_sensor_data(self):
+        return any(v is not None for v in self[_SENSOR_SLICE])
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """Construit depuis un dict / sqlite3.Row (clés manquantes -> None)."""
+        keys = mapping.keys()
+        return cls([mapping[name] if name in keys else None for name in RECORD_FIELDS])
+
+
+def _field_property(index):
+    return property(itemgetter(index), lambda self, value: self.__setitem__(index, value))
+
+
+for _i, _name in enumerate(RECORD_FIELDS):
+    setattr(TelemetryRecord, _name, _field_property(_i))
+_ROW_GETTER = itemgetter(*range(N_COLUMNS))
+_NUMERIC_GETTER = itemgetter(*(FIELD_INDEX[name] for name in NUMERIC_COLUMNS))
+
+
+def records_to_numpy(records):
+    """Matrice float64 (n_records x len(NUMERIC_COLUMNS)), None -> NaN."""
+    import numpy as np
+    return np.array([_NUMERIC_GETTER(r) for r in records], dtype=np.float64).reshape(-1, len(NUMERIC_COLUMNS))
@@ -0,0 +1,5 @@
+# conftest.py - Les modules du serveur sont à la racine de Python_tracking_3
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
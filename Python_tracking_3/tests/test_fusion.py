@@ -0,0 +1,50 @@
+# test_fusion.py - Filtre vertical: le baromètre doit améliorer le GPS même en atmosphère non standard
+import math
+import random
+
+import pytest
+
+from fusion import FusionFilter
+from telemetry import TelemetryRecord
+
+
+def _standard_pressure(altitude_m):
+    return 101325.0 * (1 - altitude_m / 44330.0) ** 5.255
+
+
+def _ascent_rms(deviation, offset_m, seconds=5000, dt=2.0, rate=5.0, gps_sigma=8.0, seed=1):
+    """RMS (fusionnée, GPS brut) d'une montée à `rate` m/s; l'altitude pression vaut h (1 + deviation) + offset."""
+    rnd = random.Random(seed)
+    fusion = FusionFilter()
+    fused, raw = [], []
+    for i in range(int(seconds / dt)):
+        t = i * dt
+        h = 100.0 + rate * t
+        record = TelemetryRecord()
+        record.timestamp, record.latitude, record.longitude, record.satellites = 1.7e9 + t, 45.0, 5.0, 8
+        record.altitude_gps = h + rnd.gauss(0, gps_sigma)
+        record.pressure = _standard_pressure(h * (1 + deviation) + offset_m) + rnd.gauss(0, 2.0)
+        fusion.update(record)
+        if i >= 50: # Après la convergence initiale
+            fused.append(record.altitude_fused - h)
+            raw.append(record.altitude_gps - h)
+    rms = lambda errors: math.sqrt(sum(e * e for e in errors) / len(errors))
+    return rms(fused), rms(raw)
+
+
+@pytest.mark.parametrize('deviation, offset_m', [(0.0, 0.0), (0.01, 0.0), (0.03, 21.8), (-0.02, -15.0)])
+def test_fused_altitude_beats_gps_in_non_standard_atmosphere(deviation, offset_m):
+    fused, raw = _ascent_rms(deviation, offset_m)
+    assert fused < 0.4 * raw, (fused, raw)
+
+
+def test_gps_rejects_reset_even_while_baro_is_accepted():
+    fusion = FusionFilter()
+    for i in range(40):
+        record = TelemetryRecord()
+        record.timestamp, record.latitude, record.longitude, record.satellites = 1.7e9 + i, 45.0, 5.0, 8
+        record.pressure = _standard_pressure(1000.0)
+        # Le GPS saute de 5 km (nouveau fix valide, baro inchangé): rejeté jusqu'à réinitialisation
+        record.altitude_gps = 1000.0 if i < 20 else 6000.0
+        fusion.update(record)
+    assert abs(record.altitude_fused - 6000.0) < 100.0
@@ -0,0 +1,63 @@
+# test_wire.py - Protocole compact: aller-retour encode_frame / decode_frame, valeurs hors type
+import math
+import time
+
+from broadcaster import Broadcaster
+from decoder import decode
+from telemetry import FIELD_INDEX, RECORD_FIELDS
+from wire import FLAG_KEYFRAME, HEADER, decode_frame, encode_frame
+
+CORRUPTED = 'AIR,1,99999999999,424|ENV,28.33,1e39,50,100' # tvoc > int32, pression > float32
+
+
+def _values(**fields):
+    values = [None] * len(RECORD_FIELDS)
+    for name, value in fields.items(): values[FIELD_INDEX[name]] = value
+    return tuple(values)
+
+
+def test_keyframe_then_delta_round_trip():
+    first = _values(timestamp=1000.5, latitude=45.123456789, longitude=4.5, satellites=9, temperature=21.5,
+                    flight_id='flight1', error='GPS perdu')
+    second = _values(timestamp=1001.5, latitude=45.123456789, longitude=4.5, satellites=10, temperature=21.5,
+                     flight_id='flight1')
+    state = decode_frame(encode_frame(first, None, 1))
+    assert state == list(first)
+    data = encode_frame(second, first, 2)
+    flags, seq, changed, _nulls = HEADER.unpack_from(data, 0)
+    assert not flags & FLAG_KEYFRAME and seq == 2
+    assert not changed >> FIELD_INDEX['latitude'] & 1 # Inchangé: pas transmis
+    assert decode_frame(data, state) == list(second)
+
+
+def test_out_of_range_values_are_sent_as_null():
+    record = decode(CORRUPTED, timestamp=1000.0)
+    state = decode_frame(encode_frame(tuple(record), None, 1))
+    assert state[FIELD_INDEX['tvoc']] is None and state[FIELD_INDEX['pressure']] is None
+    assert state[FIELD_INDEX['air_quality']] == 1 and state[FIELD_INDEX['eco2']] == 424
+    assert math.isclose(state[FIELD_INDEX['temperature']], 28.33, rel_tol=1e-6)
+
+
+class _FakeSocketIO:
+    def __init__(self): self.sent = []
+
+    def emit(self, event, payload, to=None, callback=None):
+        self.sent.append((to, event))
+        if callback: callback()
+
+
+def test_broadcaster_survives_corrupted_packet():
+    socketio = _FakeSocketIO()
+    broadcaster = Broadcaster(socketio, max_rate_hz=0)
+    broadcaster.add_client('json', 'json', 'flight1')
+    broadcaster.add_client('delta', 'delta', 'flight1')
+    broadcaster.start()
+    try:
+        for i, line in enumerate((CORRUPTED, 'AIR,1,400,424', CORRUPTED)):
+            broadcaster.publish(decode(line, timestamp=1000.0 + i), 'flight1')
+            deadline = time.monotonic() + 2
+            while len(socketio.sent) < 2 * (i + 1) and time.monotonic() < deadline: time.sleep(0.01)
+        assert broadcaster._thread.is_alive()
+        assert sorted(socketio.sent) == sorted([('json', 'update_data'), ('delta', 'update_bin')] * 3)
+    finally:
+        broadcaster.stop()
@@ -0,0 +1,241 @@
+# track.py - Tracé complet d'un vol simplifié côté serveur (Douglas-Peucker), par niveau de zoom
+#
+# La carte affiche tout le vol à taille de réponse quasi constante: le tracé
+# est simplifié à une tolérance qui dépend du zoom (PIXEL_TOLERANCE pixel à ce
+# zoom, en mètres au sol), plafonné à `max_points` sommets (zoom plus grossier
+# au-delà). Les coordonnées sont projetées localement (équirectangulaire autour
+# du premier fix), suffisant à l'échelle d'un vol.
+#
+# Cache: un FlightTrack par vol garde tous les fixes (tableaux NumPy qui
+# grandissent par doublement) et, par zoom, la simplification déjà faite.
+# Un nouveau fix ne relance Douglas-Peucker que sur la fin du tracé, depuis le
+# dernier sommet figé: chaque point reste à moins de la tolérance du tracé
+# simplifié, sans recalculer le début du vol.
+#
+# GeoJSON: Feature LineString [lon, lat(, alt)], ou MultiLineString quand le
+# tracé est découpé à une emprise (?bbox= ou tuile ?tile=z/x/y).
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from analytics import EARTH_RADIUS_M
+
+METERS_PER_PIXEL_Z0 = 156543.03392 # Web Mercator, tuiles de 256 px, à l'équateur
+PIXEL_TOLERANCE = 1.0              # Écart max (pixels) entre le tracé simplifié et les fixes
+MIN_ZOOM, MAX_ZOOM = 0, 20
+DEFAULT_MAX_POINTS = 2000
+COORD_DECIMALS = 6                 # ~10 cm: inutile d'envoyer plus
+
+
+def tolerance_m(zoom, latitude=0.0):
+    """Mètres au sol couverts par PIXEL_TOLERANCE pixel au zoom donné."""
+    return PIXEL_TOLERANCE * METERS_PER_PIXEL_Z0 * math.cos(math.radians(latitude)) / 2 ** zoom
+
+
+def douglas_peucker(x, y, tolerance, max_points=None):
+    """Indices (triés) des sommets gardés; distances point-segment calculées par tranche en NumPy.
+
+    None si plus de `max_points` sommets seraient gardés (abandon dès le dépassement).
+    """
+    n = len(x)
+    if n < 3: return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    kept, stack = 2, [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2: continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length2 = dx * dx + dy * dy
+        if length2 == 0: dist = np.hypot(px, py)
+        else: # Distance au segment (projection bornée à [first, last])
+            t = np.clip((px * dx + py * dy) / length2, 0.0, 1.0)
+            dist = np.hypot(px - t * dx, py - t * dy)
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            kept += 1
+            if max_points is not None and kept > max_points: return None
+            stack.append((first, split)); stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def tile_bbox(z, x, y):
+    """Emprise (lon_min, lat_min, lon_max, lat_max) d'une tuile z/x/y (schéma XYZ de Leaflet / OSM)."""
+    def lon(tx): return tx / 2 ** z * 360.0 - 180.0
+    def lat(ty): return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / 2 ** z))))
+    return lon(x), lat(y + 1), lon(x + 1), lat(y)
+
+
+def _clip_runs(lat, lon, bbox):
+    """Suites de sommets dont les segments recoupent l'emprise (test des boîtes englobantes)."""
+    lon_min, lat_min, lon_max, lat_max = bbox
+    if len(lat) == 1:
+        inside = lon_min <= lon[0] <= lon_max and lat_min <= lat[0] <= lat_max
+        return [np.arange(1)] if inside else []
+    seg = ((np.minimum(lon[:-1], lon[1:]) <= lon_max) & (np.maximum(lon[:-1], lon[1:]) >= lon_min)
+           & (np.minimum(lat[:-1], lat[1:]) <= lat_max) & (np.maximum(lat[:-1], lat[1:]) >= lat_min))
+    runs, start = [], None
+    for i, hit in enumerate(seg.tolist()):
+        if hit and start is None: start = i
+        elif not hit and start is not None: runs.append(np.arange(start, i + 1)); start = None
+    if start is not None: runs.append(np.arange(start, len(lat)))
+    return runs
+
+
+class FlightTrack:
+    """Fixes d'un vol dans l'ordre d'arrivée + simplifications incrémentales par zoom."""
+
+    def __init__(self, flight_id, ts=(), lat=(), lon=(), alt=()):
+        self.flight_id = flight_id
+        self._lock = threading.Lock()
+        self.n = 0
+        self._cols = {name: np.empty(max(1024, len(ts))) for name in ('ts', 'lat', 'lon', 'alt', 'x', 'y')}
+        self._lat0 = None
+        self._simplified = {} # zoom -> [sommets figés, ancre, nombre de fixes vus, résultat]
+        self._over = {}       # zoom -> plus petit plafond dépassé (le nombre de sommets ne fait que croître)
+        if len(ts): self.extend(ts, lat, lon, alt)
+
+    @property
+    def last_timestamp(self):
+        with self._lock: return float(self._cols['ts'][self.n - 1]) if self.n else None
+
+    def extend(self, ts, lat, lon, alt):
+        ts, lat, lon = (np.asarray(v, dtype=np.float64) for v in (ts, lat, lon))
+        alt = np.asarray(alt, dtype=np.float64) if alt is not None else np.full(len(ts), np.nan)
+        fix = ~(np.isnan(lat) | np.isnan(lon))
+        ts, lat, lon, alt = ts[fix], lat[fix], lon[fix], alt[fix]
+        if not len(ts): return
+        with self._lock:
+            if self.n + len(ts) > len(self._cols['ts']):
+                size = max(2 * len(self._cols['ts']), self.n + len(ts))
+                for name, column in self._cols.items():
+                    grown = np.empty(size)
+                    grown[:self.n] = column[:self.n]
+                    self._cols[name] = grown
+            if self._lat0 is None: self._lat0 = float(lat[0])
+            end = self.n + len(ts)
+            for name, values in (('ts', ts), ('lat', lat), ('lon', lon), ('alt', alt)):
+                self._cols[name][self.n:end] = values
+            self._cols['x'][self.n:end] = np.radians(lon) * math.cos(math.radians(self._lat0)) * EARTH_RADIUS_M
+            self._cols['y'][self.n:end] = np.radians(lat) * EARTH_RADIUS_M
+            self.n = end
+
+    def add(self, timestamp, latitude, longitude, altitude=None):
+        if latitude is None or longitude is None: return
+        self.extend((timestamp,), (latitude,), (longitude,), (np.nan if altitude is None else altitude,))
+
+    def _simplify(self, zoom, max_points):
+        """Indices gardés au zoom donné, None au-delà de max_points (à appeler sous self._lock)."""
+        if max_points >= self._over.get(zoom, max_points + 1): return None
+        entry = self._simplified.get(zoom)
+        if entry is not None and entry[2] == self.n:
+            return entry[3] if len(entry[3]) <= max_points else None
+        stable, anchor = (entry[0], entry[1]) if entry else (np.empty(0, dtype=np.int64), 0)
+        x, y = self._cols['x'][anchor:self.n], self._cols['y'][anchor:self.n]
+        tail = douglas_peucker(x, y, tolerance_m(zoom, self._lat0), max_points - len(stable))
+        if tail is None or len(stable) + len(tail) > max_points:
+            self._over[zoom] = max_points
+            return None
+        tail += anchor
+        result = np.concatenate((stable, tail))
+        if len(tail) >= 3: # Tout ce qui précède l'avant-dernier sommet est figé
+            stable, anchor = np.concatenate((stable, tail[:-2])), int(tail[-2])
+        self._simplified[zoom] = [stable, anchor, self.n, result]
+        return result
+
+    def simplified(self, zoom, max_points=DEFAULT_MAX_POINTS):
+        """(zoom effectif, ts, lat, lon, alt) simplifiés; zoom plus grossier si plus de max_points sommets."""
+        zoom = min(MAX_ZOOM, max(MIN_ZOOM, int(zoom)))
+        with self._lock:
+            if not self.n: return zoom, np.empty(0), np.empty(0), np.empty(0), np.empty(0)
+            idx = self._simplify(zoom, max_points)
+            while idx is None and zoom > MIN_ZOOM:
+                zoom -= 1
+                idx = self._simplify(zoom, max_points)
+            if idx is None: idx = self._simplify(zoom, self.n) # Plafond inatteignable: zoom 0 tel quel
+            return (zoom,) + tuple(self._cols[name][idx] for name in ('ts', 'lat', 'lon', 'alt'))
+
+    def geojson(self, zoom, max_points=DEFAULT_MAX_POINTS, bbox=None):
+        """Feature GeoJSON du tracé simplifié (découpé à `bbox` si donné)."""
+        used_zoom, ts, lat, lon, alt = self.simplified(zoom, max_points)
+        lat, lon = np.round(lat, COORD_DECIMALS), np.round(lon, COORD_DECIMALS)
+        alt = np.where(np.isnan(alt), np.nan, np.round(alt, 1))
+
+        def positions(idx):
+            return [[x, y] if a != a else [x, y, a] # a != a: altitude NaN
+                    for x, y, a in zip(lon[idx].tolist(), lat[idx].tolist(), alt[idx].tolist())]
+
+        if bbox is None:
+            geometry = {'type': 'LineString', 'coordinates': positions(slice(None))}
+            count = len(ts)
+        else:
+            runs = _clip_runs(lat, lon, bbox)
+            geometry = {'type': 'MultiLineString', 'coordinates': [positions(run) for run in runs]}
+            count = sum(len(run) for run in runs)
+        with self._lock: raw = self.n
+        return {'type': 'Feature', 'geometry': geometry,
+                'properties': {'flight_id': self.flight_id, 'zoom': used_zoom,
+                               'tolerance_m': round(tolerance_m(used_zoom, self._lat0 or 0.0), 2),
+                               'points': count, 'raw_points': raw,
+                               'first_timestamp': float(ts[0]) if len(ts) else None,
+                               'last_timestamp': float(ts[-1]) if len(ts) else None}}
+
+
+class TrackCache:
+    """FlightTrack par vol, chargés à la demande par `loader(flight_id) -> (ts, lat, lon, alt)`.
+
+    Les fixes qui arrivent pendant un chargement sont gardés puis ajoutés après
+    le dernier point chargé. Au-delà de `max_flights` vols, le moins récemment
+    demandé est oublié (rechargé depuis la base au besoin).
+    """
+
+    def __init__(self, loader, max_flights=16):
+        self.loader = loader
+        self.max_flights = max_flights
+        self._lock = threading.Lock()
+        self._tracks = OrderedDict()
+        self._pending = {} # vol en cours de chargement -> fixes arrivés entre-temps
+
+    def add(self, flight_id, record):
+        """Nouveau fix (TelemetryRecord) d'un vol; ignoré si son tracé n'est pas en cache."""
+        if record.latitude is None or record.longitude is None: return
+        fix = (record.timestamp, record.latitude, record.longitude, record.altitude_gps)
+        with self._lock:
+            track = self._tracks.get(flight_id)
+            if track is None:
+                if flight_id in self._pending: self._pending[flight_id].append(fix)
+                return
+        track.add(*fix)
+
+    def get(self, flight_id):
+        with self._lock:
+            track = self._tracks.get(flight_id)
+            if track is not None:
+                self._tracks.move_to_end(flight_id)
+                return track
+            self._pending.setdefault(flight_id, [])
+        try:
+            track = FlightTrack(flight_id, *self.loader(flight_id))
+        except BaseException:
+            with self._lock: self._pending.pop(flight_id, None)
+            raise
+        with self._lock:
+            existing = self._tracks.get(flight_id) # Chargé en parallèle par une autre requête
+            if existing is not None: return existing
+            last = track.last_timestamp
+            for fix in self._pending.pop(flight_id, []):
+                if last is None or fix[0] > last: track.add(*fix)
+            self._tracks[flight_id] = track
+            while len(self._tracks) > self.max_flights: self._tracks.popitem(last=False)
+        return track
+
+    def clear(self, flight_id=None):
+        with self._lock:
+            if flight_id is None: self._tracks.clear()
+            else: self._tracks.pop(flight_id, None)
@@ -0,0 +1,98 @@
+# wire.py - Protocole compact (optionnel) pour update_data: deltas binaires à layout fixe
+#
+# Trame = en-tête '<BHII' puis valeurs:
+#   flags  (uint8)  bit0 = trame clé (état complet), bit1 = champ error présent
+#   seq    (uint16) numéro de trame publiée modulo 65536 (informatif: les trames
+#                   intermédiaires d'un client lent sont volontairement sautées)
+#   changed(uint32) bit i = champ RECORD_FIELDS[i] transmis dans cette trame
+#   nulls  (uint32) bit i = champ transmis mais devenu null
+# puis, pour chaque champ transmis non null (ordre RECORD_FIELDS):
+#   colonnes: valeur au format WIRE_CODES (d = float64, f = float32, i = int32,
+#             s = uint16 longueur + texte UTF-8 pour les colonnes TEXT)
+#   error   : uint16 longueur + texte UTF-8
+# Une trame clé transmet tous les champs; les autres seulement ceux qui ont
+# changé depuis la dernière trame REÇUE par ce client. Une valeur hors du type
+# du fil (paquet corrompu: int32 ou float32 dépassé) est transmise comme null.
+
+import struct
+
+from telemetry import TELEMETRY_SCHEMA, RECORD_FIELDS, N_COLUMNS
+
+HEADER = struct.Struct('<BHII')
+FLAG_KEYFRAME = 0x01
+FLAG_ERROR = 0x02
+_ERROR_INDEX = RECORD_FIELDS.index('error')
+# Précision float64 pour le temps et la position, float32 suffit pour les capteurs
+_FLOAT64_FIELDS = ('timestamp', 'latitude', 'longitude')
+
+
+def _wire_code(name, sql):
+    if name in _FLOAT64_FIELDS: return 'd'
+    if sql.startswith('INTEGER'): return 'i'
+    if sql.startswith('TEXT'): return 's'
+    return 'f'
+
+
+WIRE_CODES = tuple(_wire_code(name, sql) for name, sql in TELEMETRY_SCHEMA)
+_VALUE_STRUCTS = tuple(None if code == 's' else struct.Struct('<' + code) for code in WIRE_CODES)
+_LEN = struct.Struct('<H')
+
+
+def _pack_text(value):
+    raw = str(value).encode('utf-8')[:65535]
+    return _LEN.pack(len(raw)) + raw
+
+
+def _unpack_text(data, offset):
+    """Retourne (texte, offset suivant)."""
+    (length,) = _LEN.unpack_from(data, offset)
+    return data[offset + 2: offset + 2 + length].decode('utf-8'), offset + 2 + length
+
+
+def encode_frame(values, previous=None, seq=0):
+    """Encode `values` (ordre RECORD_FIELDS). Trame clé si `previous` est None."""
+    keyframe = previous is None
+    changed = nulls = 0
+    parts = []
+    for i in range(N_COLUMNS):
+        v = values[i]
+        if not keyframe and v == previous[i]: continue
+        changed |= 1 << i
+        if v is None: nulls |= 1 << i
+        elif _VALUE_STRUCTS[i] is None: parts.append(_pack_text(v))
+        else:
+            try: parts.append(_VALUE_STRUCTS[i].pack(v))
+            except (struct.error, OverflowError, TypeError): nulls |= 1 << i # Ne tient pas dans le type
+    flags = FLAG_KEYFRAME if keyframe else 0
+    error = values[_ERROR_INDEX]
+    if keyframe or error != previous[_ERROR_INDEX]:
+        changed |= 1 << _ERROR_INDEX
+        if error is None: nulls |= 1 << _ERROR_INDEX
+        else:
+            parts.append(_pack_text(error))
+            flags |= FLAG_ERROR
+    return HEADER.pack(flags, seq & 0xFFFF, changed, nulls) + b''.join(parts)
+
+
+def decode_frame(data, state=None):
+    """Applique une trame à `state` (liste RECORD_FIELDS) et le retourne. Référence / tests."""
+    flags, seq, changed, nulls = HEADER.unpack_from(data, 0)
+    if state is None or flags & FLAG_KEYFRAME: state = [None] * len(RECORD_FIELDS)
+    offset = HEADER.size
+    for i in range(N_COLUMNS):
+        if not changed >> i & 1: continue
+        if nulls >> i & 1: state[i] = None; continue
+        if _VALUE_STRUCTS[i] is None:
+            state[i], offset = _unpack_text(data, offset); continue
+        state[i] = _VALUE_STRUCTS[i].unpack_from(data, offset)[0]
+        offset += _VALUE_STRUCTS[i].size
+    if changed >> _ERROR_INDEX & 1:
+        if nulls >> _ERROR_INDEX & 1: state[_ERROR_INDEX] = None
+        else: state[_ERROR_INDEX] = _unpack_text(data, offset)[0]
+    return state
+
+
+def layout():
+    """Description du layout envoyée au client à l'activation (champs + codes)."""
+    return {'fields': list(RECORD_FIELDS), 'codes': list(WIRE_CODES) + ['s'],
+            'header': 'flags:u8,seq:u16,changed:u32,nulls:u32', 'little_endian': True}